@@ -0,0 +1,31 @@
+"""
+Бенчмарки запускаются как модули из корня проекта, например: python -m benchmarks.search
+Каждый бенчмарк работает на отдельной тестовой базе, рабочая db.sqlite3 не затрагивается.
+"""
+import os
+import statistics
+import time
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'todo_drf.settings')
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    settings.DEBUG = False
+    connection.creation.create_test_db(verbosity=0, serialize=False)
+
+
+def measure(func, repeat=5):
+    """
+    Возвращает минимальное и медианное время выполнения func в секундах
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {'min': min(timings), 'median': statistics.median(timings)}
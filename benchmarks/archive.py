@@ -0,0 +1,66 @@
+"""
+Время ответа списков и поиска задач до и после переноса выполненных задач в архив (todo.archive)
+на засеянной базе, и время самого переноса.
+
+    python -m benchmarks.archive --users 1000 --tasks-per-user 200 --done 0.7
+"""
+import argparse
+import sys
+import time
+from datetime import timedelta
+
+from . import setup_django, measure
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--tasks-per-user', type=int, default=200)
+    parser.add_argument('--done', type=float, default=0.7, help='доля выполненных задач')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from todo.models import ArchivedTask, Task
+
+    call_command('seed', users=args.users, tasks_per_user=args.tasks_per_user, done=args.done, seed=args.seed,
+                 prefix='bench', stdout=sys.stderr)
+    user = User.objects.get(username='bench0')
+    client = APIClient()
+    client.force_authenticate(user)
+    start = timezone.now()
+    period = f'{start:%d-%m-%Y}/{start + timedelta(days=90):%d-%m-%Y}'
+    cases = [('list', '/task/'), ('list page 5', '/task/?page=5'), ('search', '/task/?search=Задача_1'),
+             ('period', f'/task/{period}/'), ('due', '/task/due/?hours=720')]
+
+    def run_cases():
+        results = {}
+        for name, path in cases:
+            assert client.get(path).status_code == 200
+            results[name] = measure(lambda: client.get(path), args.repeat)['median']
+        return results
+
+    hot_before = Task.objects.count()
+    before = run_cases()
+    started = time.perf_counter()
+    # seed отмечает задачи выполненными в начале текущих суток, все они старше --age-days 0
+    call_command('archive_tasks', age_days=0, chunk_size=args.chunk_size, stdout=sys.stderr)
+    elapsed = time.perf_counter() - started
+    moved = ArchivedTask.objects.count()
+    after = run_cases()
+
+    print(f'todo_task: {hot_before} -> {Task.objects.count()} задач, в архиве {ArchivedTask.objects.count()}')
+    print(f'перенос {moved} задач и сжатие индекса поиска: {elapsed:.2f} с, {moved / elapsed:.0f} задач/с\n')
+    print(f'{"case":<16}{"before, ms":>12}{"after, ms":>12}{"ratio":>8}')
+    for name, _ in cases:
+        print(f'{name:<16}{before[name] * 1000:>12.2f}{after[name] * 1000:>12.2f}{after[name] / before[name]:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Нагрузочное сравнение одного процесса WSGI, ASGI с синхронными представлениями и ASGI с асинхронными
+представлениями (todo.async_views). Клиенты одновременно запрашивают список и детали задач,
+к каждому запросу к БД добавляется --db-latency мс, как у сетевой СУБД.
+
+    python -m benchmarks.concurrency --concurrency 1 8 32 --db-latency 5
+"""
+import argparse
+import http.client
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+MODES = {
+    'wsgi': ([sys.executable, '-m', 'benchmarks.servers', '{port}'], '0'),
+    'asgi-sync': ([sys.executable, '-m', 'uvicorn', 'benchmarks.servers:asgi', '--port', '{port}',
+                   '--workers', '1', '--no-access-log', '--log-level', 'warning'], '0'),
+    'asgi-async': ([sys.executable, '-m', 'uvicorn', 'benchmarks.servers:asgi', '--port', '{port}',
+                    '--workers', '1', '--no-access-log', '--log-level', 'warning'], '1'),
+}
+
+
+def prepare_db(path, tasks, rnd):
+    """
+    Создает файл БД с пользователем и задачами, возвращает cookie сессии и id задач
+    """
+    os.environ['BENCH_DB'] = path
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    django.setup()
+    from datetime import timedelta
+    from django.conf import settings
+    from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+    from django.contrib.auth.models import User
+    from django.contrib.sessions.backends.db import SessionStore
+    from django.core.management import call_command
+    from django.utils import timezone
+    from todo.categories import resolve_categories
+    from todo.models import Task
+
+    call_command('migrate', verbosity=0)
+    user = User.objects.create_user(username='bench', password='bench')
+    categories = list(resolve_categories(user, [f'категория {i}' for i in range(5)]).values())
+    now = timezone.now()
+    Task.objects.bulk_create([
+        Task(owner=user, title=f'Задача {i}', content='описание', deadline=now + timedelta(hours=rnd.randint(1, 8760)),
+             category=rnd.choice(categories), priority=rnd.choice(['high', 'normal', 'low']))
+        for i in range(tasks)])
+    session = SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    return f'{settings.SESSION_COOKIE_NAME}={session.session_key}', list(Task.objects.values_list('id', flat=True))
+
+
+def wait_ready(port, cookie, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if request(port, '/task/', cookie) == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'сервер на порту {port} не запустился')
+
+
+def request(port, path, cookie):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        connection.request('GET', path, headers={'Cookie': cookie, 'Accept': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def run_load(port, cookie, paths, concurrency, duration):
+    """
+    concurrency клиентов в цикле отправляют запросы duration секунд, возвращает времена ответов и число ошибок
+    """
+    timings, errors = [], []
+    stop = time.monotonic() + duration
+
+    def client(rnd):
+        own_timings, own_errors = [], 0
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            try:
+                ok = request(port, rnd.choice(paths), cookie) == 200
+            except OSError:
+                ok = False
+            own_timings.append(time.perf_counter() - start)
+            own_errors += not ok
+        timings.extend(own_timings)
+        errors.append(own_errors)
+
+    threads = [threading.Thread(target=client, args=(random.Random(i),)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timings, sum(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 8, 32])
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--db-latency', type=float, default=5, help='мс на каждый запрос к БД')
+    parser.add_argument('--threads', type=int, default=8, help='TODO_ASYNC_THREADS')
+    parser.add_argument('--tasks', type=int, default=200)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cookie, ids = prepare_db(os.path.join(tmp, 'bench.sqlite3'), args.tasks, random.Random(args.seed))
+        paths = ['/task/'] + [f'/task/{pk}/' for pk in ids[:50]]
+        print(f'{"mode":<12}{"clients":>8}{"req/s":>10}{"p50, ms":>10}{"p95, ms":>10}{"errors":>8}')
+        for mode in args.modes:
+            command, async_views = MODES[mode]
+            env = dict(os.environ, TODO_ASYNC_VIEWS=async_views, BENCH_ASYNC_THREADS=str(args.threads),
+                       BENCH_DB_LATENCY_MS=str(args.db_latency))
+            server = subprocess.Popen([part.format(port=args.port) for part in command], env=env)
+            try:
+                wait_ready(args.port, cookie)
+                for concurrency in args.concurrency:
+                    timings, errors = run_load(args.port, cookie, paths, concurrency, args.duration)
+                    timings.sort()
+                    print(f'{mode:<12}{concurrency:>8}{len(timings) / args.duration:>10.1f}'
+                          f'{statistics.median(timings) * 1000:>10.1f}'
+                          f'{timings[int(len(timings) * 0.95)] * 1000:>10.1f}{errors:>8}')
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == '__main__':
+    main()
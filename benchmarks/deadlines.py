@@ -0,0 +1,64 @@
+"""
+Пропускная способность сканера дедлайнов (todo.deadlines) на засеянной базе по сравнению с обходом
+списков задач всех пользователей, и время повторного прохода, которому нечего сканировать.
+
+    python -m benchmarks.deadlines --users 1000 --tasks-per-user 100 --lead-hours 24
+"""
+import argparse
+import sys
+import time
+from datetime import timedelta
+
+from . import setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--tasks-per-user', type=int, default=100)
+    parser.add_argument('--deadline-days', type=int, default=30)
+    parser.add_argument('--lead-hours', type=int, default=24, help='горизонт напоминаний')
+    parser.add_argument('--window-hours', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.utils import timezone
+    from todo.deadlines import DeadlineScanner, MemorySink
+    from todo.models import Task
+
+    call_command('seed', users=args.users, tasks_per_user=args.tasks_per_user, deadline_days=args.deadline_days,
+                 overdue=0, seed=args.seed, prefix='bench', stdout=sys.stderr)
+    # задачи только что засеяны: при проходах сразу после seed они попали бы в запас проверки по modified
+    now = timezone.now() + timedelta(minutes=2)
+    lead = timedelta(hours=args.lead_hours)
+
+    # так напоминания искались бы без сканера: по запросу на список каждого пользователя
+    start = time.perf_counter()
+    found = 0
+    for user_id in User.objects.filter(username__startswith='bench').values_list('id', flat=True):
+        found += len(Task.objects.filter(owner_id=user_id, status=False, deadline__gte=now, deadline__lte=now + lead)
+                     .values_list('id', 'owner_id', 'title', 'deadline', 'priority'))
+    per_user = time.perf_counter() - start
+
+    sink = MemorySink()
+    scanner = DeadlineScanner(sink, lead=lead.total_seconds(), window=args.window_hours * 3600,
+                              batch_size=args.batch_size)
+    start = time.perf_counter()
+    sent = scanner.scan(now=now)
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    again = scanner.scan(now=now + timedelta(minutes=1))
+    second = time.perf_counter() - start
+
+    print(f'{"pass":<28}{"tasks":>8}{"time, ms":>12}{"tasks/s":>10}')
+    print(f'{"per-user lists":<28}{found:>8}{per_user * 1000:>12.1f}{found / per_user:>10.0f}')
+    print(f'{"scanner, first pass":<28}{sent:>8}{first * 1000:>12.1f}{sent / first:>10.0f}')
+    print(f'{"scanner, next pass":<28}{again:>8}{second * 1000:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
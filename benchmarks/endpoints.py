@@ -0,0 +1,281 @@
+"""
+Время ответа, строк в секунду и число SQL запросов для каждого маршрута todo/urls.py на засеянной базе.
+Результаты сохраняются в JSON (--output) и сравниваются с результатами другого коммита (--compare).
+
+    python -m benchmarks.endpoints --users 10000 --tasks-per-user 100 --output HEAD.json
+    python -m benchmarks.endpoints --users 100 --tasks-per-user 100 --compare HEAD.json
+"""
+import argparse
+import io
+import itertools
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import timedelta
+
+from . import setup_django
+
+PRIORITIES = ['high', 'normal', 'low']
+
+
+def seed(args):
+    """
+    Данные строятся командой seed: категории выбираются пользователями с распределением Ципфа,
+    несколько общих категорий есть почти у всех
+    """
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+
+    call_command('seed', users=args.users, tasks_per_user=args.tasks_per_user, shared_categories=args.categories,
+                 categories_per_user=args.categories_per_user, sharing=args.sharing, seed=args.seed,
+                 prefix='bench', stdout=sys.stderr)
+    return User.objects.get(username='bench0')
+
+
+class Case:
+    """
+    Один запрос к маршруту. setup выполняется перед каждым повтором вне замера, path и data
+    получают контекст бенчмарка, rows считает строки в ответе.
+    """
+    def __init__(self, route, name, method, path, data=None, setup=None, format='json', rows=None):
+        self.route = route
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.setup = setup
+        self.format = format
+        self.rows = rows or count_rows
+
+
+def count_rows(response):
+    if getattr(response, 'streaming', False):
+        return b''.join(response.streaming_content).count(b'\n')
+    if not response.content:
+        return 0
+    content = json.loads(response.content)
+    if isinstance(content, dict):
+        if isinstance(content.get('results'), list):
+            return len(content['results'])
+        for key in ('created', 'updated'):
+            if isinstance(content.get(key), int):
+                return content[key]
+    return len(content) if isinstance(content, list) else 1
+
+
+def fresh_task(ctx):
+    from todo.factories import TaskFactory
+    ctx['fresh_task'] = TaskFactory(owner=ctx['user'], category=ctx['category'],
+                                    deadline=ctx['start'] + timedelta(days=1)).id
+
+
+def fresh_category(ctx):
+    from todo.factories import CategoryFactory, TaskFactory
+    category = CategoryFactory(name=f'временная {next(ctx["counter"])}')
+    category.user.add(ctx['user'])
+    TaskFactory.create_batch(10, owner=ctx['user'], category=category, deadline=ctx['start'] + timedelta(days=1))
+    ctx['fresh_category'] = category.id
+
+
+def clear_response_cache(ctx):
+    from django.core.cache import cache
+    cache.clear()
+
+
+def task_data(ctx):
+    return {'title': f'Задача {next(ctx["counter"])}', 'content': 'описание', 'category': 'bench общая 0',
+            'deadline': (ctx['start'] + timedelta(days=3)).isoformat(), 'status': False, 'priority': 'high'}
+
+
+def import_file(ctx):
+    lines = [json.dumps(task_data(ctx), ensure_ascii=False) for _ in range(ctx['import_rows'])]
+    upload = io.BytesIO('\n'.join(lines).encode())
+    upload.name = 'tasks.ndjson'
+    return {'file': upload}
+
+
+def period(ctx):
+    return f'{ctx["start"]:%d-%m-%Y}/{(ctx["start"] + timedelta(days=30)):%d-%m-%Y}'
+
+
+CASES = [
+    Case('task/', 'list', 'get', lambda ctx: '/task/'),
+    Case('task/', 'list page 5', 'get', lambda ctx: '/task/?page=5'),
+    Case('task/', 'search', 'get', lambda ctx: '/task/?search=Задача_1'),
+    Case('task/', 'create', 'post', lambda ctx: '/task/', task_data),
+    Case('task/bulk/', 'bulk create 100', 'post', lambda ctx: '/task/bulk/',
+         lambda ctx: [task_data(ctx) for _ in range(100)]),
+    Case('task/bulk/', 'bulk update', 'patch', lambda ctx: '/task/bulk/',
+         lambda ctx: {'filter': {'category': 'bench общая 0'}, 'priority': 'low'}),
+    Case('task/<date:sdate>/<date:edate>/', 'period', 'get', lambda ctx: f'/task/{period(ctx)}/',
+         setup=clear_response_cache),
+    Case('task/<date:sdate>/<date:edate>/', 'period cached', 'get', lambda ctx: f'/task/{period(ctx)}/'),
+    Case('task/cache/stats/', 'stats', 'get', lambda ctx: '/task/cache/stats/'),
+    Case('task/metrics/', 'metrics', 'get', lambda ctx: '/task/metrics/'),
+    Case('task/stats/', 'task stats', 'get', lambda ctx: '/task/stats/'),
+    Case('task/due/', 'due', 'get', lambda ctx: '/task/due/?hours=168'),
+    Case('task/sync/', 'sync', 'get', lambda ctx: '/task/sync/?since=0'),
+    Case('task/archive/', 'archive', 'get', lambda ctx: '/task/archive/'),
+    Case('task/archive/', 'archive search', 'get', lambda ctx: '/task/archive/?search=Задача_1'),
+    Case('task/archive/<int:pk>/', 'archived task', 'get', lambda ctx: f'/task/archive/{ctx["archived_id"]}/'),
+    Case('task/export/<str:export_format>/', 'export ndjson', 'get', lambda ctx: '/task/export/ndjson/'),
+    Case('task/export/<str:export_format>/<date:sdate>/<date:edate>/', 'export csv period', 'get',
+         lambda ctx: f'/task/export/csv/{period(ctx)}/'),
+    Case('task/import/', 'imports', 'get', lambda ctx: '/task/import/'),
+    Case('task/import/<str:import_format>/', 'import ndjson', 'post', lambda ctx: '/task/import/ndjson/',
+         import_file, format='multipart'),
+    Case('task/import/<int:pk>/', 'import', 'get', lambda ctx: f'/task/import/{ctx["import_id"]}/',
+         rows=lambda response: 1),
+    Case('task/job/', 'jobs', 'get', lambda ctx: '/task/job/'),
+    Case('task/job/<int:pk>/', 'job', 'get', lambda ctx: f'/task/job/{ctx["job_id"]}/'),
+    Case('task/<int:pk>/', 'retrieve', 'get', lambda ctx: f'/task/{ctx["task_id"]}/'),
+    Case('task/<int:pk>/', 'update', 'put', lambda ctx: f'/task/{ctx["task_id"]}/', task_data),
+    Case('task/<int:pk>/', 'delete', 'delete', lambda ctx: f'/task/{ctx["fresh_task"]}/', setup=fresh_task),
+    Case('task/<int:pk>/done/', 'done', 'patch', lambda ctx: f'/task/{ctx["task_id"]}/done/'),
+    Case('task/<int:pk>/prior/<str:priority>/', 'priority', 'patch',
+         lambda ctx: f'/task/{ctx["task_id"]}/prior/low/'),
+    Case('task/category/', 'categories', 'get', lambda ctx: '/task/category/'),
+    Case('task/category/', 'create category', 'post', lambda ctx: '/task/category/',
+         lambda ctx: {'name': f'новая {next(ctx["counter"])}'}),
+    Case('task/category/<int:pk>/', 'category', 'get', lambda ctx: f'/task/category/{ctx["category"].id}/'),
+    Case('task/category/<int:pk>/', 'rename category', 'put', lambda ctx: f'/task/category/{ctx["fresh_category"]}/',
+         lambda ctx: {'name': f'другая {next(ctx["counter"])}'}, setup=fresh_category),
+    Case('task/category/<int:pk>/', 'delete category', 'delete',
+         lambda ctx: f'/task/category/{ctx["fresh_category"]}/', setup=fresh_category),
+    Case('task/<int:pk>/copy/', 'copy', 'post', lambda ctx: f'/task/{ctx["task_id"]}/copy/'),
+]
+
+
+def check_coverage():
+    from todo.urls import urlpatterns
+    missing = {str(pattern.pattern) for pattern in urlpatterns} - {case.route for case in CASES}
+    if missing:
+        raise SystemExit(f'нет замеров для маршрутов: {", ".join(sorted(missing))}')
+
+
+def run_case(client, case, ctx, repeat):
+    """
+    Первый запрос считает SQL запросы и прогревает кеши, затем repeat замеров
+    """
+    from django.db import connection
+    queries = []
+
+    def count(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def call(counted=False):
+        if case.setup:
+            case.setup(ctx)
+        data = case.data(ctx) if case.data else None
+        start = time.perf_counter()
+        # CaptureQueriesContext не подходит: сигнал request_started очищает журнал запросов соединения
+        if counted:
+            with connection.execute_wrapper(count):
+                response = getattr(client, case.method)(case.path(ctx), data, format=case.format)
+                rows = case.rows(response)
+        else:
+            response = getattr(client, case.method)(case.path(ctx), data, format=case.format)
+            rows = case.rows(response)
+        return time.perf_counter() - start, response, rows
+
+    _, response, rows = call(counted=True)
+    timings = sorted(call()[0] for _ in range(repeat))
+    median = timings[len(timings) // 2]
+    return {
+        'route': case.route, 'case': case.name, 'method': case.method.upper(), 'status': response.status_code,
+        'queries': len(queries), 'rows': rows,
+        'latency_ms': {'min': timings[0] * 1000, 'median': median * 1000,
+                       'p95': timings[min(int(len(timings) * 0.95), len(timings) - 1)] * 1000},
+        'rows_per_s': rows / median if median else None,
+    }
+
+
+def metadata(args):
+    import django
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'commit': commit or None, 'python': platform.python_version(), 'django': django.get_version(),
+            'users': args.users, 'tasks_per_user': args.tasks_per_user, 'categories': args.categories,
+            'sharing': args.sharing,
+            'repeat': args.repeat, 'seed': args.seed, 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+
+
+def compare(results, path, threshold):
+    """
+    Медианы относительно сохраненных результатов, рост больше threshold отмечается как регрессия
+    """
+    with open(path) as baseline_file:
+        baseline = {(row['route'], row['case']): row for row in json.load(baseline_file)['results']}
+    regressions = 0
+    print(f'\n{"case":<22}{"median, ms":>12}{"before":>10}{"ratio":>8}{"queries":>10}')
+    for row in results:
+        before = baseline.get((row['route'], row['case']))
+        if before is None:
+            continue
+        ratio = row['latency_ms']['median'] / before['latency_ms']['median']
+        regressed = ratio > 1 + threshold or row['queries'] > before['queries']
+        regressions += regressed
+        print(f'{row["case"]:<22}{row["latency_ms"]["median"]:>12.2f}{before["latency_ms"]["median"]:>10.2f}'
+              f'{ratio:>8.2f}{before["queries"]:>5} -> {row["queries"]:<3}{"  регрессия" if regressed else ""}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--tasks-per-user', type=int, default=100)
+    parser.add_argument('--categories', type=int, default=1000)
+    parser.add_argument('--categories-per-user', type=int, default=5)
+    parser.add_argument('--sharing', type=float, default=0.8, help='доля общих категорий пользователя')
+    parser.add_argument('--import-rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='файл JSON с результатами')
+    parser.add_argument('--compare', help='файл JSON с результатами другого коммита')
+    parser.add_argument('--threshold', type=float, default=0.2, help='допустимый рост медианы при --compare')
+    args = parser.parse_args()
+
+    setup_django()
+    check_coverage()
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from todo.archive import archive_tasks
+    from todo.models import ArchivedTask, Job, Task, TaskImport
+
+    user = seed(args)
+    user.is_staff = True
+    user.save(update_fields=['is_staff'])
+    # в архив уходят выполненные задачи только этого пользователя, остальные замеры идут по полной таблице
+    archive_tasks(timezone.now(), owner_ids=[user.id])
+    task = Task.objects.filter(owner=user).first()
+    ctx = {'user': user, 'task_id': task.id, 'category': task.category, 'start': timezone.now(),
+           'counter': itertools.count(), 'import_rows': args.import_rows}
+    ctx['import_id'] = TaskImport.objects.create(owner=user, format='ndjson', status='done').id
+    ctx['job_id'] = Job.objects.create(owner=user, kind='category_delete', status='done').id
+    ctx['archived_id'] = ArchivedTask.objects.filter(owner=user).values_list('id', flat=True).first()
+    client = APIClient()
+    client.force_authenticate(user)
+
+    results = []
+    print(f'{"case":<22}{"method":<8}{"status":>7}{"queries":>8}{"rows":>7}{"median, ms":>12}{"p95, ms":>10}'
+          f'{"rows/s":>10}')
+    for case in CASES:
+        row = run_case(client, case, ctx, args.repeat)
+        results.append(row)
+        print(f'{row["case"]:<22}{row["method"]:<8}{row["status"]:>7}{row["queries"]:>8}{row["rows"]:>7}'
+              f'{row["latency_ms"]["median"]:>12.2f}{row["latency_ms"]["p95"]:>10.2f}{row["rows_per_s"] or 0:>10.0f}')
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'meta': metadata(args), 'results': results}, output, ensure_ascii=False, indent=2)
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Пропускная способность записей задач в файловую БД SQLite с групповым коммитом (todo.group_commit) и без него.
+--concurrency потоков одного процесса, как потоки сервера, создают задачи и отмечают их выполненными
+через представления, у каждого потока свое соединение с БД. Ошибки - ответы не 2xx и исключения
+("database is locked").
+
+    python -m benchmarks.group_commit --concurrency 1 4 16 64 --duration 5
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+
+
+def prepare_db(path):
+    os.environ['BENCH_DB'] = path
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    settings.DEBUG = False
+    call_command('migrate', verbosity=0)
+    return User.objects.create_user(username='bench', password='bench')
+
+
+def run_load(user, concurrency, duration):
+    """
+    concurrency клиентов duration секунд создают задачу и отмечают ее выполненной,
+    возвращает времена запросов и ошибки по виду
+    """
+    from datetime import timedelta
+    from django.db import connections
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+
+    timings, errors = [], Counter()
+    stop = time.monotonic() + duration
+    deadline = (timezone.now() + timedelta(days=30)).isoformat()
+
+    def client(number):
+        api = APIClient()
+        api.force_authenticate(user)
+        own_timings, own_errors = [], Counter()
+        try:
+            while time.monotonic() < stop:
+                start = time.perf_counter()
+                try:
+                    response = api.post('/task/', {'title': f'задача {number}', 'content': '', 'category': 'дом',
+                                                   'priority': 'normal', 'deadline': deadline}, format='json')
+                    if response.status_code == 201:
+                        response = api.patch(f'/task/{response.json()["id"]}/done/')
+                    if response.status_code >= 300:
+                        own_errors[f'HTTP {response.status_code}'] += 1
+                except Exception as error:
+                    own_errors[str(error)[:40]] += 1
+                own_timings.append(time.perf_counter() - start)
+        finally:
+            connections.close_all()
+        timings.extend(own_timings)
+        errors.update(own_errors)
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timings, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16, 64])
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--window-ms', type=float, default=2, help='TODO_GROUP_COMMIT["WINDOW_MS"]')
+    parser.add_argument('--dir', help='каталог файла БД: fsync в tmpfs ничего не стоит, по умолчанию временный')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        user = prepare_db(os.path.join(tmp, 'bench.sqlite3'))
+        from django.conf import settings
+        from todo import group_commit
+
+        print(f'{"mode":<8}{"clients":>8}{"ops/s":>10}{"p50, ms":>10}{"p95, ms":>10}{"writes/batch":>14}  errors')
+        for mode in ('off', 'on'):
+            settings.TODO_GROUP_COMMIT = {'ENABLED': mode == 'on'}
+            for concurrency in args.concurrency:
+                group_commit.write_queue = group_commit.WriteQueue(window=args.window_ms / 1000)
+                timings, errors = run_load(user, concurrency, args.duration)
+                stats = group_commit.write_queue.stats()
+                group_commit.write_queue.close()
+                timings.sort()
+                per_batch = f'{stats["writes"] / stats["batches"]:.1f}' if stats['batches'] else '-'
+                print(f'{mode:<8}{concurrency:>8}{len(timings) / args.duration:>10.1f}'
+                      f'{statistics.median(timings) * 1000:>10.1f}{timings[int(len(timings) * 0.95)] * 1000:>10.1f}'
+                      f'{per_batch:>14}  {dict(errors) or ""}')
+
+
+if __name__ == '__main__':
+    main()
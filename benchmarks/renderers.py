@@ -0,0 +1,55 @@
+"""
+JSON и MessagePack (todo.renderers) для больших страниц списка задач: размер ответа (и после gzip),
+время подготовки данных быстрым списком (TaskListFastSerializer), кодирования рендерером и разбора парсером.
+
+    python -m benchmarks.renderers --pages 100 1000 10000
+"""
+import argparse
+import gzip
+import io
+import random
+
+from . import setup_django, measure
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', nargs='+', type=int, default=[100, 1000, 10000], help='задач на странице')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+    from todo.models import Task
+    from todo.parsers import MessagePackParser
+    from todo.renderers import MessagePackRenderer
+    from todo.serializers import TaskListFastSerializer
+    from .serializers import seed
+
+    user = seed(max(args.pages), random.Random(args.seed))
+    rows = list(Task.objects.select_related('category').filter(owner=user).order_by('deadline', 'id')
+                .values(*TaskListFastSerializer.values_fields()))
+    formats = [
+        ('json', JSONRenderer(), 'application/json', JSONParser(), False),
+        ('msgpack', MessagePackRenderer(), 'application/msgpack', MessagePackParser(), True),
+        ('msgpack columnar', MessagePackRenderer(), 'application/msgpack; columnar=1', MessagePackParser(), True),
+    ]
+
+    print(f'{"format":<18}{"tasks":>7}{"bytes":>11}{"gzip":>10}{"serialize, ms":>15}{"encode, ms":>12}'
+          f'{"decode, ms":>12}')
+    for size in args.pages:
+        page = rows[:size]
+        for name, renderer, media_type, body_parser, native_datetime in formats:
+            data = {'next': None, 'previous': None, 'results': TaskListFastSerializer(page, native_datetime).data}
+            content = renderer.render(data, media_type, {})
+            serialize = measure(lambda: TaskListFastSerializer(page, native_datetime).data, args.repeat)['median']
+            encode = measure(lambda: renderer.render(data, media_type, {}), args.repeat)['median']
+            decode = measure(lambda: body_parser.parse(io.BytesIO(content), media_type, {}), args.repeat)['median']
+            print(f'{name:<18}{size:>7}{len(content):>11}{len(gzip.compress(content)):>10}'
+                  f'{serialize * 1000:>15.2f}{encode * 1000:>12.2f}{decode * 1000:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
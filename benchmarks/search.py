@@ -0,0 +1,81 @@
+"""
+Сравнение поиска задач через LIKE (SearchFilter) и через FTS5 индекс (FullTextSearchFilter).
+
+    python -m benchmarks.search --users 10 --tasks 20000
+"""
+import argparse
+import itertools
+import random
+
+from . import setup_django, measure
+
+LETTERS = 'абвгдежзийклмнопрстуфхцчшщыэюяabcdefghijklmnopqrstuvwxyz'
+CATEGORIES = ['работа', 'дом', 'учеба', 'покупки', 'спорт', 'здоровье', 'финансы', 'поездки', 'хобби', 'прочее']
+
+
+def vocabulary(rnd, size=5000):
+    return sorted({''.join(rnd.choices(LETTERS, k=rnd.randint(4, 10))) for _ in range(size)})
+
+
+def seed(users, tasks_per_user, rnd):
+    """
+    Заголовки и описания составляются из словаря псевдослов с распределением Ципфа,
+    поэтому в выборке есть и частые, и редкие термины
+    """
+    from datetime import timedelta
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from todo.models import Task
+    from todo.categories import resolve_categories
+
+    words = vocabulary(rnd)
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    User.objects.bulk_create([User(username=f'bench{i}') for i in range(users)])
+    now = timezone.now()
+    for user in User.objects.all():
+        categories = resolve_categories(user, rnd.sample(CATEGORIES, 5))
+        Task.objects.bulk_create([
+            Task(owner=user, title=' '.join(rnd.choices(words, cum_weights=weights, k=3)),
+                 content=' '.join(rnd.choices(words, cum_weights=weights, k=30)),
+                 deadline=now + timedelta(hours=rnd.randint(1, 24 * 365)),
+                 category=rnd.choice(list(categories.values())))
+            for _ in range(tasks_per_user)], batch_size=1000)
+    return User.objects.first(), words
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--tasks', type=int, default=20000, help='задач на пользователя')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework import filters
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from todo.search import FullTextSearchFilter
+    from todo.views import TaskList
+
+    user, words = seed(args.users, args.tasks, random.Random(args.seed))
+    view = TaskList()
+    factory = APIRequestFactory()
+
+    print(f'{"search":<24}{"backend":<12}{"rows":>8}{"min, ms":>10}{"median, ms":>12}')
+    searches = [words[0], words[50], words[1000], words[-1], f'{words[1]} {words[2]}', words[3][:3], 'работа']
+    for search in searches:
+        request = Request(factory.get('/task/', {'search': search}))
+        request.user = user
+        view.request = request
+        for name, backend in [('like', filters.SearchFilter()), ('fts5', FullTextSearchFilter())]:
+            def run():
+                queryset = backend.filter_queryset(request, view.get_queryset(), view)
+                return queryset.count(), list(queryset[:10])
+            rows = run()[0]
+            timing = measure(run, args.repeat)
+            print(f'{search:<24}{name:<12}{rows:>8}{timing["min"] * 1000:>10.1f}{timing["median"] * 1000:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
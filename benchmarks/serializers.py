@@ -0,0 +1,61 @@
+"""
+Сравнение TaskSerializer и TaskListFastSerializer для списков задач, строк в секунду.
+
+    python -m benchmarks.serializers --tasks 20000
+"""
+import argparse
+import random
+
+from . import setup_django, measure
+
+
+def seed(tasks, rnd):
+    from datetime import timedelta
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from todo.categories import resolve_categories
+    from todo.models import Task
+
+    user = User.objects.create(username='bench')
+    categories = list(resolve_categories(user, [f'категория {i}' for i in range(10)]).values())
+    now = timezone.now()
+    Task.objects.bulk_create([
+        Task(owner=user, title=f'Задача {i}', content='описание ' * rnd.randint(0, 20),
+             deadline=now + timedelta(minutes=rnd.randint(1, 525600)), category=rnd.choice(categories),
+             status=rnd.random() < 0.3, priority=rnd.choice(['high', 'normal', 'low']))
+        for i in range(tasks)], batch_size=1000)
+    return user
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_django()
+    from todo.models import Task
+    from todo.serializers import TaskSerializer, TaskListFastSerializer
+
+    user = seed(args.tasks, random.Random(args.seed))
+    queryset = Task.objects.select_related('category').filter(owner=user)\
+        .only('id', 'title', 'content', 'deadline', 'category__name', 'status', 'priority')
+    values = queryset.values(*TaskListFastSerializer.values_fields())
+    instances, rows = list(queryset), list(values)
+    assert TaskSerializer(instances, many=True).data == TaskListFastSerializer(rows).data
+
+    cases = [
+        ('serialize', 'TaskSerializer', lambda: TaskSerializer(instances, many=True).data),
+        ('serialize', 'fast', lambda: TaskListFastSerializer(rows).data),
+        ('query+serialize', 'TaskSerializer', lambda: TaskSerializer(list(queryset.all()), many=True).data),
+        ('query+serialize', 'fast', lambda: TaskListFastSerializer(list(values.all())).data),
+    ]
+    print(f'{"stage":<18}{"path":<16}{"rows/s":>12}{"median, ms":>12}')
+    for stage, name, func in cases:
+        timing = measure(func, args.repeat)
+        print(f'{stage:<18}{name:<16}{args.tasks / timing["median"]:>12.0f}{timing["median"] * 1000:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
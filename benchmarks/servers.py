@@ -0,0 +1,56 @@
+"""
+Точки входа серверов для benchmarks.concurrency. Задержка BENCH_DB_LATENCY_MS добавляется к каждому
+запросу к БД и имитирует сетевую СУБД, с SQLite запросы почти не ждут ввода-вывода.
+
+    BENCH_DB=... uvicorn benchmarks.servers:asgi
+    BENCH_DB=... python -m benchmarks.servers 8000
+"""
+import os
+import sys
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+
+def add_db_latency(seconds):
+    from django.db.backends import utils
+
+    def delayed(method):
+        def wrapper(self, *args, **kwargs):
+            time.sleep(seconds)
+            return method(self, *args, **kwargs)
+        return wrapper
+
+    utils.CursorWrapper.execute = delayed(utils.CursorWrapper.execute)
+    utils.CursorWrapper.executemany = delayed(utils.CursorWrapper.executemany)
+
+
+if float(os.environ.get('BENCH_DB_LATENCY_MS', 0)):
+    add_db_latency(float(os.environ['BENCH_DB_LATENCY_MS']) / 1000)
+
+from django.core.asgi import get_asgi_application  # noqa: E402
+from django.core.wsgi import get_wsgi_application  # noqa: E402
+
+asgi = get_asgi_application()
+wsgi = get_wsgi_application()
+
+
+def serve_wsgi(port):
+    """
+    Однопоточный WSGI сервер: один процесс обрабатывает один запрос за раз, как sync worker gunicorn
+    """
+    from wsgiref.simple_server import make_server, WSGIRequestHandler, WSGIServer
+
+    class Server(WSGIServer):
+        request_queue_size = 1024
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    with make_server('127.0.0.1', port, wsgi, server_class=Server, handler_class=QuietHandler) as server:
+        server.serve_forever()
+
+
+if __name__ == '__main__':
+    serve_wsgi(int(sys.argv[1]))
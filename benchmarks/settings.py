@@ -0,0 +1,13 @@
+"""
+Настройки серверов нагрузочных бенчмарков: отдельный файл БД из BENCH_DB, без DEBUG и debug toolbar
+"""
+import os
+
+from todo_drf.settings import *  # noqa: F401,F403
+
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+DATABASES['default']['NAME'] = os.environ['BENCH_DB']  # noqa: F405
+if 'debug_toolbar.middleware.DebugToolbarMiddleware' in MIDDLEWARE:  # noqa: F405
+    MIDDLEWARE.remove('debug_toolbar.middleware.DebugToolbarMiddleware')  # noqa: F405
+TODO_ASYNC_THREADS = int(os.environ.get('BENCH_ASYNC_THREADS', TODO_ASYNC_THREADS))  # noqa: F405
@@ -1,6 +1,32 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def install_search_index(sender, using='default', **kwargs):
+    from .search import install_index
+    install_index(using)
+
+
+def install_changelog_triggers(sender, using='default', **kwargs):
+    from .changelog import install_triggers
+    install_triggers(using)
+
+
+def install_shard_id_range(sender, using='default', **kwargs):
+    from .shards import install_id_range
+    install_id_range(using)
 
 
 class TodoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'todo'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(install_search_index, sender=self)
+        post_migrate.connect(install_changelog_triggers, sender=self)
+        post_migrate.connect(install_shard_id_range, sender=self)
+        from .replicas import pin_cache, replica_aliases
+        if replica_aliases():
+            # ошибка настройки общего кеша видна при запуске, а не на первой записи
+            pin_cache()
@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .counters import CounterDelta, task_state
+from .models import ArchivedTask, Task, TaskReminder
+from .shards import atomic, keep_id_range
+from .versions import touch
+
+# поля, которые переносятся между todo_task и архивом как есть
+FIELDS = ['id', 'title', 'content', 'created', 'modified', 'deadline', 'done_time', 'owner_id', 'status', 'priority',
+          'category_id']
+
+
+def _options():
+    return getattr(settings, 'TODO_ARCHIVE', {})
+
+
+def archivable(before):
+    """
+    Выполненные задачи, завершенные раньше before. У задач без done_time (выполнены до появления поля
+    или массовым UPDATE) возраст считается по modified
+    """
+    return Task.objects.filter(Q(done_time__lt=before) | Q(done_time__isnull=True, modified__lt=before), status=True)
+
+
+def archive_tasks(before=None, chunk_size=None, stop=None, owner_ids=None):
+    """
+    Переносит выполненные задачи старше before (TODO_ARCHIVE['AGE_DAYS']) в ArchivedTask пачками по chunk_size,
+    owner_ids - только задачи этих пользователей.
+    Пачка - одна транзакция вместе со счетчиками и версиями пользователей, задачи идут по возрастанию id
+    от последней перенесенной, поэтому таблица просматривается один раз без отдельного индекса по done_time.
+    Строки переносятся INSERT ... SELECT и DELETE по тому же диапазону id, не проходя через модели.
+    При установленном событии stop перенос заканчивается после текущей пачки. Возвращает число задач
+    """
+    options = _options()
+    before = before or timezone.now() - timedelta(days=options.get('AGE_DAYS', 90))
+    chunk_size = chunk_size or options.get('CHUNK_SIZE', 1000)
+    tasks = archivable(before)
+    if owner_ids is not None:
+        tasks = tasks.filter(owner_id__in=owner_ids)
+    connection = connections[router.db_for_write(Task)]
+    columns = ', '.join(connection.ops.quote_name(field) for field in FIELDS)
+    last_id, moved = 0, 0
+    while stop is None or not stop.is_set():
+        with transaction.atomic(using=connection.alias):
+            ids = list(tasks.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                break
+            chunk = tasks.filter(id__gt=last_id, id__lte=ids[-1])
+            select, params = chunk.order_by().values_list(*FIELDS).query.sql_with_params()
+            archived = connection.ops.adapt_datetimefield_value(timezone.now())
+            with connection.cursor() as cursor:
+                # первая запись берет блокировку записи: до конца транзакции диапазон не меняется
+                cursor.execute(f'INSERT INTO {ArchivedTask._meta.db_table} ({columns}, archived) '
+                               f'SELECT *, %s FROM ({select})', [archived, *params])
+                count = cursor.rowcount
+            owners = set(chunk.order_by().values_list('owner_id', flat=True).distinct())
+            CounterDelta().add_queryset(chunk, sign=-1).apply()
+            TaskReminder.objects.filter(task__in=chunk.values('id')).delete()
+            select, params = chunk.order_by().values('id').query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {Task._meta.db_table} WHERE id IN ({select})', params)
+            for owner_id in owners:
+                touch(owner_id)
+        last_id = ids[-1]
+        moved += count
+        if len(ids) < chunk_size:
+            break
+    return moved
+
+
+def restore(archived):
+    """
+    Возвращает задачу из архива в todo_task с прежним id. id может быть из диапазона другого шарда
+    (пользователь перенесен), AUTOINCREMENT шарда при этом не сдвигается. done_time - время возврата:
+    со старым archive_tasks сразу вернул бы задачу в архив
+    """
+    with atomic() as alias:
+        task = Task(**{field: getattr(archived, field) for field in FIELDS})
+        task.done_time = timezone.now()
+        with keep_id_range(alias):
+            Task.objects.bulk_create([task])
+        # auto_now_add перезаписывает created и при bulk_create, UPDATE его не трогает
+        Task.objects.filter(pk=task.pk).update(created=archived.created)
+        task.created = archived.created
+        archived.delete()
+        CounterDelta().add(task.owner_id, task_state(task)).apply()
+        touch(task.owner_id)
+    return task
@@ -0,0 +1,17 @@
+from django.urls import URLPattern
+
+from . import urls
+from .async_views import async_view
+from .views import TaskList, TaskDatePeriodList, TaskDue, TaskSync, TaskDetail, TaskDone, TaskPriority, UserCategory, \
+    UserCategoryDetail
+
+# представления, которые под ASGI выполняются в пуле потоков todo.async_views,
+# остальные маршруты (импорт, выгрузка, массовые операции) остаются синхронными
+ASYNC_VIEWS = (TaskList, TaskDatePeriodList, TaskDue, TaskSync, TaskDetail, TaskDone, TaskPriority, UserCategory,
+               UserCategoryDetail)
+
+urlpatterns = [
+    URLPattern(pattern.pattern, async_view(pattern.callback), pattern.default_args, pattern.name)
+    if getattr(pattern.callback, 'view_class', None) in ASYNC_VIEWS else pattern
+    for pattern in urls.urlpatterns
+]
@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .profiling import run_profiled
+
+
+def _executor_from_settings():
+    return ThreadPoolExecutor(max_workers=getattr(settings, 'TODO_ASYNC_THREADS', 8),
+                              thread_name_prefix='todo-async')
+
+
+executor = _executor_from_settings()
+
+
+def _run_view(view, request, *args, **kwargs):
+    # соединения потоков пула живут между запросами, CONN_MAX_AGE и сломанные соединения
+    # проверяются здесь, т.к. сигналы request_started/request_finished приходят в другой поток
+    close_old_connections()
+    try:
+        username = getattr(request, 'todo_profile', None)
+        if username is not None:
+            return run_profiled(username, _render_view, request, view, *args, **kwargs)
+        return _render_view(request, view, *args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def _render_view(request, view, *args, **kwargs):
+    response = view(request, *args, **kwargs)
+    if hasattr(response, 'render') and callable(response.render):
+        response = response.render()
+    return response
+
+
+def async_view(view):
+    """
+    Асинхронная обертка синхронного представления DRF для ASGI. Django 3.2 без асинхронного ORM
+    выполняет синхронные представления по одному в общем потоке (thread_sensitive), здесь же
+    представление вместе с рендерингом выполняется в ограниченном пуле потоков TODO_ASYNC_THREADS,
+    а медленные клиенты и ожидание свободного потока не занимают потоков.
+    """
+    run = sync_to_async(_run_view, thread_sensitive=False, executor=executor)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await run(view, request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,172 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router, transaction
+
+from .models import Category, normalize_category_name
+from .shards import is_enabled, mirror
+
+
+class CategoryCache:
+    """
+    Ограниченный LRU кеш (пользователь, нормализованное имя) -> (id, имя) категории, в который попадают только
+    категории, уже связанные с пользователем. Попадание в кеш означает, что запросы к категориям при записи задачи
+    не нужны.
+
+    Локальные записи живут TIMEOUT секунд: изменения, сделанные другим процессом, видны не позже этого срока.
+    Если задан BACKEND (алиас из CACHES), промахи локального кеша проверяются в нем, а инвалидация удаляет
+    записи в обоих уровнях. TIMEOUT = 0 отключает локальный уровень.
+    """
+    key_prefix = 'todo:category'
+
+    def __init__(self, size=10000, timeout=300, backend=None):
+        self.size = size
+        self.timeout = timeout
+        self.backend_alias = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return caches[self.backend_alias] if self.backend_alias else None
+
+    def make_key(self, user_id, name):
+        return f'{self.key_prefix}:{user_id}:{hashlib.md5(name.encode()).hexdigest()}'
+
+    def get(self, user_id, name):
+        if self.timeout:
+            with self._lock:
+                entry = self._entries.get((user_id, name))
+                if entry is not None:
+                    value, expires = entry
+                    if expires > time.monotonic():
+                        self._entries.move_to_end((user_id, name))
+                        return value
+                    del self._entries[(user_id, name)]
+        if self.backend is not None:
+            value = self.backend.get(self.make_key(user_id, name))
+            if value is not None:
+                self._set_local(user_id, name, value)
+            return value
+        return None
+
+    def set(self, user_id, name, value):
+        self._set_local(user_id, name, value)
+        if self.backend is not None:
+            self.backend.set(self.make_key(user_id, name), value)
+
+    def _set_local(self, user_id, name, value):
+        if not self.timeout:
+            return
+        with self._lock:
+            self._entries[(user_id, name)] = (value, time.monotonic() + self.timeout)
+            self._entries.move_to_end((user_id, name))
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, user_id, names):
+        with self._lock:
+            for name in names:
+                self._entries.pop((user_id, name), None)
+        if self.backend is not None:
+            self.backend.delete_many([self.make_key(user_id, name) for name in names])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _cache_from_settings():
+    options = getattr(settings, 'TODO_CATEGORY_CACHE', {})
+    return CategoryCache(size=options.get('SIZE', 10000), timeout=options.get('TIMEOUT', 300),
+                         backend=options.get('BACKEND'))
+
+
+category_cache = _cache_from_settings()
+
+
+def intern_categories(names):
+    """
+    Словарь {имя: категория} для всех имен из names, одна категория на нормализованное имя.
+    Недостающие категории создаются INSERT с игнорированием конфликтов по уникальному normalized
+    и перечитываются, поэтому параллельные запросы с одним именем получают одну и ту же категорию.
+    Категории читаются из БД, в которую пишутся (основной), новые копируются в шарды (todo.shards.mirror)
+    """
+    categories = Category.objects.db_manager(router.db_for_write(Category))
+    keys = {name: normalize_category_name(name) for name in names}
+    found = {category.normalized: category for category in categories.filter(normalized__in=set(keys.values()))}
+    missing = {key: name for name, key in keys.items() if key not in found}
+    if missing:
+        categories.bulk_create([Category(name=name, normalized=key) for key, name in missing.items()],
+                               ignore_conflicts=True)
+        created = list(categories.filter(normalized__in=missing))
+        mirror(created)
+        found.update((category.normalized, category) for category in created)
+    return {name: found[key] for name, key in keys.items()}
+
+
+def intern_category(name):
+    return intern_categories([name])[name]
+
+
+def prepare_categories(user, names):
+    """
+    При шардировании создает недостающие категории до транзакции записи задач: intern_categories копирует
+    новые категории во все шарды и в транзакции шарда запроса ждал бы блокировок других шардов, держа
+    блокировку своего. Имена из кеша уже связаны с пользователем и запросов не требуют
+    """
+    if not is_enabled():
+        return
+    names = [name for name in names if category_cache.get(user.id, normalize_category_name(name)) is None]
+    if names:
+        intern_categories(names)
+
+
+def resolve_categories(user, names):
+    """
+    Возвращает словарь {имя: категория} для всех имен из names.
+    Имена из кеша не требуют запросов. Для остальных сначала берутся категории, уже связанные с пользователем,
+    недостающие категории создаются intern_categories, недостающие связи с пользователем - одним INSERT в M2M таблицу.
+    """
+    keys = {name: normalize_category_name(name) for name in names}
+    categories = {}
+    for name, key in keys.items():
+        cached = category_cache.get(user.id, key)
+        if cached is not None:
+            categories[name] = Category(id=cached[0], name=cached[1], normalized=key)
+    keys = {name: key for name, key in keys.items() if name not in categories}
+    if not keys:
+        return categories
+
+    linked = {category.normalized: category
+              for category in Category.objects.filter(user=user, normalized__in=set(keys.values()))}
+    unlinked = [name for name, key in keys.items() if key not in linked]
+    if unlinked:
+        interned = intern_categories(unlinked)
+        through = Category.user.through
+        # разные имена могут нормализоваться в одну категорию, связь с ней создается один раз
+        category_ids = {category.id for category in interned.values()}
+        # связь могла появиться в параллельном запросе, уникальность (категория, пользователь) в M2M таблице
+        through.objects.bulk_create([through(category_id=category_id, user_id=user.id) for category_id in category_ids],
+                                    ignore_conflicts=True)
+        linked.update((category.normalized, category) for category in interned.values())
+
+    def fill_cache():
+        for key in set(keys.values()):
+            category_cache.set(user.id, key, (linked[key].id, linked[key].name))
+
+    # в кеш попадают только закоммиченные категории и связи, иначе после отката в нем останутся несуществующие id
+    transaction.on_commit(fill_cache)
+    categories.update((name, linked[key]) for name, key in keys.items())
+    return categories
+
+
+def resolve_category(user, name):
+    """
+    Категория пользователя по имени, при необходимости создается и связывается с пользователем
+    """
+    return resolve_categories(user, [name])[name]
@@ -0,0 +1,144 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+
+from .models import ChangeLog, TaskVersion
+from .shards import atomic
+
+LOG_TABLE = 'todo_changelog'
+
+# время в формате, в котором Django хранит DateTimeField в SQLite (UTC)
+_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+# Журнал пишется триггерами, как и индекс поиска (todo.search): изменения попадают в него на всех путях
+# записи, включая bulk_create, массовые UPDATE, фоновые операции и каскадное удаление.
+# Триггеры ставятся после каждой миграции, т.к. SQLite удаляет их при пересборке таблиц.
+INSTALL_SQL = [
+    f"""CREATE TRIGGER IF NOT EXISTS {LOG_TABLE}_task_ai AFTER INSERT ON todo_task BEGIN
+        INSERT INTO {LOG_TABLE}(owner_id, kind, object_id, deleted, created)
+        VALUES (new.owner_id, 'task', new.id, 0, {_NOW});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {LOG_TABLE}_task_au AFTER UPDATE ON todo_task BEGIN
+        INSERT INTO {LOG_TABLE}(owner_id, kind, object_id, deleted, created)
+        VALUES (new.owner_id, 'task', new.id, 0, {_NOW});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {LOG_TABLE}_task_ad AFTER DELETE ON todo_task BEGIN
+        INSERT INTO {LOG_TABLE}(owner_id, kind, object_id, deleted, created)
+        VALUES (old.owner_id, 'task', old.id, 1, {_NOW});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {LOG_TABLE}_category_ai AFTER INSERT ON todo_category_user BEGIN
+        INSERT INTO {LOG_TABLE}(owner_id, kind, object_id, deleted, created)
+        VALUES (new.user_id, 'category', new.category_id, 0, {_NOW});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {LOG_TABLE}_category_ad AFTER DELETE ON todo_category_user BEGIN
+        INSERT INTO {LOG_TABLE}(owner_id, kind, object_id, deleted, created)
+        VALUES (old.user_id, 'category', old.category_id, 1, {_NOW});
+    END""",
+]
+
+
+def _options():
+    return getattr(settings, 'TODO_SYNC', {})
+
+
+def is_supported(using='default'):
+    return connections[using].vendor == 'sqlite'
+
+
+def install_triggers(using='default'):
+    if not is_supported(using):
+        return
+    connection = connections[using]
+    tables = connection.introspection.table_names()
+    if not {LOG_TABLE, 'todo_task', 'todo_category_user'} <= set(tables):
+        return
+    with connection.cursor() as cursor:
+        for sql in INSTALL_SQL:
+            cursor.execute(sql)
+
+
+def current_token(using='default'):
+    """
+    Последний выданный номер журнала. Берется из sqlite_sequence, а не max(seq): сжатие может удалить
+    последние записи, и токен не должен уменьшаться
+    """
+    if not is_supported(using):
+        return ChangeLog.objects.using(using).aggregate(seq=Max('seq'))['seq'] or 0
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [LOG_TABLE])
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def changes_since(user, token, limit=None):
+    """
+    Изменения задач и категорий пользователя после token: id измененных и удаленных объектов и новый токен.
+    Объект, измененный несколько раз, попадает в ответ один раз в последнем состоянии. reset - токена нет
+    или он старше горизонта сжатия журнала, клиенту нужно загрузить списки заново и продолжить с token.
+    При more следующая порция запрашивается с новым токеном сразу. Неверный токен - ValueError.
+    """
+    limit = limit or _options().get('PAGE_SIZE', 1000)
+    current = current_token(ChangeLog.objects.db)
+    result = {'token': str(current), 'reset': False, 'more': False,
+              'tasks': {'changed': [], 'deleted': []}, 'categories': {'changed': [], 'deleted': []}}
+    since = None if token is None else int(token)
+    if since is not None and since < 0:
+        raise ValueError(token)
+    horizon = TaskVersion.objects.filter(owner=user).values_list('sync_horizon', flat=True).first() or 0
+    if since is None or since < horizon or not is_supported(ChangeLog.objects.db):
+        result['reset'] = True
+        return result
+
+    # токен читается до записей: записи, закоммиченные между двумя запросами, попадут в следующую синхронизацию
+    entries = list(ChangeLog.objects.filter(owner=user, seq__gt=since, seq__lte=current).order_by('seq')
+                   .values_list('seq', 'kind', 'object_id', 'deleted')[:limit + 1])
+    if len(entries) > limit:
+        entries = entries[:limit]
+        result['more'] = True
+        result['token'] = str(entries[-1][0])
+    elif since > current:
+        result['token'] = str(since)
+    state = {}
+    for seq, kind, object_id, deleted in entries:
+        state[kind, object_id] = deleted
+    for (kind, object_id), deleted in sorted(state.items()):
+        result['tasks' if kind == 'task' else 'categories']['deleted' if deleted else 'changed'].append(object_id)
+    return result
+
+
+def compact(before=None, batch_size=10000):
+    """
+    Сжатие журнала: удаляются записи, для объекта которых есть более новая запись (безопасно для любого
+    токена), и записи об удалении старше before (TODO_SYNC['RETENTION_DAYS']). Для вторых горизонт
+    пользователя поднимается до номера удаленной записи: клиенты со старыми токенами получат reset.
+    Удаление идет диапазонами seq по batch_size записей, каждый в своей транзакции.
+    Возвращает (удалено повторов, удалено записей об удалении)
+    """
+    before = before or timezone.now() - timezone.timedelta(days=_options().get('RETENTION_DAYS', 30))
+    last = current_token(ChangeLog.objects.db)
+    duplicates = 0
+    newer = ChangeLog.objects.filter(owner_id=OuterRef('owner_id'), kind=OuterRef('kind'),
+                                     object_id=OuterRef('object_id'), seq__gt=OuterRef('seq'))
+    for start in range(0, last, batch_size):
+        with atomic():
+            duplicates += ChangeLog.objects.filter(seq__gt=start, seq__lte=start + batch_size)\
+                .filter(Exists(newer)).delete()[0]
+
+    expired = ChangeLog.objects.filter(deleted=True, created__lt=before)
+    with atomic():
+        horizons = dict(expired.order_by().values('owner_id').annotate(seq=Max('seq')).values_list('owner_id', 'seq'))
+        if not horizons:
+            return duplicates, 0
+        now = timezone.now()
+        existing = set(TaskVersion.objects.filter(owner_id__in=horizons).values_list('owner_id', flat=True))
+        for owner_id in existing:
+            TaskVersion.objects.filter(owner_id=owner_id, sync_horizon__lt=horizons[owner_id])\
+                .update(sync_horizon=horizons[owner_id])
+        # у пользователей, удаленных вместе с задачами, записи журнала просто удаляются
+        users = User.objects.filter(id__in=set(horizons) - existing).values_list('id', flat=True)
+        TaskVersion.objects.bulk_create([TaskVersion(owner_id=owner_id, modified=now, sync_horizon=horizons[owner_id])
+                                         for owner_id in users])
+        tombstones = expired.filter(seq__lte=max(horizons.values())).delete()[0]
+    return duplicates, tombstones
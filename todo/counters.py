@@ -0,0 +1,158 @@
+from collections import Counter, defaultdict
+from datetime import datetime, time
+
+from django.db import IntegrityError, connections, router
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Task, TaskCounter, Category
+from .shards import atomic
+
+
+def task_keys(status, priority, category_id, day):
+    keys = ['done' if status else 'open', f'priority:{priority}', f'category:{category_id}']
+    if not status:
+        keys.append(f'deadline:{day.isoformat()}')
+    return keys
+
+
+def task_state(task):
+    """
+    (status, priority, category_id, день дедлайна) - все, от чего зависят счетчики задачи
+    """
+    return task.status, task.priority, task.category_id, timezone.localtime(task.deadline).date()
+
+
+def grouped_states(queryset):
+    """
+    Задачи queryset, сгруппированные по владельцу и состоянию счетчиков, с числом задач в группе
+    """
+    return queryset.annotate(day=TruncDate('deadline')).order_by()\
+        .values('owner_id', 'status', 'priority', 'category_id', 'day').annotate(count=Count('id'))
+
+
+class CounterDelta:
+    """
+    Изменения счетчиков задач по пользователям. Копятся по всем задачам операции и записываются
+    одним запросом upsert в транзакции самой операции.
+    """
+    def __init__(self):
+        self.deltas = defaultdict(Counter)
+
+    def add(self, owner_id, state, count=1):
+        for key in task_keys(*state):
+            self.deltas[owner_id][key] += count
+        return self
+
+    def remove(self, owner_id, state, count=1):
+        for key in task_keys(*state):
+            self.deltas[owner_id][key] -= count
+        return self
+
+    def change(self, owner_id, before, after, count=1):
+        if before != after:
+            self.remove(owner_id, before, count).add(owner_id, after, count)
+        return self
+
+    def add_queryset(self, queryset, sign=1, changes=None):
+        """
+        Учитывает задачи queryset: sign=1 - добавлены, -1 - удалены; changes - поля, которые получат
+        задачи после массового UPDATE (status, priority, category_id)
+        """
+        for row in grouped_states(queryset):
+            state = (row['status'], row['priority'], row['category_id'], row['day'])
+            if changes is not None:
+                after = (changes.get('status', state[0]), changes.get('priority', state[1]),
+                         changes.get('category_id', state[2]), state[3])
+                self.change(row['owner_id'], state, after, row['count'])
+            elif sign > 0:
+                self.add(row['owner_id'], state, row['count'])
+            else:
+                self.remove(row['owner_id'], state, row['count'])
+        return self
+
+    def rows(self):
+        return [(owner_id, key, value) for owner_id, counter in self.deltas.items()
+                for key, value in counter.items() if value]
+
+    def apply(self):
+        rows = self.rows()
+        if not rows:
+            return
+        connection = connections[router.db_for_write(TaskCounter)]
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            for owner_id, key, value in rows:
+                self.increment(owner_id, key, value)
+            return
+        table, key_column = TaskCounter._meta.db_table, connection.ops.quote_name('key')
+        # 3 параметра на строку, пачка укладывается в лимит 999 параметров SQLite
+        for start in range(0, len(rows), 300):
+            batch = rows[start:start + 300]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {table} (owner_id, {key_column}, value) '
+                    f'VALUES {", ".join(["(%s, %s, %s)"] * len(batch))} '
+                    f'ON CONFLICT (owner_id, {key_column}) DO UPDATE SET value = {table}.value + excluded.value',
+                    [value for row in batch for value in row])
+
+    @staticmethod
+    def increment(owner_id, key, value):
+        if TaskCounter.objects.filter(owner_id=owner_id, key=key).update(value=F('value') + value):
+            return
+        try:
+            with atomic():
+                TaskCounter.objects.create(owner_id=owner_id, key=key, value=value)
+        except IntegrityError:
+            TaskCounter.objects.filter(owner_id=owner_id, key=key).update(value=F('value') + value)
+
+
+def user_stats(user):
+    """
+    Статистика задач пользователя по счетчикам. Просроченные - открытые задачи с дедлайном в прошедшие дни
+    по счетчикам deadline:<дата> и сегодняшние с прошедшим дедлайном запросом по индексу (owner, deadline).
+    Чтение не зависит от числа задач, но не O(1): строк счетчиков столько, сколько у пользователя категорий
+    и дней с открытыми просроченными задачами (счетчики будущих дней не читаются), плюс COUNT по сегодняшним
+    """
+    now = timezone.now()
+    today = timezone.localdate(now)
+    counters = dict(TaskCounter.objects.filter(owner=user).exclude(value=0)
+                    .exclude(key__startswith='deadline:', key__gte=f'deadline:{today.isoformat()}')
+                    .values_list('key', 'value'))
+    overdue = sum(value for key, value in counters.items() if key.startswith('deadline:'))
+    overdue += Task.objects.filter(owner=user, status=False, deadline__lt=now,
+                                   deadline__gte=timezone.make_aware(datetime.combine(today, time.min))).count()
+    category_counts = {None if key[9:] == 'None' else int(key[9:]): value
+                       for key, value in counters.items() if key.startswith('category:')}
+    names = dict(Category.objects.filter(id__in=[pk for pk in category_counts if pk]).values_list('id', 'name'))
+    return {
+        'total': counters.get('open', 0) + counters.get('done', 0),
+        'open': counters.get('open', 0),
+        'done': counters.get('done', 0),
+        'overdue': overdue,
+        'priority': {priority: counters.get(f'priority:{priority}', 0) for priority, _ in Task.PRIORITY_CHOICES},
+        'categories': [{'id': pk, 'name': names.get(pk), 'count': count}
+                       for pk, count in sorted(category_counts.items(), key=lambda item: -item[1])],
+    }
+
+
+def rebuild(user_ids):
+    """
+    Пересчитывает счетчики пользователей по Task, возвращает id пользователей, у которых они расходились
+    """
+    with atomic():
+        expected = defaultdict(Counter)
+        for row in grouped_states(Task.objects.filter(owner_id__in=user_ids)):
+            for key in task_keys(row['status'], row['priority'], row['category_id'], row['day']):
+                expected[row['owner_id']][key] += row['count']
+        actual = defaultdict(dict)
+        for owner_id, key, value in TaskCounter.objects.filter(owner_id__in=user_ids).exclude(value=0)\
+                .values_list('owner_id', 'key', 'value'):
+            actual[owner_id][key] = value
+        drifted = [user_id for user_id in user_ids if dict(+expected[user_id]) != actual[user_id]]
+        TaskCounter.objects.filter(owner_id__in=user_ids, value=0).delete()
+        TaskCounter.objects.filter(owner_id__in=drifted).delete()
+        TaskCounter.objects.bulk_create([TaskCounter(owner_id=user_id, key=key, value=value)
+                                         for user_id in drifted for key, value in expected[user_id].items()
+                                         if value])
+    return drifted
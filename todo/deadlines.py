@@ -0,0 +1,157 @@
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task, TaskReminder
+from .shards import atomic
+
+# id больше любого реального: позиция (конец окна, MAX_ID) пропускает все задачи с дедлайном на границе окна
+MAX_ID = 2 ** 63 - 1
+
+
+def _options():
+    return getattr(settings, 'TODO_DEADLINES', {})
+
+
+class LogSink:
+    """
+    Напоминания строками JSON в лог
+    """
+    def __init__(self, logger='todo.deadlines'):
+        self.logger = logging.getLogger(logger)
+
+    def send(self, reminders):
+        for reminder in reminders:
+            self.logger.info(json.dumps(reminder, ensure_ascii=False))
+
+
+class FileSink:
+    """
+    Напоминания строками JSON в конец файла path
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, reminders):
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.writelines(json.dumps(reminder, ensure_ascii=False) + '\n' for reminder in reminders)
+
+
+class MemorySink:
+    """
+    Напоминания в списке sent, для тестов и бенчмарков
+    """
+    def __init__(self):
+        self.sent = []
+
+    def send(self, reminders):
+        self.sent.extend(reminders)
+
+
+def get_sink(path=None, **kwargs):
+    """
+    Sink - любой класс с методом send(reminders), путь к нему задается TODO_DEADLINES['SINK'].
+    Исключение в send откатывает запись напоминаний пачки, и она отправляется при следующем проходе.
+    """
+    options = _options()
+    sink = import_string(path or options.get('SINK', 'todo.deadlines.LogSink'))
+    return sink(**(kwargs or options.get('SINK_OPTIONS', {})))
+
+
+def reminder(task, now):
+    return {'task': task['id'], 'owner': task['owner_id'], 'title': task['title'],
+            'deadline': task['deadline'].isoformat(), 'priority': task['priority'], 'overdue': task['deadline'] <= now}
+
+
+class DeadlineScanner:
+    """
+    Напоминания об открытых задачах, дедлайн которых наступит в ближайшие lead секунд.
+    Задачи читаются по индексу (status, deadline, id) окнами по window секунд дедлайнов и пачками
+    по batch_size от позиции (deadline, id), на которой остановился предыдущий проход, поэтому
+    уже просмотренные дедлайны не сканируются повторно. После перезапуска позиция восстанавливается
+    по последнему отправленному напоминанию. Задачи, созданные или перенесенные в уже просмотренный
+    диапазон, находятся по полю modified. Рассчитан на один рабочий процесс.
+    """
+    fields = ('id', 'owner_id', 'title', 'deadline', 'priority')
+
+    def __init__(self, sink, lead=None, window=None, batch_size=None):
+        options = _options()
+        self.sink = sink
+        self.lead = timedelta(seconds=options.get('LEAD', 3600) if lead is None else lead)
+        self.window = timedelta(seconds=options.get('WINDOW', 3600) if window is None else window)
+        self.batch_size = batch_size or options.get('BATCH_SIZE', 500)
+        self.position = None
+        self.scanned = None
+
+    def restore(self, since):
+        last = TaskReminder.objects.order_by('-deadline', '-task_id').values_list('deadline', 'task_id').first()
+        return last or (since, 0)
+
+    def scan(self, now=None, since=None):
+        """
+        Один проход, возвращает число отправленных напоминаний. since - начальная позиция при первом
+        запуске, по умолчанию now: о задачах, просроченных до запуска сканера, не напоминается
+        """
+        now = now or timezone.now()
+        until = now + self.lead
+        if self.position is None:
+            self.position = self.restore(since or now)
+        sent = self.scan_modified(now)
+        while self.position[0] < until:
+            window_end = min(self.position[0] + self.window, until)
+            sent += self.scan_window(window_end, now)
+            self.position = (window_end, MAX_ID)
+        self.scanned = now
+        return sent
+
+    def scan_window(self, window_end, now):
+        sent = 0
+        while True:
+            deadline, pk = self.position
+            batch = list(Task.objects.filter(status=False, deadline__lte=window_end)
+                         .filter(Q(deadline__gt=deadline) | Q(deadline=deadline, id__gt=pk))
+                         .order_by('deadline', 'id').values(*self.fields)[:self.batch_size])
+            if not batch:
+                return sent
+            sent += self.notify(batch, now)
+            self.position = (batch[-1]['deadline'], batch[-1]['id'])
+            if len(batch) < self.batch_size:
+                return sent
+
+    def scan_modified(self, now):
+        """
+        Задачи, измененные с прошлого прохода, с дедлайном между now и позицией сканера. Диапазон не шире lead,
+        при первом проходе после запуска проверяется целиком
+        """
+        queryset = Task.objects.filter(status=False, deadline__gte=now, deadline__lte=self.position[0])
+        if self.scanned is not None:
+            # modified ставится до коммита: запас покрывает транзакции, закоммиченные после прошлого прохода
+            queryset = queryset.filter(modified__gte=self.scanned - timedelta(minutes=1))
+        sent, after = 0, (now, 0)
+        while True:
+            batch = list(queryset.filter(Q(deadline__gt=after[0]) | Q(deadline=after[0], id__gt=after[1]))
+                         .order_by('deadline', 'id').values(*self.fields)[:self.batch_size])
+            if not batch:
+                return sent
+            sent += self.notify(batch, now)
+            after = (batch[-1]['deadline'], batch[-1]['id'])
+
+    def notify(self, tasks, now):
+        """
+        Записывает напоминания о задачах, о дедлайне которых еще не напоминали, и передает их в sink
+        в одной транзакции
+        """
+        with atomic():
+            known = set(TaskReminder.objects.filter(task_id__in=[task['id'] for task in tasks])
+                        .values_list('task_id', 'deadline'))
+            fresh = [task for task in tasks if (task['id'], task['deadline']) not in known]
+            if fresh:
+                TaskReminder.objects.bulk_create([TaskReminder(task_id=task['id'], deadline=task['deadline'], sent=now)
+                                                  for task in fresh])
+                self.sink.send([reminder(task, now) for task in fresh])
+        return len(fresh)
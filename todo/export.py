@@ -0,0 +1,42 @@
+import csv
+import json
+
+from rest_framework import serializers
+
+EXPORT_FIELDS = ['id', 'title', 'content', 'deadline', 'category', 'status', 'priority']
+VALUES_FIELDS = ['id', 'title', 'content', 'deadline', 'category__name', 'status', 'priority']
+
+_deadline_field = serializers.DateTimeField()
+
+
+def export_rows(queryset, chunk_size):
+    """
+    Строки задач в формате TaskSerializer, читаются из БД пачками по chunk_size без создания моделей
+    """
+    for row in queryset.values_list(*VALUES_FIELDS).iterator(chunk_size=chunk_size):
+        row = list(row)
+        row[3] = _deadline_field.to_representation(row[3])
+        yield row
+
+
+def ndjson_stream(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def csv_stream(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+STREAMS = {
+    'ndjson': (ndjson_stream, 'application/x-ndjson'),
+    'csv': (csv_stream, 'text/csv'),
+}
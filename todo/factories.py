@@ -1,15 +1,20 @@
 import factory
 import datetime
 from factory import fuzzy
-from .models import Task, Category
+from .models import Task, Category, normalize_category_name
 from django.contrib.auth.models import User
 
+# границы дат задаются явно: иначе после смены года фабрика не строит задач, а с заданным seed даты не повторяются
+NOW = datetime.datetime.now(tz=datetime.timezone.utc)
+
 
 class CategoryFactory(factory.django.DjangoModelFactory):
     class Meta:
         model = Category
 
     name = fuzzy.FuzzyText(length=20)
+    # bulk_create готовых объектов (seed) не вызывает Category.save
+    normalized = factory.LazyAttribute(lambda category: normalize_category_name(category.name))
 
 
 class UserFactory(factory.django.DjangoModelFactory):
@@ -27,8 +32,7 @@ class TaskFactory(factory.django.DjangoModelFactory):
 
     title = factory.Sequence(lambda n: f'Задача_{n}')
     content = fuzzy.FuzzyText(length=100)
-    created = fuzzy.FuzzyDateTime(datetime.datetime.now(tz=datetime.timezone.utc))
-    deadline = fuzzy.FuzzyDateTime(datetime.datetime.now(tz=datetime.timezone.utc),
-                                   datetime.datetime(2022, 12, 31, 20, tzinfo=datetime.timezone.utc))
+    created = fuzzy.FuzzyDateTime(NOW - datetime.timedelta(days=30), NOW)
+    deadline = fuzzy.FuzzyDateTime(NOW, NOW + datetime.timedelta(days=365))
     category = factory.SubFactory(CategoryFactory)
     owner = factory.SubFactory(UserFactory)
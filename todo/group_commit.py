@@ -0,0 +1,183 @@
+import contextvars
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from rest_framework import exceptions
+
+from .models import Task
+
+
+def _options():
+    return getattr(settings, 'TODO_GROUP_COMMIT', {})
+
+
+class WriteTimeout(exceptions.APIException):
+    status_code = 503
+    default_detail = 'Запись не выполнена: очередь записи перегружена, повторите запрос позже'
+    default_code = 'write_timeout'
+
+
+class _Write:
+    __slots__ = ('alias', 'context', 'func', 'args', 'kwargs', 'future')
+
+    def __init__(self, alias, context, func, args, kwargs):
+        self.alias, self.context, self.func, self.args, self.kwargs = alias, context, func, args, kwargs
+        self.future = Future()
+
+    def run(self):
+        return self.context.run(self.func, *self.args, **self.kwargs)
+
+
+class WriteQueue:
+    """
+    Групповой коммит записей задач для SQLite. Записи запросов выполняет один поток: он собирает их window секунд
+    после первой (не больше max_batch) и выполняет в одной транзакции, каждую в своей точке сохранения.
+    Пока записи приходят по одной (предыдущая пачка из одной записи), окно не ждется: без конкуренции
+    групповой коммит не добавляет задержки.
+    Ошибка записи откатывает только ее, ее исключение получает только ее запрос, результаты отдаются после
+    коммита. Одна транзакция и один fsync вместо транзакции на запрос, и запросы процесса не борются
+    за блокировку записи SQLite ("database is locked").
+    Запись выполняется в контексте (contextvars) отправившего ее запроса: шард (todo.shards) и реплики
+    выбираются так же, как в самом запросе, записи разных БД коммитятся отдельными транзакциями
+    """
+    def __init__(self, window=0.002, max_batch=100, timeout=30):
+        self.window = window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.writes = 0
+        self._last_size = 0
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Ставит func(*args, **kwargs) в очередь, возвращает concurrent.futures.Future с ее результатом
+        """
+        context = contextvars.copy_context()
+        write = _Write(context.run(router.db_for_write, Task), context, func, args, kwargs)
+        self._start()
+        self._queue.put(write)
+        return write.future
+
+    def run(self, func, *args, **kwargs):
+        """
+        Выполняет func в очереди и возвращает ее результат или поднимает ее исключение. Из потока записи
+        (вложенная запись) func выполняется сразу.
+        Запись, которая не началась за timeout секунд, снимается с очереди (WriteTimeout, 503): повтор клиента
+        не создаст дубликат. Начатая запись дожидается коммита
+        """
+        if threading.current_thread() is self._thread:
+            return func(*args, **kwargs)
+        future = self.submit(func, *args, **kwargs)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise WriteTimeout()
+        return future.result()
+
+    def _start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name='todo-group-commit', daemon=True)
+                self._thread.start()
+
+    def close(self):
+        """
+        Останавливает поток записи после уже поставленных записей
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        if batch[0] is None:
+            return None
+        deadline = time.monotonic() + (self.window if self._last_size > 1 else 0)
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                write = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if write is None:
+                self._queue.put(None)
+                break
+            batch.append(write)
+        self._last_size = len(batch)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                connections.close_all()
+                return
+            groups = defaultdict(list)
+            for write in batch:
+                groups[write.alias].append(write)
+            for alias, writes in groups.items():
+                self.commit(alias, writes)
+
+    def commit(self, alias, writes):
+        results = []
+        try:
+            with transaction.atomic(using=alias):
+                for write in writes:
+                    # запись, снятая с очереди по таймауту, не выполняется, начатую снять уже нельзя
+                    if not write.future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with transaction.atomic(using=alias):
+                            results.append((write, write.run(), None))
+                    except Exception as error:
+                        results.append((write, None, error))
+        except Exception as error:
+            # коммит не удался: откатились все записи пачки. Соединение потока живет дольше CONN_MAX_AGE
+            # (переподключение на каждую пачку стоило бы дороже самой записи), сломанное закрывается здесь
+            connections[alias].close_if_unusable_or_obsolete()
+            # ошибку получают и записи, до которых пачка не дошла, кроме снятых с очереди
+            for write in writes:
+                if write.future.cancelled():
+                    continue
+                if write.future.running() or write.future.set_running_or_notify_cancel():
+                    write.future.set_exception(error)
+            return
+        self.batches += 1
+        self.writes += len(results)
+        for write, result, error in results:
+            if error is None:
+                write.future.set_result(result)
+            else:
+                write.future.set_exception(error)
+
+    def stats(self):
+        return {'batches': self.batches, 'writes': self.writes}
+
+
+def _queue_from_settings():
+    options = _options()
+    return WriteQueue(window=options.get('WINDOW_MS', 2) / 1000, max_batch=options.get('MAX_BATCH', 100),
+                      timeout=options.get('TIMEOUT', 30))
+
+
+write_queue = _queue_from_settings()
+
+
+def commit(func, *args, **kwargs):
+    """
+    Запись представления: при TODO_GROUP_COMMIT['ENABLED'] через очередь группового коммита, иначе сразу
+    """
+    if not _options().get('ENABLED'):
+        return func(*args, **kwargs)
+    return write_queue.run(func, *args, **kwargs)
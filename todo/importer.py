@@ -0,0 +1,108 @@
+import csv
+import io
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import TaskImport
+from .serializers import TaskSerializer, bulk_create_tasks
+
+
+def read_ndjson(stream):
+    """
+    (номер строки, данные) для каждой непустой строки бинарного потока, поток читается построчно
+    """
+    for line_no, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError:
+            yield line_no, None
+
+
+def read_csv(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    reader = csv.DictReader(text)
+    try:
+        for row in reader:
+            yield reader.line_num, row
+    finally:
+        text.detach()
+
+
+READERS = {
+    'ndjson': read_ndjson,
+    'csv': read_csv,
+}
+
+
+class TaskImporter:
+    """
+    Потоковый импорт задач: строки валидируются по правилам TaskSerializer по одной и пишутся пачками
+    через bulk_create_tasks. Каждая пачка коммитится вместе со счетчиками TaskImport, поэтому прогресс
+    длинного импорта виден из других запросов. Сохраняются первые TODO_IMPORT_MAX_ERRORS ошибок,
+    остальные отклоненные строки передаются в on_reject.
+    """
+    def __init__(self, user, import_format, batch_size=None, on_batch=None, on_reject=None):
+        self.user = user
+        self.format = import_format
+        self.batch_size = batch_size or getattr(settings, 'TODO_BULK_BATCH_SIZE', 500)
+        self.max_errors = getattr(settings, 'TODO_IMPORT_MAX_ERRORS', 100)
+        self.on_batch = on_batch
+        self.on_reject = on_reject
+        self.child = TaskSerializer()
+
+    def run(self, stream):
+        self.task_import = TaskImport.objects.create(owner=self.user, format=self.format)
+        batch, rejected = [], []
+        try:
+            for line_no, data in READERS[self.format](stream):
+                validated_data, errors = self.validate(data)
+                if errors:
+                    rejected.append({'line': line_no, 'errors': errors})
+                else:
+                    batch.append(validated_data)
+                if len(batch) + len(rejected) >= self.batch_size:
+                    self.flush(batch, rejected)
+                    batch, rejected = [], []
+            self.flush(batch, rejected)
+        except Exception:
+            self.task_import.status = 'failed'
+            self.task_import.finished = timezone.now()
+            self.task_import.save(update_fields=['status', 'finished'])
+            raise
+        self.task_import.status = 'done'
+        self.task_import.finished = timezone.now()
+        self.task_import.save(update_fields=['status', 'finished'])
+        return self.task_import
+
+    def validate(self, data):
+        """
+        (провалидированные данные, None) или (None, ошибки)
+        """
+        if not isinstance(data, dict):
+            return None, {'non_field_errors': ['Строка не является объектом задачи']}
+        try:
+            return self.child.run_validation(data), None
+        except serializers.ValidationError as exc:
+            return None, exc.detail
+
+    def flush(self, batch, rejected):
+        task_import = self.task_import
+        with transaction.atomic():
+            if batch:
+                bulk_create_tasks(self.user, batch, self.batch_size)
+            task_import.processed += len(batch) + len(rejected)
+            task_import.created += len(batch)
+            task_import.rejected += len(rejected)
+            task_import.errors += rejected[:max(self.max_errors - len(task_import.errors), 0)]
+            task_import.save(update_fields=['processed', 'created', 'rejected', 'errors'])
+        if self.on_reject:
+            for row in rejected:
+                self.on_reject(row)
+        if self.on_batch:
+            self.on_batch(task_import)
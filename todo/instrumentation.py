@@ -0,0 +1,280 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.utils.functional import SimpleLazyObject, empty
+
+logger = logging.getLogger('todo.requests')
+
+# активные сборщики метрик: запрос в middleware и query_budget в тестах. Переменная контекста
+# доходит и до потоков todo.async_views, т.к. sync_to_async копирует контекст
+_collectors = ContextVar('todo_metrics_collectors', default=())
+
+
+class Metrics:
+    """
+    Число и время SQL запросов и время сериализации, собранные за запрос или блок кода
+    """
+    def __init__(self, keep_sql=False):
+        self.queries = 0
+        self.db = 0.0
+        self.serializer = 0.0
+        self.sql = [] if keep_sql else None
+
+    @contextmanager
+    def collect(self):
+        token = _collectors.set(_collectors.get() + (self,))
+        try:
+            yield self
+        finally:
+            _collectors.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Обертка выполнения запросов, ставится на каждое соединение при подключении (см. signals)
+    """
+    collectors = _collectors.get()
+    if not collectors:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        for metrics in collectors:
+            metrics.queries += 1
+            metrics.db += duration
+            if metrics.sql is not None:
+                metrics.sql.append(sql)
+
+
+def install_query_wrapper(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timed(name):
+    """
+    Добавляет время блока к метрике name активных сборщиков
+    """
+    collectors = _collectors.get()
+    if not collectors:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        for metrics in collectors:
+            setattr(metrics, name, getattr(metrics, name) + duration)
+
+
+def known_routes(resolver=None, prefix=''):
+    """
+    Шаблоны всех маршрутов в том же виде, что и request.resolver_match.route
+    """
+    resolver = resolver or get_resolver()
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            yield from known_routes(pattern, prefix + str(pattern.pattern))
+        elif isinstance(pattern, URLPattern):
+            yield prefix + str(pattern.pattern)
+
+
+class RouteStats:
+    """
+    Гистограммы времени ответа и суммы метрик по маршрутам. Запросы копятся в памяти процесса
+    и раз в FLUSH_INTERVAL секунд добавляются к счетчикам во фреймворке кеширования Django,
+    поэтому статистику видят все процессы с общим кешем.
+    """
+    key_prefix = 'todo:metrics'
+    fields = ('count', 'errors', 'total_us', 'view_us', 'db_us', 'serializer_us', 'queries')
+
+    def __init__(self, backend='default', buckets=(5, 10, 25, 50, 100, 250, 500, 1000, 2500), flush_interval=5):
+        self.backend_alias = backend
+        self.buckets = tuple(buckets)
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.flushed = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.backend_alias]
+
+    def make_key(self, route, field):
+        return f'{self.key_prefix}:{hashlib.md5(route.encode()).hexdigest()}:{field}'
+
+    def bucket(self, total_ms):
+        for bound in self.buckets:
+            if total_ms <= bound:
+                return f'le_{bound}'
+        return 'le_inf'
+
+    def record(self, route, status_code, total, view, metrics):
+        """
+        Учитывает запрос, возвращает True, если пора сбросить накопленное в кеш
+        """
+        values = {'count': 1, 'errors': int(status_code >= 500), 'total_us': int(total * 1e6),
+                  'view_us': int(view * 1e6), 'db_us': int(metrics.db * 1e6),
+                  'serializer_us': int(metrics.serializer * 1e6), 'queries': metrics.queries,
+                  self.bucket(total * 1000): 1}
+        with self.lock:
+            for field, value in values.items():
+                key = self.make_key(route, field)
+                self.pending[key] = self.pending.get(key, 0) + value
+            return time.monotonic() - self.flushed >= self.flush_interval
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushed = time.monotonic()
+        for key, value in pending.items():
+            if value:
+                self.cache.add(key, 0, None)
+                try:
+                    self.cache.incr(key, value)
+                except ValueError:
+                    self.cache.set(key, value, None)
+
+    def stats(self):
+        self.flush()
+        bucket_fields = [f'le_{bound}' for bound in self.buckets] + ['le_inf']
+        routes = []
+        for route in sorted(set(known_routes())):
+            keys = {field: self.make_key(route, field) for field in self.fields + tuple(bucket_fields)}
+            values = self.cache.get_many(list(keys.values()))
+            counters = {field: values.get(key, 0) for field, key in keys.items()}
+            count = counters['count']
+            if not count:
+                continue
+            histogram = {field[3:]: counters[field] for field in bucket_fields}
+            routes.append({
+                'route': route, 'count': count, 'errors': counters['errors'],
+                'mean_ms': counters['total_us'] / count / 1000,
+                'p50_ms': self.percentile(histogram, count, 0.5),
+                'p95_ms': self.percentile(histogram, count, 0.95),
+                'p99_ms': self.percentile(histogram, count, 0.99),
+                'view_ms': counters['view_us'] / count / 1000,
+                'db_ms': counters['db_us'] / count / 1000,
+                'serializer_ms': counters['serializer_us'] / count / 1000,
+                'queries': counters['queries'] / count,
+                'histogram': histogram,
+            })
+        return routes
+
+    def percentile(self, histogram, count, fraction):
+        """
+        верхняя граница корзины, в которую попадает перцентиль, None для последней корзины
+        """
+        seen = 0
+        for bound in self.buckets:
+            seen += histogram[str(bound)]
+            if seen >= count * fraction:
+                return bound
+        return None
+
+    def clear(self):
+        with self.lock:
+            self.pending = {}
+        self.cache.delete_many([self.make_key(route, field) for route in set(known_routes())
+                                for field in self.fields + tuple(f'le_{bound}' for bound in self.buckets + ('inf',))])
+
+
+def _options():
+    return getattr(settings, 'TODO_REQUEST_METRICS', {})
+
+
+def _stats_from_settings():
+    options = _options()
+    return RouteStats(backend=options.get('BACKEND', 'default'),
+                      buckets=options.get('BUCKETS', (5, 10, 25, 50, 100, 250, 500, 1000, 2500)),
+                      flush_interval=options.get('FLUSH_INTERVAL', 5))
+
+
+route_stats = _stats_from_settings()
+
+
+class RequestMetricsMiddleware:
+    """
+    Число и время SQL запросов, время представления (с рендерингом), сериализации и всего запроса:
+    заголовок Server-Timing, строка JSON в логе todo.requests и гистограммы по маршрутам (route_stats).
+    Ставится первым в MIDDLEWARE, поддерживает и WSGI, и ASGI без перехода в синхронный поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with Metrics().collect() as metrics:
+            response = self.get_response(request)
+        if self.finish(request, response, metrics, start):
+            route_stats.flush()
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with Metrics().collect() as metrics:
+            response = await self.get_response(request)
+        if self.finish(request, response, metrics, start):
+            await sync_to_async(route_stats.flush, thread_sensitive=False)()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view_start = time.perf_counter()
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view_start = time.perf_counter()
+
+    def finish(self, request, response, metrics, start):
+        end = time.perf_counter()
+        total = end - start
+        view = end - getattr(request, '_metrics_view_start', end)
+        options = _options()
+        if options.get('SERVER_TIMING', True):
+            response['Server-Timing'] = \
+                f'db;dur={metrics.db * 1000:.2f};desc="{metrics.queries} queries", ' \
+                f'serializer;dur={metrics.serializer * 1000:.2f}, view;dur={view * 1000:.2f}, ' \
+                f'total;dur={total * 1000:.2f}'
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match else None
+        if options.get('LOG', True) and logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'method': request.method, 'path': request.path, 'route': route, 'status': response.status_code,
+                'user': self.user_id(request),
+                'queries': metrics.queries, 'db_ms': round(metrics.db * 1000, 2),
+                'serializer_ms': round(metrics.serializer * 1000, 2), 'view_ms': round(view * 1000, 2),
+                'total_ms': round(total * 1000, 2),
+            }))
+        if route is None:
+            return False
+        return route_stats.record(route, response.status_code, total, view, metrics)
+
+    @staticmethod
+    def user_id(request):
+        # ленивый пользователь, которого не запрашивал ни один слой, не загружается ради лога
+        user = getattr(request, 'user', None)
+        if user is None or isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+            return None
+        return user.id if user.is_authenticated else None
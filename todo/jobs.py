@@ -0,0 +1,163 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from .counters import CounterDelta
+from .models import ArchivedTask, Job, Task
+from .shards import atomic, lock, shard_for, use_shard
+from .versions import touch
+
+
+def _options():
+    return getattr(settings, 'TODO_JOBS', {})
+
+
+class CategoryRename:
+    """
+    Перенос задач пользователя из старой категории в новую. Связи пользователя с категориями
+    меняются сразу в запросе, здесь переносятся только задачи
+    """
+    def __init__(self, job):
+        self.job = job
+
+    def remaining(self):
+        params = self.job.params
+        return Task.objects.filter(owner_id=self.job.owner_id, category_id=params['category'],
+                                   id__lte=params['max_id'], modified__lte=self.job.created)
+
+    def destination(self):
+        """
+        Категория, в которую задачи попадут после следующих операций пользователя над новой категорией,
+        None - задачи будут удалены. Перенесенные задачи изменены позже постановки этих операций, и те
+        их уже не затронут (remaining), поэтому задачи сразу переносятся в итоговую категорию
+        """
+        category = self.job.params['new_category']
+        later = Job.objects.filter(owner_id=self.job.owner_id, id__gt=self.job.id, status__in=['queued', 'running'])
+        for job in later.order_by('id'):
+            if job.params['category'] == category:
+                if job.kind == 'category_delete':
+                    return None
+                category = job.params['new_category']
+        return category
+
+    def apply(self, tasks):
+        category = self.destination()
+        if category is None:
+            delete_tasks(tasks)
+            return
+        CounterDelta().add_queryset(tasks, changes={'category_id': category}).apply()
+        tasks.update(category_id=category, modified=timezone.now())
+
+    def archived(self):
+        return ArchivedTask.objects.filter(owner_id=self.job.owner_id, category_id=self.job.params['category'])
+
+    def finish(self):
+        # архив не входит в счетчики и читается редко, он обновляется одним запросом в конце операции
+        self.archived().update(category_id=self.job.params['new_category'])
+
+
+class CategoryDelete(CategoryRename):
+    """
+    Удаление задач пользователя в категории, из которой пользователь уже удален в запросе
+    """
+    def apply(self, tasks):
+        delete_tasks(tasks)
+
+    def finish(self):
+        self.archived().delete()
+
+
+def delete_tasks(tasks):
+    CounterDelta().add_queryset(tasks, sign=-1).apply()
+    tasks.delete()
+
+
+HANDLERS = {
+    'category_rename': CategoryRename,
+    'category_delete': CategoryDelete,
+}
+
+
+def enqueue(owner, kind, category, **params):
+    """
+    Ставит операцию над задачами пользователя в категории в очередь. Операция затрагивает только задачи,
+    которые были в категории при постановке: созданные (id больше max_id) и измененные позже (пользователь
+    перенес в категорию старую задачу) не трогает. Задачи, которые перенесет в категорию еще не выполненная
+    предыдущая операция, та сразу переносит или удаляет по этой (CategoryRename.destination).
+    Постановка и пачки операций берут блокировку записи БД задач: created новой операции больше modified
+    задач, перенесенных пачкой, которая ее не видела
+    """
+    with atomic() as alias:
+        lock(alias)
+        max_id = Task.objects.filter(owner=owner).aggregate(max_id=Max('id'))['max_id'] or 0
+        total = Task.objects.filter(owner=owner, category=category).count()
+        return Job.objects.create(owner=owner, kind=kind, total=total,
+                                  params={'category': category.id, 'max_id': max_id, **params})
+
+
+def claim(now=None):
+    """
+    Забирает самую старую операцию из очереди или операцию упавшего процесса с истекшей арендой.
+    Операции одного пользователя выполняются по порядку: пока не закончена предыдущая, следующая не берется.
+    Захват - UPDATE с условием на прочитанное состояние, поэтому рабочих процессов может быть несколько.
+    """
+    now = now or timezone.now()
+    lease = timedelta(seconds=_options().get('LEASE', 300))
+    candidates = Job.objects.filter(Q(status='queued') | Q(status='running', locked_until__lt=now)).order_by('id')
+    # кандидатов с запасом: операции пользователей, у которых не закончена предыдущая, пропускаются
+    for job in candidates[:20]:
+        if Job.objects.filter(owner_id=job.owner_id, id__lt=job.id, status__in=['queued', 'running']).exists():
+            continue
+        claimed = Job.objects.filter(pk=job.pk, status=job.status, locked_until=job.locked_until)\
+            .update(status='running', locked_until=now + lease, attempts=F('attempts') + 1,
+                    started=job.started or now)
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def run(job, chunk_size=None, stop=None):
+    """
+    Выполняет операцию пачками по chunk_size задач. Каждая пачка - отдельная транзакция вместе со счетчиками,
+    версией задач пользователя и прогрессом операции, поэтому блокировка записи SQLite держится не дольше
+    одной пачки, а прерванная операция продолжается с оставшихся задач. При установленном событии stop
+    операция возвращается в очередь после текущей пачки
+    """
+    with use_shard(shard_for(job.owner_id)):
+        return _run(job, chunk_size, stop)
+
+
+def _run(job, chunk_size, stop):
+    options = _options()
+    chunk_size = chunk_size or options.get('CHUNK_SIZE', 1000)
+    lease = timedelta(seconds=options.get('LEASE', 300))
+    handler = HANDLERS[job.kind](job)
+    try:
+        while True:
+            with atomic() as alias:
+                lock(alias)
+                ids = list(handler.remaining().order_by('id').values_list('id', flat=True)[:chunk_size])
+                if ids:
+                    handler.apply(Task.objects.filter(id__in=ids))
+                    touch(job.owner_id)
+                Job.objects.filter(pk=job.pk).update(processed=F('processed') + len(ids),
+                                                     locked_until=timezone.now() + lease)
+            if len(ids) < chunk_size:
+                break
+            if stop is not None and stop.is_set():
+                Job.objects.filter(pk=job.pk).update(status='queued', locked_until=None)
+                job.refresh_from_db()
+                return job
+        with atomic():
+            handler.finish()
+            Job.objects.filter(pk=job.pk).update(status='done', locked_until=None, finished=timezone.now())
+    except Exception as error:
+        retry = job.attempts < options.get('MAX_ATTEMPTS', 3)
+        Job.objects.filter(pk=job.pk).update(status='queued' if retry else 'failed', error=repr(error),
+                                             locked_until=None, finished=None if retry else timezone.now())
+        raise
+    job.refresh_from_db()
+    return job
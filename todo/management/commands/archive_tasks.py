@@ -0,0 +1,46 @@
+import signal
+import threading
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from todo.archive import _options, archive_tasks
+from todo.search import optimize_index
+from todo.shards import all_aliases, group_by_shard, use_shard
+
+
+class Command(BaseCommand):
+    help = 'Переносит выполненные задачи старше срока в архив (todo.archive) пачками в отдельных транзакциях'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--age-days', type=float, help='возраст выполненной задачи, TODO_ARCHIVE["AGE_DAYS"]')
+        parser.add_argument('--chunk-size', type=int, help='задач в одной транзакции, TODO_ARCHIVE["CHUNK_SIZE"]')
+        parser.add_argument('--user', help='только задачи этого пользователя')
+
+    def handle(self, *args, **options):
+        owner_ids = None
+        groups = {alias: None for alias in all_aliases()}
+        if options['user']:
+            owner_ids = list(User.objects.filter(username=options['user']).values_list('id', flat=True))
+            if not owner_ids:
+                raise CommandError(f'Пользователь {options["user"]} не найден')
+            groups = group_by_shard(owner_ids)
+        days = options['age_days'] if options['age_days'] is not None else _options().get('AGE_DAYS', 90)
+        stop = threading.Event()
+        # перенос заканчивается после текущей пачки, остальные задачи перенесет следующий запуск
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+        started = time.perf_counter()
+        moved = 0
+        for alias, ids in groups.items():
+            with use_shard(alias):
+                moved_here = archive_tasks(timezone.now() - timedelta(days=days), options['chunk_size'], stop=stop,
+                                           owner_ids=ids)
+            if moved_here:
+                optimize_index(alias)
+            moved += moved_here
+        self.stdout.write(self.style.SUCCESS(f'Перенесено в архив задач: {moved} '
+                                             f'за {time.perf_counter() - started:.1f} с'))
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from todo.changelog import _options, compact
+from todo.shards import all_aliases, use_shard
+
+
+class Command(BaseCommand):
+    help = 'Сжимает журнал изменений для task/sync/: удаляет повторные записи об объектах ' \
+           'и записи об удалении старше срока хранения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=float,
+                            help='срок хранения записей об удалении, TODO_SYNC["RETENTION_DAYS"]')
+        parser.add_argument('--batch-size', type=int, default=10000, help='записей журнала в одной транзакции')
+
+    def handle(self, *args, **options):
+        days = options['retention_days'] if options['retention_days'] is not None \
+            else _options().get('RETENTION_DAYS', 30)
+        duplicates, tombstones = 0, 0
+        for alias in all_aliases():
+            with use_shard(alias):
+                compacted = compact(timezone.now() - timedelta(days=days), options['batch_size'])
+            duplicates, tombstones = duplicates + compacted[0], tombstones + compacted[1]
+        self.stdout.write(self.style.SUCCESS(f'Удалено повторных записей: {duplicates}, '
+                                             f'записей об удалении: {tombstones}'))
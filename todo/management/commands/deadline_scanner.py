@@ -0,0 +1,62 @@
+import signal
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from todo.deadlines import DeadlineScanner, _options, get_sink
+from todo.shards import all_aliases, use_shard
+
+
+class Command(BaseCommand):
+    help = 'Рабочий процесс напоминаний о дедлайнах: раз в --interval секунд передает в sink открытые задачи, ' \
+           'дедлайн которых наступит в ближайшие --lead секунд. Запускается в одном экземпляре'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='один проход и выход')
+        parser.add_argument('--interval', type=float, help='секунд между проходами, TODO_DEADLINES["INTERVAL"]')
+        parser.add_argument('--lead', type=int, help='за сколько секунд до дедлайна напоминать')
+        parser.add_argument('--window', type=int, help='ширина окна дедлайнов одного запроса в секундах')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--sink', help='путь к классу sink, по умолчанию TODO_DEADLINES["SINK"]')
+        parser.add_argument('--since', type=datetime.fromisoformat,
+                            help='начальная позиция, если напоминаний еще не было, по умолчанию сейчас')
+
+    def handle(self, *args, **options):
+        sink = get_sink(options['sink'])
+        # у каждой БД с задачами (основной и шардов) своя позиция сканирования
+        scanners = {alias: DeadlineScanner(sink, lead=options['lead'], window=options['window'],
+                                           batch_size=options['batch_size']) for alias in all_aliases()}
+        interval = options['interval'] if options['interval'] is not None else _options().get('INTERVAL', 60)
+        since = options['since']
+        if since is not None and since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+
+        stop = threading.Event()
+        if not options['once']:
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *args: stop.set())
+
+        while not stop.is_set():
+            # процесс живет долго: CONN_MAX_AGE и оборванные соединения проверяются на каждом проходе
+            close_old_connections()
+            started = time.perf_counter()
+            try:
+                sent = 0
+                for alias, scanner in scanners.items():
+                    with use_shard(alias):
+                        sent += scanner.scan(since=since)
+            except Exception as error:
+                if options['once']:
+                    raise
+                self.stderr.write(f'ошибка прохода, повтор через {interval} с: {error!r}')
+            else:
+                if options['verbosity'] >= 2 or options['once']:
+                    self.stdout.write(f'напоминаний: {sent} за {time.perf_counter() - started:.3f} с, '
+                                      f'позиция {min(s.position[0] for s in scanners.values()).isoformat()}')
+            if options['once']:
+                break
+            stop.wait(interval)
+        close_old_connections()
@@ -0,0 +1,46 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo.importer import READERS, TaskImporter
+from todo.shards import shard_for, use_shard
+
+
+class Command(BaseCommand):
+    help = 'Потоковый импорт задач пользователя из файла NDJSON или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help='имя пользователя-владельца задач')
+        parser.add_argument('--format', choices=list(READERS), help='по умолчанию определяется по расширению')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--rejected', help='файл NDJSON для всех отклоненных строк с ошибками')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'Пользователь {options["user"]} не найден')
+        import_format = options['format'] or options['path'].rsplit('.', 1)[-1]
+        if import_format not in READERS:
+            raise CommandError(f'Неизвестный формат {import_format}')
+
+        rejected_file = open(options['rejected'], 'w') if options['rejected'] else None
+
+        def on_batch(task_import):
+            self.stderr.write(f'обработано {task_import.processed}, создано {task_import.created}, '
+                              f'отклонено {task_import.rejected}')
+
+        def on_reject(row):
+            rejected_file.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+        try:
+            with open(options['path'], 'rb') as stream, use_shard(shard_for(user.id)):
+                task_import = TaskImporter(user, import_format, options['batch_size'], on_batch,
+                                           on_reject if rejected_file else None).run(stream)
+        finally:
+            if rejected_file:
+                rejected_file.close()
+        self.stdout.write(self.style.SUCCESS(f'Импорт {task_import.id}: создано {task_import.created}, '
+                                             f'отклонено {task_import.rejected}'))
@@ -0,0 +1,27 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from todo.shards import all_aliases, shard_aliases, sync_references, use_shard
+
+
+class Command(BaseCommand):
+    help = 'Применяет миграции к основной БД и всем шардам TODO_SHARDS["DATABASES"] и копирует в шарды ' \
+           'справочные таблицы: категории и размещенных в шарде пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-references', action='store_true', help='только миграции')
+
+    def handle(self, *args, **options):
+        if not shard_aliases():
+            raise CommandError('Шарды не настроены: задайте пути файлов в TODO_SHARD_DATABASES')
+        for alias in all_aliases():
+            self.stdout.write(f'миграции {alias}')
+            # миграции с данными читают и пишут модели без using: все запросы идут в мигрируемую БД
+            with use_shard(alias, all_models=True):
+                call_command('migrate', database=alias, interactive=False, verbosity=options['verbosity'],
+                             stdout=self.stdout, stderr=self.stderr)
+        if options['skip_references']:
+            return
+        for alias in shard_aliases():
+            copied = sync_references(alias)
+            self.stdout.write(self.style.SUCCESS(f'{alias}: скопировано пользователей и категорий: {copied}'))
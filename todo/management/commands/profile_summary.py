@@ -0,0 +1,43 @@
+import io
+import json
+import pstats
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Самые затратные функции по всем сохраненным профилям запросов (todo.profiling)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='каталог профилей, по умолчанию TODO_PROFILING["DIRECTORY"]')
+        parser.add_argument('--route', help='только профили маршрута, например task/')
+        parser.add_argument('--user', type=int, help='только профили пользователя с этим id')
+        parser.add_argument('--sort', choices=['cumulative', 'tottime', 'ncalls'], default='tottime')
+        parser.add_argument('--limit', type=int, default=25)
+
+    def handle(self, *args, **options):
+        directory = Path(options['dir'] or getattr(settings, 'TODO_PROFILING', {}).get(
+            'DIRECTORY', settings.BASE_DIR / 'profiles'))
+        profiles, routes = [], Counter()
+        for path in sorted(directory.glob('*.prof')):
+            meta_path = path.with_suffix('.json')
+            meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+            if options['route'] and meta.get('route') != options['route']:
+                continue
+            if options['user'] is not None and meta.get('user') != options['user']:
+                continue
+            profiles.append(str(path))
+            routes[meta.get('route')] += 1
+        if not profiles:
+            raise CommandError(f'Нет профилей в {directory}')
+
+        self.stdout.write(f'Профилей: {len(profiles)}')
+        for route, count in routes.most_common():
+            self.stdout.write(f'  {route}: {count}')
+        output = io.StringIO()
+        stats = pstats.Stats(*profiles, stream=output)
+        stats.strip_dirs().sort_stats(options['sort']).print_stats(options['limit'])
+        self.stdout.write(output.getvalue())
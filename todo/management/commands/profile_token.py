@@ -0,0 +1,17 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = 'Подписанный токен заголовка X-Todo-Profile для профилирования запросов пользователя'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='имя пользователя, по умолчанию запросы любого пользователя')
+
+    def handle(self, *args, **options):
+        username = options['user']
+        if username and not User.objects.filter(username=username).exists():
+            raise CommandError(f'Пользователь {username} не найден')
+        self.stdout.write(make_token(username or '*'))
@@ -0,0 +1,51 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from todo.shards import locate, move_user, placement, shard_aliases
+
+
+class Command(BaseCommand):
+    help = 'Переносит пользователей между шардами: --user в шард --to, без них - всех пользователей, ' \
+           'чей шард отличается от размещения по хешу id (после добавления шарда или из основной БД)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='имя пользователя')
+        parser.add_argument('--to', help='алиас шарда, по умолчанию по хешу id')
+        parser.add_argument('--dry-run', action='store_true', help='только показать, кто и куда переносится')
+
+    def handle(self, *args, **options):
+        aliases = shard_aliases()
+        if not aliases:
+            raise CommandError('Шарды не настроены: задайте пути файлов в TODO_SHARD_DATABASES')
+        if options['to'] and options['to'] not in [*aliases, DEFAULT_DB_ALIAS]:
+            raise CommandError(f'Неизвестный шард {options["to"]}, настроены: {", ".join(aliases)}')
+        users = User.objects.using(DEFAULT_DB_ALIAS).order_by('id')
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f'Пользователь {options["user"]} не найден')
+        elif options['to']:
+            raise CommandError('--to задается только вместе с --user')
+
+        moved_users, moved_tasks, skipped = 0, 0, 0
+        for user_id in users.values_list('id', flat=True).iterator():
+            target = options['to'] or placement(user_id)
+            source, moving = locate(user_id)
+            if source == target and not moving:
+                continue
+            if options['dry_run']:
+                self.stdout.write(f'{user_id}: {source} -> {target}')
+                moved_users += 1
+                continue
+            try:
+                moved_tasks += move_user(user_id, target)
+            except ValueError as error:
+                self.stderr.write(str(error))
+                skipped += 1
+                continue
+            moved_users += 1
+            if options['verbosity'] >= 2:
+                self.stderr.write(f'{user_id}: {source} -> {target}')
+        self.stdout.write(self.style.SUCCESS(f'Перенесено пользователей: {moved_users}, задач: {moved_tasks}, '
+                                             f'пропущено с незаконченными операциями: {skipped}'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from todo.search import install_index, rebuild_index, is_supported
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс задач'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not is_supported(using):
+            raise CommandError('Полнотекстовый индекс поддерживается только для SQLite')
+        install_index(using)
+        count = rebuild_index(using)
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано задач: {count}'))
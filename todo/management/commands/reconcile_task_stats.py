@@ -0,0 +1,28 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo.counters import rebuild
+from todo.shards import group_by_shard, use_shard
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики статистики задач (TaskCounter) по таблице задач'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='только для этого пользователя')
+        parser.add_argument('--batch-size', type=int, default=500, help='пользователей в одной транзакции')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f'Пользователь {options["user"]} не найден')
+        user_ids = list(users.values_list('id', flat=True))
+        drifted = []
+        for alias, ids in group_by_shard(user_ids).items():
+            with use_shard(alias):
+                for start in range(0, len(ids), options['batch_size']):
+                    drifted += rebuild(ids[start:start + options['batch_size']])
+        self.stdout.write(self.style.SUCCESS(f'Проверено пользователей: {len(user_ids)}, '
+                                             f'исправлены счетчики: {len(drifted)}'))
@@ -0,0 +1,50 @@
+import signal
+import sqlite3
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from todo.replicas import replica_aliases
+
+
+def replica_path(alias):
+    # реплики открываются как file:<путь>?mode=ro, копия пишется по самому пути
+    name = str(connections[alias].settings_dict['NAME'])
+    return name[len('file:'):].split('?')[0] if name.startswith('file:') else name
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную БД SQLite в файлы реплик TODO_REPLICAS["DATABASES"] через backup API. ' \
+           'Замена репликации для локальной проверки чтения с реплик и отставания реплик'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='повторять копирование раз в столько секунд')
+
+    def handle(self, *args, **options):
+        aliases = replica_aliases()
+        if not aliases:
+            raise CommandError('Реплики не настроены: задайте пути файлов в TODO_REPLICA_DATABASES')
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('Копирование реплик поддерживается только для SQLite')
+        stop = threading.Event()
+        if options['interval']:
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *args: stop.set())
+
+        while not stop.is_set():
+            started = time.perf_counter()
+            primary.ensure_connection()
+            for alias in aliases:
+                target = sqlite3.connect(replica_path(alias))
+                try:
+                    primary.connection.backup(target)
+                finally:
+                    target.close()
+            if options['verbosity'] >= 2 or not options['interval']:
+                self.stdout.write(f'реплики {", ".join(aliases)} обновлены за {time.perf_counter() - started:.2f} с')
+            if not options['interval']:
+                break
+            stop.wait(options['interval'])
@@ -0,0 +1,27 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from todo.instrumentation import route_stats
+
+
+class Command(BaseCommand):
+    help = 'Время ответа, SQL запросы и сериализация по маршрутам из общего кеша метрик запросов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='вывод в JSON с гистограммами')
+        parser.add_argument('--clear', action='store_true', help='обнулить статистику после вывода')
+
+    def handle(self, *args, **options):
+        routes = route_stats.stats()
+        if options['json']:
+            self.stdout.write(json.dumps(routes, ensure_ascii=False, indent=2))
+        else:
+            self.stdout.write(f'{"route":<56}{"count":>8}{"mean":>9}{"p95":>7}{"queries":>9}{"db":>8}'
+                              f'{"serializer":>12}')
+            for row in sorted(routes, key=lambda row: row['mean_ms'] * row['count'], reverse=True):
+                p95 = row['p95_ms'] if row['p95_ms'] is not None else 'inf'
+                self.stdout.write(f'{row["route"]:<56}{row["count"]:>8}{row["mean_ms"]:>9.1f}{p95:>7}'
+                                  f'{row["queries"]:>9.1f}{row["db_ms"]:>8.1f}{row["serializer_ms"]:>12.1f}')
+        if options['clear']:
+            route_stats.clear()
@@ -0,0 +1,45 @@
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from todo.jobs import _options, claim, run
+
+
+class Command(BaseCommand):
+    help = 'Рабочий процесс очереди фоновых операций (todo.jobs): переименование и удаление категорий ' \
+           'пачками задач в отдельных транзакциях'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='выполнить все операции из очереди и выйти')
+        parser.add_argument('--interval', type=float, help='секунд ожидания при пустой очереди, TODO_JOBS["INTERVAL"]')
+        parser.add_argument('--chunk-size', type=int, help='задач в одной транзакции, TODO_JOBS["CHUNK_SIZE"]')
+
+    def handle(self, *args, **options):
+        interval = options['interval'] if options['interval'] is not None else _options().get('INTERVAL', 1)
+        stop = threading.Event()
+        if not options['once']:
+            # операция дорабатывает текущую пачку, оставшиеся пачки продолжит следующий запуск
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *args: stop.set())
+
+        while not stop.is_set():
+            close_old_connections()
+            job = claim()
+            if job is None:
+                if options['once']:
+                    break
+                stop.wait(interval)
+                continue
+            started = time.perf_counter()
+            try:
+                job = run(job, options['chunk_size'], stop=stop)
+            except Exception as error:
+                self.stderr.write(f'операция {job.id} {job.kind}: {error!r}')
+                continue
+            if options['verbosity'] >= 2 or options['once']:
+                self.stdout.write(f'операция {job.id} {job.kind}: {job.status}, задач {job.processed} '
+                                  f'за {time.perf_counter() - started:.2f} с')
+        close_old_connections()
@@ -0,0 +1,155 @@
+import itertools
+import random
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+import factory.random
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from todo.counters import CounterDelta, task_state
+from todo.factories import CategoryFactory, TaskFactory, UserFactory
+from todo.models import Task, Category
+from todo.shards import assign_users, atomic, group_by_shard, mirror, use_shard
+
+
+def deadline_offset(rnd, distribution, days):
+    """
+    смещение дедлайна от даты начала в днях, не больше days
+    """
+    if distribution == 'normal':
+        return min(max(rnd.gauss(days / 2, days / 6), 0), days)
+    if distribution == 'exponential':
+        return min(rnd.expovariate(3 / days), days)
+    return rnd.uniform(0, days)
+
+
+class Command(BaseCommand):
+    help = 'Быстрое заполнение БД пользователями, категориями и задачами для нагрузочных тестов. ' \
+           'Объекты строятся фабриками (build) и пишутся bulk_create пачками в транзакциях, ' \
+           'результат определяется --seed и --start'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--tasks-per-user', type=int, default=100)
+        parser.add_argument('--categories-per-user', type=int, default=5)
+        parser.add_argument('--shared-categories', type=int, default=100,
+                            help='размер общего набора категорий, выбираются с распределением Ципфа')
+        parser.add_argument('--sharing', type=float, default=0.8,
+                            help='доля категорий пользователя из общего набора, остальные личные')
+        parser.add_argument('--deadline-distribution', choices=['uniform', 'normal', 'exponential'],
+                            default='uniform')
+        parser.add_argument('--deadline-days', type=int, default=365)
+        parser.add_argument('--overdue', type=float, default=0.1, help='доля задач с прошедшим дедлайном')
+        parser.add_argument('--done', type=float, default=0.3, help='доля выполненных задач')
+        parser.add_argument('--start', type=datetime.fromisoformat, help='дата отсчета дедлайнов, по умолчанию сегодня')
+        parser.add_argument('--prefix', default='seed', help='префикс имен пользователей и категорий')
+        parser.add_argument('--password', default='seed', help='пароль всех пользователей')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if len(prefix) > 8:
+            raise CommandError('Префикс длиннее 8 символов не помещается в имя категории')
+        # имена пользователей - префикс и номер: startswith захватил бы и чужих (bench10 для префикса bench1)
+        self.usernames = rf'^{re.escape(prefix)}[0-9]+$'
+        if User.objects.filter(username__regex=self.usernames).exists():
+            raise CommandError(f'Пользователи с префиксом {prefix} уже есть, укажите другой --prefix')
+        if not 0 <= options['sharing'] <= 1 or not 0 <= options['overdue'] <= 1 or not 0 <= options['done'] <= 1:
+            raise CommandError('--sharing, --overdue и --done задаются долей от 0 до 1')
+
+        self.rnd = random.Random(options['seed'])
+        factory.random.reseed_random(options['seed'])
+        TaskFactory.reset_sequence()
+        self.options = options
+        start = options['start'] or datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.start = start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+        started = time.perf_counter()
+
+        # хеш пароля считается один раз: make_password на каждого пользователя занял бы больше всего остального
+        password = make_password(options['password'])
+        with transaction.atomic():
+            User.objects.bulk_create([UserFactory.build(username=f'{prefix}{i}', email=f'{prefix}{i}@mail.com',
+                                                        password=password) for i in range(options['users'])],
+                                     batch_size=options['batch_size'])
+            Category.objects.bulk_create([CategoryFactory.build(name=f'{prefix} общая {i}')
+                                          for i in range(options['shared_categories'])])
+        user_ids = list(User.objects.filter(username__regex=self.usernames).order_by('id')
+                        .values_list('id', flat=True))
+        assign_users(user_ids)
+        mirror(Category.objects.filter(name__startswith=f'{prefix} общая '))
+        self.shared = list(Category.objects.filter(name__startswith=f'{prefix} общая ').order_by('id')
+                           .values_list('id', flat=True))
+        self.weights = list(itertools.accumulate(1 / rank for rank in range(1, len(self.shared) + 1)))
+
+        # не больше 1000 пользователей в пачке, чтобы имена личных категорий помещались в один IN
+        chunk_size = max(1, min(options['batch_size'] // max(options['tasks_per_user'], 1), 1000))
+        tasks = 0
+        for offset in range(0, len(user_ids), chunk_size):
+            tasks += self.seed_users(user_ids[offset:offset + chunk_size], offset)
+            if options['verbosity'] >= 2:
+                self.stderr.write(f'пользователей {min(offset + chunk_size, len(user_ids))}, задач {tasks}')
+
+        self.stdout.write(self.style.SUCCESS(f'Создано пользователей: {len(user_ids)}, задач: {tasks} '
+                                             f'за {time.perf_counter() - started:.1f} с'))
+
+    def seed_users(self, user_ids, offset):
+        """
+        категории пачки пользователей, затем связи и задачи одной транзакцией в каждом шарде пачки
+        """
+        options, rnd, prefix = self.options, self.rnd, self.options['prefix']
+        owned, private = {}, []
+        for index, user_id in enumerate(user_ids, offset):
+            owned[user_id] = set()
+            for number in range(options['categories_per_user']):
+                if self.shared and rnd.random() < options['sharing']:
+                    owned[user_id].add(rnd.choices(self.shared, cum_weights=self.weights)[0])
+                else:
+                    private.append((user_id, f'{prefix} {index}.{number}'))
+
+        tasks = {}
+        with transaction.atomic():
+            Category.objects.bulk_create([CategoryFactory.build(name=name) for _, name in private])
+        created = Category.objects.filter(name__in=[name for _, name in private])
+        mirror(created)
+        private_ids = dict(created.values_list('name', 'id'))
+        for user_id, name in private:
+            owned[user_id].add(private_ids[name])
+
+        for user_id, categories in owned.items():
+            # готовые owner и category не дают SubFactory строить новых пользователей и категории
+            owner = User(id=user_id)
+            categories = [Category(id=category_id) for category_id in sorted(categories)] or [None]
+            tasks[user_id] = []
+            for _ in range(options['tasks_per_user']):
+                days = deadline_offset(rnd, options['deadline_distribution'], options['deadline_days'])
+                if rnd.random() < options['overdue']:
+                    days = -days
+                done = rnd.random() < options['done']
+                # created все равно перезаписывается auto_now_add, явное значение экономит FuzzyDateTime
+                tasks[user_id].append(TaskFactory.build(
+                    created=self.start,
+                    owner=owner,
+                    category=rnd.choice(categories),
+                    deadline=self.start + timedelta(days=days),
+                    status=done,
+                    done_time=self.start if done else None,
+                    priority=rnd.choice(Task.PRIORITY_CHOICES)[0],
+                ))
+
+        for alias, shard_user_ids in group_by_shard(user_ids).items():
+            with use_shard(alias), atomic():
+                Category.user.through.objects.bulk_create([
+                    Category.user.through(category_id=category_id, user_id=user_id)
+                    for user_id in shard_user_ids for category_id in owned[user_id]])
+                shard_tasks = [task for user_id in shard_user_ids for task in tasks[user_id]]
+                Task.objects.bulk_create(shard_tasks, batch_size=options['batch_size'])
+                delta = CounterDelta()
+                for task in shard_tasks:
+                    delta.add(task.owner_id, task_state(task))
+                delta.apply()
+        return sum(len(user_tasks) for user_tasks in tasks.values())
@@ -0,0 +1,17 @@
+# Generated by Django 3.2 on 2026-10-16 23:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0004_alter_category_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['owner', 'deadline', 'id'], name='todo_task_owner_deadline_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2 on 2026-10-16 23:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('todo', '0005_task_owner_deadline_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(max_length=10, verbose_name='Формат')),
+                ('status', models.CharField(choices=[('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='running', max_length=10, verbose_name='Статус')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Обработано строк')),
+                ('created', models.PositiveIntegerField(default=0, verbose_name='Создано задач')),
+                ('rejected', models.PositiveIntegerField(default=0, verbose_name='Отклонено строк')),
+                ('errors', models.JSONField(default=list, verbose_name='Ошибки отклоненных строк')),
+                ('started', models.DateTimeField(auto_now_add=True, verbose_name='Начало')),
+                ('finished', models.DateTimeField(null=True, verbose_name='Окончание')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Импорт задач',
+                'verbose_name_plural': 'Импорты задач',
+                'ordering': ['-started'],
+            },
+        ),
+    ]
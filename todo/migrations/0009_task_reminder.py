@@ -0,0 +1,43 @@
+# Generated by Django 3.2 on 2026-10-17 00:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0008_taskcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deadline', models.DateTimeField(verbose_name='Дедлайн')),
+                ('sent', models.DateTimeField(verbose_name='Отправлено')),
+            ],
+            options={
+                'verbose_name': 'Напоминание о дедлайне',
+                'verbose_name_plural': 'Напоминания о дедлайнах',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', 'deadline', 'id'], name='todo_task_status_deadline_idx'),
+        ),
+        migrations.AddField(
+            model_name='taskreminder',
+            name='task',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='todo.task', verbose_name='Задача'),
+        ),
+        migrations.AddIndex(
+            model_name='taskreminder',
+            index=models.Index(fields=['deadline', 'task'], name='todo_taskreminder_deadline_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='taskreminder',
+            constraint=models.UniqueConstraint(fields=('task', 'deadline'), name='todo_taskreminder_task_deadline'),
+        ),
+    ]
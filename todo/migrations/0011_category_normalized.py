@@ -0,0 +1,88 @@
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def normalize(name):
+    # копия todo.models.normalize_category_name на момент миграции
+    return ' '.join(name.split()).lower()
+
+
+def drop_search_triggers(apps, schema_editor):
+    # SQLite пересобирает todo_category, а триггеры FTS на todo_task ссылаются на нее и ломают пересборку.
+    # Триггеры ставятся заново после миграций (todo.search.install_index)
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for suffix in ('ai', 'ad', 'au', 'category_au'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS todo_task_fts_{suffix}')
+
+
+def deduplicate(apps, schema_editor):
+    """
+    Категории с одинаковым нормализованным именем сливаются в самую старую: задачи, связи с пользователями,
+    счетчики category:<id> и параметры незаконченных фоновых операций переводятся на нее
+    """
+    Category = apps.get_model('todo', 'Category')
+    Task = apps.get_model('todo', 'Task')
+    TaskCounter = apps.get_model('todo', 'TaskCounter')
+    Job = apps.get_model('todo', 'Job')
+    through = Category.user.through
+
+    groups = defaultdict(list)
+    for pk, name in Category.objects.order_by('id').values_list('id', 'name').iterator():
+        groups[normalize(name)].append(pk)
+
+    replaced = {}
+    for ids in groups.values():
+        keep, duplicates = ids[0], ids[1:]
+        if not duplicates:
+            continue
+        Task.objects.filter(category_id__in=duplicates).update(category_id=keep)
+        users = set(through.objects.filter(category_id__in=duplicates).values_list('user_id', flat=True))
+        users -= set(through.objects.filter(category_id=keep, user_id__in=users).values_list('user_id', flat=True))
+        through.objects.bulk_create([through(category_id=keep, user_id=user_id) for user_id in users])
+        through.objects.filter(category_id__in=duplicates).delete()
+        for counter in TaskCounter.objects.filter(key__in=[f'category:{pk}' for pk in duplicates]):
+            target, created = TaskCounter.objects.get_or_create(owner_id=counter.owner_id, key=f'category:{keep}')
+            TaskCounter.objects.filter(pk=target.pk).update(value=F('value') + counter.value)
+            counter.delete()
+        Category.objects.filter(id__in=duplicates).delete()
+        replaced.update((pk, keep) for pk in duplicates)
+
+    for job in Job.objects.filter(status__in=['queued', 'running']):
+        params = {key: replaced.get(value, value) if key in ('category', 'new_category') else value
+                  for key, value in job.params.items()}
+        if params != job.params:
+            Job.objects.filter(pk=job.pk).update(params=params)
+
+    categories = list(Category.objects.only('id', 'name'))
+    for category in categories:
+        category.normalized = normalize(category.name)
+    Category.objects.bulk_update(categories, ['normalized'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0010_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_triggers, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='category',
+            name='normalized',
+            field=models.CharField(editable=False, max_length=40, null=True,
+                                   verbose_name='Нормализованное название категории'),
+        ),
+        migrations.RunPython(deduplicate, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='category',
+            name='normalized',
+            field=models.CharField(editable=False, max_length=40, unique=True,
+                                   verbose_name='Нормализованное название категории'),
+        ),
+        # при откате пересборка todo_category идет первой
+        migrations.RunPython(migrations.RunPython.noop, drop_search_triggers),
+    ]
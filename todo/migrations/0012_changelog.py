@@ -0,0 +1,55 @@
+# Generated by Django 3.2 on 2026-10-17 00:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def drop_changelog_triggers(apps, schema_editor):
+    # при откате триггеры журнала на todo_task и todo_category_user ссылались бы на удаленную таблицу.
+    # Вперед триггеры ставятся после миграций (todo.changelog.install_triggers)
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for suffix in ('task_ai', 'task_au', 'task_ad', 'category_ai', 'category_ad'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS todo_changelog_{suffix}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('todo', '0011_category_normalized'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskversion',
+            name='sync_horizon',
+            field=models.BigIntegerField(default=0, verbose_name='Горизонт журнала изменений'),
+        ),
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False, verbose_name='Номер')),
+                ('kind', models.CharField(choices=[('task', 'task'), ('category', 'category')], max_length=10, verbose_name='Объект')),
+                ('object_id', models.BigIntegerField(verbose_name='id объекта')),
+                ('deleted', models.BooleanField(default=False, verbose_name='Удален')),
+                ('created', models.DateTimeField(verbose_name='Время изменения')),
+                ('owner', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Запись журнала изменений',
+                'verbose_name_plural': 'Журнал изменений',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='changelog',
+            index=models.Index(fields=['owner', 'seq'], name='todo_changelog_owner_seq_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='changelog',
+            index=models.Index(fields=['kind', 'object_id', 'seq'], name='todo_changelog_object_idx'),
+        ),
+        # при откате выполняется первой, до удаления таблицы журнала
+        migrations.RunPython(migrations.RunPython.noop, drop_changelog_triggers),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2 on 2026-10-17 00:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('todo', '0012_changelog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTask',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='id задачи')),
+                ('title', models.CharField(max_length=100, verbose_name='Название')),
+                ('content', models.TextField(blank=True, verbose_name='Описание')),
+                ('created', models.DateTimeField(verbose_name='Дата создания')),
+                ('modified', models.DateTimeField(verbose_name='Дата изменения')),
+                ('deadline', models.DateTimeField(verbose_name='Дедлайн')),
+                ('done_time', models.DateTimeField(null=True, verbose_name='Дата и время завершения')),
+                ('status', models.BooleanField(default=True, verbose_name='Статус')),
+                ('priority', models.CharField(choices=[('high', 'high'), ('normal', 'normal'), ('low', 'low')], default='normal', max_length=10, verbose_name='Приоритет')),
+                ('archived', models.DateTimeField(verbose_name='Дата переноса в архив')),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='todo.category', verbose_name='Категория')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Создал')),
+            ],
+            options={
+                'verbose_name': 'Задача в архиве',
+                'verbose_name_plural': 'Архив задач',
+                'ordering': ['deadline'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedtask',
+            index=models.Index(fields=['owner', 'deadline', 'id'], name='todo_archive_owner_dl_idx'),
+        ),
+    ]
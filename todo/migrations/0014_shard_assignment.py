@@ -0,0 +1,27 @@
+# Generated by Django 3.2 on 2026-10-17 00:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('todo', '0013_archived_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShardAssignment',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='auth.user', verbose_name='Пользователь')),
+                ('alias', models.CharField(max_length=100, verbose_name='Алиас БД')),
+                ('moving', models.BooleanField(default=False, verbose_name='Идет перенос')),
+            ],
+            options={
+                'verbose_name': 'Шард пользователя',
+                'verbose_name_plural': 'Шарды пользователей',
+            },
+        ),
+    ]
@@ -1,4 +1,12 @@
-from django.db import models
+from django.db import models, router
+
+
+class TaskQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        from .shards import allocate_ids
+        objs = list(objs)
+        allocate_ids(self._db or router.db_for_write(self.model), objs)
+        return super().bulk_create(objs, *args, **kwargs)
 
 
 class Task(models.Model):
@@ -7,6 +15,7 @@ class Task(models.Model):
     title = models.CharField(max_length=100, verbose_name='Название')
     content = models.TextField(blank=True, verbose_name='Описание')
     created = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    modified = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
     deadline = models.DateTimeField(verbose_name='Дедлайн')
     done_time = models.DateTimeField(null=True, verbose_name='Дата и время завершения')
     owner = models.ForeignKey('auth.User', on_delete=models.CASCADE, default=None, verbose_name='Создал')
@@ -14,17 +23,200 @@ class Task(models.Model):
     priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, default='normal', verbose_name='Приоритет')
     category = models.ForeignKey('Category', null=True, on_delete=models.PROTECT, verbose_name='Категория')
 
+    # при шардировании id новых задач выдаются из диапазона БД записи (todo.shards.allocate_ids)
+    objects = TaskQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = 'Задачи'
         verbose_name = 'Задача'
         ordering = ['deadline']
+        indexes = [models.Index(fields=['owner', 'deadline', 'id'], name='todo_task_owner_deadline_idx'),
+                   models.Index(fields=['status', 'deadline', 'id'], name='todo_task_status_deadline_idx')]
+
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            from .shards import allocate_ids
+            allocate_ids(kwargs.get('using') or router.db_for_write(Task, instance=self), [self])
+        super().save(*args, **kwargs)
+
+
+class ArchivedTask(models.Model):
+    """
+    Выполненные задачи старше TODO_ARCHIVE['AGE_DAYS'], перенесенные из todo_task командой archive_tasks
+    (todo.archive). id сохраняется, поэтому ссылки клиентов на задачу остаются действительными
+    """
+    id = models.BigIntegerField(primary_key=True, verbose_name='id задачи')
+    title = models.CharField(max_length=100, verbose_name='Название')
+    content = models.TextField(blank=True, verbose_name='Описание')
+    created = models.DateTimeField(verbose_name='Дата создания')
+    modified = models.DateTimeField(verbose_name='Дата изменения')
+    deadline = models.DateTimeField(verbose_name='Дедлайн')
+    done_time = models.DateTimeField(null=True, verbose_name='Дата и время завершения')
+    owner = models.ForeignKey('auth.User', on_delete=models.CASCADE, verbose_name='Создал')
+    status = models.BooleanField(default=True, verbose_name='Статус')
+    priority = models.CharField(max_length=10, choices=Task.PRIORITY_CHOICES, default='normal',
+                                verbose_name='Приоритет')
+    category = models.ForeignKey('Category', null=True, on_delete=models.PROTECT, verbose_name='Категория')
+    archived = models.DateTimeField(verbose_name='Дата переноса в архив')
+
+    class Meta:
+        verbose_name_plural = 'Архив задач'
+        verbose_name = 'Задача в архиве'
+        ordering = ['deadline']
+        indexes = [models.Index(fields=['owner', 'deadline', 'id'], name='todo_archive_owner_dl_idx')]
+
+
+def normalize_category_name(name):
+    """
+    Ключ уникальности категории: имена, отличающиеся регистром и пробелами, - одна категория
+    """
+    return ' '.join(name.split()).lower()
 
 
 class Category(models.Model):
     name = models.CharField(max_length=20, verbose_name='Название категории')
+    # длиннее name: lower() некоторых символов дает две буквы
+    normalized = models.CharField(max_length=40, unique=True, editable=False,
+                                  verbose_name='Нормализованное название категории')
     user = models.ManyToManyField('auth.User', default=None, verbose_name='Пользователи категории')
 
     class Meta:
         verbose_name_plural = 'Категории'
         verbose_name = 'Категория'
         ordering = ['name']
+
+    def save(self, *args, **kwargs):
+        self.normalized = normalize_category_name(self.name)
+        super().save(*args, **kwargs)
+
+
+class TaskVersion(models.Model):
+    """
+    Версия набора задач и категорий пользователя, увеличивается при каждой записи.
+    По ней строятся ETag и Last-Modified списков без запроса самих задач.
+    """
+    owner = models.OneToOneField('auth.User', primary_key=True, on_delete=models.CASCADE, verbose_name='Пользователь')
+    version = models.PositiveBigIntegerField(default=0, verbose_name='Версия')
+    modified = models.DateTimeField(verbose_name='Дата изменения')
+    # токены синхронизации меньше горизонта ссылаются на удаленные при сжатии записи журнала изменений
+    sync_horizon = models.BigIntegerField(default=0, verbose_name='Горизонт журнала изменений')
+
+    class Meta:
+        verbose_name_plural = 'Версии задач пользователей'
+        verbose_name = 'Версия задач пользователя'
+
+
+class TaskCounter(models.Model):
+    """
+    Счетчик задач пользователя по ключу: open, done, priority:<приоритет>, category:<id категории>
+    и deadline:<дата> для открытых задач. Обновляется в той же транзакции, что и задачи (см. todo.counters).
+    """
+    owner = models.ForeignKey('auth.User', on_delete=models.CASCADE, verbose_name='Пользователь')
+    key = models.CharField(max_length=40, verbose_name='Ключ')
+    value = models.BigIntegerField(default=0, verbose_name='Значение')
+
+    class Meta:
+        verbose_name_plural = 'Счетчики задач пользователей'
+        verbose_name = 'Счетчик задач пользователя'
+        constraints = [models.UniqueConstraint(fields=['owner', 'key'], name='todo_taskcounter_owner_key')]
+
+
+class TaskReminder(models.Model):
+    """
+    Отправленное напоминание о дедлайне задачи. Записывается вместе с передачей напоминания в sink,
+    поэтому сканер дедлайнов (todo.deadlines) не напоминает дважды об одном дедлайне.
+    """
+    task = models.ForeignKey('Task', on_delete=models.CASCADE, verbose_name='Задача')
+    deadline = models.DateTimeField(verbose_name='Дедлайн')
+    sent = models.DateTimeField(verbose_name='Отправлено')
+
+    class Meta:
+        verbose_name_plural = 'Напоминания о дедлайнах'
+        verbose_name = 'Напоминание о дедлайне'
+        constraints = [models.UniqueConstraint(fields=['task', 'deadline'], name='todo_taskreminder_task_deadline')]
+        indexes = [models.Index(fields=['deadline', 'task'], name='todo_taskreminder_deadline_idx')]
+
+
+class TaskImport(models.Model):
+    STATUS_CHOICES = [('running', 'running'), ('done', 'done'), ('failed', 'failed')]
+
+    owner = models.ForeignKey('auth.User', on_delete=models.CASCADE, verbose_name='Пользователь')
+    format = models.CharField(max_length=10, verbose_name='Формат')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running', verbose_name='Статус')
+    processed = models.PositiveIntegerField(default=0, verbose_name='Обработано строк')
+    created = models.PositiveIntegerField(default=0, verbose_name='Создано задач')
+    rejected = models.PositiveIntegerField(default=0, verbose_name='Отклонено строк')
+    errors = models.JSONField(default=list, verbose_name='Ошибки отклоненных строк')
+    started = models.DateTimeField(auto_now_add=True, verbose_name='Начало')
+    finished = models.DateTimeField(null=True, verbose_name='Окончание')
+
+    class Meta:
+        verbose_name_plural = 'Импорты задач'
+        verbose_name = 'Импорт задач'
+        ordering = ['-started']
+
+
+class Job(models.Model):
+    """
+    Фоновая операция над задачами пользователя в очереди в БД: выполняется рабочим процессом
+    manage.py run_jobs пачками в отдельных транзакциях (см. todo.jobs)
+    """
+    KIND_CHOICES = [('category_rename', 'category_rename'), ('category_delete', 'category_delete')]
+    STATUS_CHOICES = [('queued', 'queued'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')]
+
+    owner = models.ForeignKey('auth.User', on_delete=models.CASCADE, verbose_name='Пользователь')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='Операция')
+    params = models.JSONField(default=dict, verbose_name='Параметры')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', verbose_name='Статус')
+    total = models.PositiveIntegerField(default=0, verbose_name='Задач при постановке')
+    processed = models.PositiveIntegerField(default=0, verbose_name='Обработано задач')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    locked_until = models.DateTimeField(null=True, verbose_name='Занята рабочим процессом до')
+    created = models.DateTimeField(auto_now_add=True, verbose_name='Поставлена')
+    started = models.DateTimeField(null=True, verbose_name='Начало')
+    finished = models.DateTimeField(null=True, verbose_name='Окончание')
+
+    class Meta:
+        verbose_name_plural = 'Фоновые операции'
+        verbose_name = 'Фоновая операция'
+        ordering = ['-id']
+        indexes = [models.Index(fields=['status', 'id'], name='todo_job_status_idx')]
+
+
+class ChangeLog(models.Model):
+    """
+    Журнал изменений задач и связей пользователя с категориями для синхронизации клиентов (todo.changelog).
+    Пишется триггерами SQLite на всех путях записи, seq монотонно растет (AUTOINCREMENT).
+    """
+    KIND_CHOICES = [('task', 'task'), ('category', 'category')]
+
+    seq = models.BigAutoField(primary_key=True, verbose_name='Номер')
+    # без ограничения внешнего ключа: триггеры пишут удаление задач и в момент удаления самого пользователя
+    owner = models.ForeignKey('auth.User', on_delete=models.DO_NOTHING, db_constraint=False,
+                              verbose_name='Пользователь')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name='Объект')
+    object_id = models.BigIntegerField(verbose_name='id объекта')
+    deleted = models.BooleanField(default=False, verbose_name='Удален')
+    created = models.DateTimeField(verbose_name='Время изменения')
+
+    class Meta:
+        verbose_name_plural = 'Журнал изменений'
+        verbose_name = 'Запись журнала изменений'
+        indexes = [models.Index(fields=['owner', 'seq'], name='todo_changelog_owner_seq_idx'),
+                   models.Index(fields=['kind', 'object_id', 'seq'], name='todo_changelog_object_idx')]
+
+
+class ShardAssignment(models.Model):
+    """
+    Шард БД, в котором лежат задачи, категории, счетчики и журнал пользователя (todo.shards). Пишется при
+    создании пользователя по хешу id и меняется командой rebalance_shards. Пользователи без записи остались
+    в основной БД. moving - идет перенос, запись пользователю закрыта
+    """
+    user = models.OneToOneField('auth.User', primary_key=True, on_delete=models.CASCADE, verbose_name='Пользователь')
+    alias = models.CharField(max_length=100, verbose_name='Алиас БД')
+    moving = models.BooleanField(default=False, verbose_name='Идет перенос')
+
+    class Meta:
+        verbose_name_plural = 'Шарды пользователей'
+        verbose_name = 'Шард пользователя'
@@ -0,0 +1,117 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from datetime import datetime
+from urllib import parse
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная пагинация по ключу (deadline, id), совпадающему с Task.Meta.ordering.
+    Каждая страница - поиск диапазона по индексу (owner, deadline, id) без OFFSET и COUNT(*).
+    Работает и с моделями, и со словарями .values().
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def get_page_size(self, request):
+        return api_settings.PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        position, self.reverse = self.decode_cursor(request)
+        if self.reverse:
+            queryset = queryset.order_by('-deadline', '-id')
+            if position is not None:
+                deadline, pk = position
+                queryset = queryset.filter(Q(deadline__lt=deadline) | Q(deadline=deadline, id__lt=pk))
+        else:
+            queryset = queryset.order_by('deadline', 'id')
+            if position is not None:
+                deadline, pk = position
+                queryset = queryset.filter(Q(deadline__gt=deadline) | Q(deadline=deadline, id__gt=pk))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, instance, reverse):
+        if isinstance(instance, dict):
+            deadline, pk = instance['deadline'], instance['id']
+        else:
+            deadline, pk = instance.deadline, instance.id
+        tokens = {'d': deadline.isoformat(), 'i': pk}
+        if reverse:
+            tokens['r'] = '1'
+        encoded = urlsafe_b64encode(parse.urlencode(tokens).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            tokens = parse.parse_qs(urlsafe_b64decode(encoded.encode('ascii')).decode('ascii'), strict_parsing=True)
+            position = datetime.fromisoformat(tokens['d'][0]), int(tokens['i'][0])
+            reverse = tokens.get('r', ['0'])[0] == '1'
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+
+class TaskPagination(BasePagination):
+    """
+    По умолчанию курсорная пагинация. Постраничный режим (?page=N) оставлен для обратной совместимости,
+    он же используется для поиска без курсора, т.к. результаты поиска упорядочены по релевантности.
+    """
+    page_query_param = 'page'
+    search_param = api_settings.SEARCH_PARAM
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.page_query_param in request.query_params or (
+                self.search_param in request.query_params and
+                KeysetPagination.cursor_query_param not in request.query_params):
+            self.paginator = PageNumberPagination()
+        else:
+            self.paginator = KeysetPagination()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
@@ -0,0 +1,120 @@
+import asyncio
+import cProfile
+import json
+import random
+import re
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+
+SALT = 'todo.profiling'
+
+
+def _options():
+    return getattr(settings, 'TODO_PROFILING', {})
+
+
+def make_token(username='*'):
+    """
+    Подписанное значение заголовка профилирования для пользователя username, '*' - для любого
+    """
+    return signing.TimestampSigner(salt=SALT).sign(username)
+
+
+def token_user(request):
+    """
+    Имя пользователя из подписанного заголовка, None при отсутствии, неверной подписи или истекшем сроке
+    """
+    options = _options()
+    token = request.META.get(options.get('HEADER', 'HTTP_X_TODO_PROFILE'))
+    if not token:
+        return None
+    try:
+        return signing.TimestampSigner(salt=SALT).unsign(token, max_age=options.get('TOKEN_MAX_AGE', 3600))
+    except signing.BadSignature:
+        return None
+
+
+def should_profile(request):
+    """
+    Запрос профилируется при ENABLED по подписанному заголовку или случайно с вероятностью SAMPLE_RATE.
+    Возвращает имя из заголовка, '*' для выборки или None
+    """
+    options = _options()
+    if not options.get('ENABLED', False):
+        return None
+    username = token_user(request)
+    if username is not None:
+        return username
+    sample_rate = options.get('SAMPLE_RATE', 0)
+    return '*' if sample_rate and random.random() < sample_rate else None
+
+
+def run_profiled(username, func, request, *args, **kwargs):
+    """
+    Выполняет func под cProfile и сохраняет профиль, если пользователь запроса совпал с заголовком
+    """
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        response = func(request, *args, **kwargs)
+    finally:
+        profiler.disable()
+    duration = time.perf_counter() - start
+    # DRF аутентифицирует пользователя в представлении, поэтому владелец заголовка проверяется после него
+    user = getattr(request, 'user', None)
+    user_id = user.id if user is not None and user.is_authenticated else None
+    if username == '*' or user is not None and user.is_authenticated and user.get_username() == username:
+        save_profile(profiler, request, response, duration, user_id)
+    return response
+
+
+def save_profile(profiler, request, response, duration, user_id):
+    """
+    <каталог>/<время>-<маршрут>-<пользователь>-<id>.prof и рядом .json с метаданными запроса
+    """
+    directory = Path(_options().get('DIRECTORY', settings.BASE_DIR / 'profiles'))
+    directory.mkdir(parents=True, exist_ok=True)
+    match = getattr(request, 'resolver_match', None)
+    route = match.route if match else None
+    slug = re.sub(r'[^\w]+', '_', route or 'unresolved').strip('_') or 'root'
+    name = f'{time.strftime("%Y%m%dT%H%M%S")}-{slug}-{user_id or "anon"}-{uuid.uuid4().hex[:8]}'
+    profiler.dump_stats(directory / f'{name}.prof')
+    (directory / f'{name}.json').write_text(json.dumps({
+        'route': route, 'method': request.method, 'path': request.get_full_path(), 'user': user_id,
+        'status': response.status_code, 'duration_ms': round(duration * 1000, 2),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }, ensure_ascii=False))
+    return directory / f'{name}.prof'
+
+
+class ProfilingMiddleware:
+    """
+    Профилирование отдельных запросов в production (TODO_PROFILING). Под WSGI профилируется весь
+    оставшийся стек обработки, под ASGI запрос помечается и профилируется представление в потоке
+    todo.async_views, синхронные представления под ASGI не профилируются.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        username = should_profile(request)
+        if username is None:
+            return self.get_response(request)
+        return run_profiled(username, self.get_response, request)
+
+    async def __acall__(self, request):
+        request.todo_profile = should_profile(request)
+        return await self.get_response(request)
@@ -0,0 +1,47 @@
+import msgpack
+from django.http.multipartparser import parse_header
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def columnar(items):
+    """
+    Список словарей с одинаковыми ключами в виде {'columns': [ключи], 'rows': [[значения по порядку ключей]]}:
+    имена полей передаются один раз на страницу, а не в каждой задаче
+    """
+    columns = list(items[0]) if items else []
+    return {'columns': columns, 'rows': [[item[column] for column in columns] for item in items]}
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Ответ в MessagePack для внутренних клиентов, выбирается по Accept: application/msgpack или ?format=msgpack.
+    Даты - нативные Timestamp MessagePack: сериализаторы с NativeDateTimeMixin отдают этому рендереру
+    объекты datetime вместо строк ISO 8601. Accept: application/msgpack; columnar=1 - списки и страницы
+    списков в колоночном виде (columnar)
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    native_datetime = True
+    # типы, которых нет в MessagePack (ленивые строки, Decimal, даты без времени), кодируются как в JSON
+    _encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # заголовки приходят в latin-1 (WSGI), значения параметров parse_header возвращает байтами
+        _, params = parse_header((accepted_media_type or self.media_type).encode('latin-1'))
+        if params.get('columnar') in (b'1', b'true'):
+            data = self.to_columnar(data)
+        return msgpack.packb(data, datetime=True, default=self._encoder.default)
+
+    @staticmethod
+    def to_columnar(data):
+        if isinstance(data, list) and all(isinstance(item, dict) for item in data):
+            return columnar(data)
+        if isinstance(data, dict) and isinstance(data.get('results'), list) \
+                and all(isinstance(item, dict) for item in data['results']):
+            return {**data, 'results': columnar(data['results'])}
+        return data
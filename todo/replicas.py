@@ -0,0 +1,91 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework import permissions
+
+# реплика, с которой читает текущий запрос, None - основная БД
+_read_alias = ContextVar('todo_read_alias', default=None)
+
+
+def _options():
+    return getattr(settings, 'TODO_REPLICAS', {})
+
+
+def replica_aliases():
+    return _options().get('DATABASES', [])
+
+
+def _pin_key(user_id):
+    return f'todo:primary:{user_id}'
+
+
+def pin_cache():
+    """
+    Кеш меток чтения из основной БД. Следующий запрос пользователя может попасть в другой процесс сервера,
+    поэтому локальный для процесса кеш (LocMemCache) или DummyCache с репликами не допускаются
+    """
+    alias = _options().get('CACHE', 'default')
+    cache = caches[alias]
+    if isinstance(cache, (LocMemCache, DummyCache)):
+        raise ImproperlyConfigured(f'TODO_REPLICAS["CACHE"]: кеш {alias} ({type(cache).__name__}) не общий '
+                                   f'для процессов сервера, задайте общий кеш (файловый, Redis, Memcached)')
+    return cache
+
+
+def pin_primary(user_id):
+    """
+    Чтения пользователя STICKY_SECONDS секунд идут в основную БД, пока реплики догоняют его запись.
+    Вызывается из versions.touch, т.е. на всех путях записи, включая фоновые операции
+    """
+    options = _options()
+    if options.get('DATABASES'):
+        pin_cache().set(_pin_key(user_id), True, options.get('STICKY_SECONDS', 5))
+
+
+def is_pinned(user_id):
+    return bool(pin_cache().get(_pin_key(user_id)))
+
+
+class ReplicaRouter:
+    """
+    Чтения запроса, отмеченного ReplicaReadMixin, идут в выбранную для него реплику, остальные чтения
+    и все записи - в основную БД. Реплики не мигрируются: схема и данные приходят репликацией
+    """
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        # объекты, прочитанные с реплики, помнят ее в _state.db, но пишутся все равно в основную БД
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db in replica_aliases() else None
+
+
+class ReplicaReadMixin:
+    """
+    Безопасные запросы представления читают из случайной реплики TODO_REPLICAS['DATABASES'], кроме
+    пользователей, недавно писавших в БД. Реплика выбирается после аутентификации и до условных
+    заголовков (ETag, Last-Modified), поэтому они и тело ответа строятся по одной БД
+    """
+    def dispatch(self, request, *args, **kwargs):
+        token = _read_alias.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        aliases = replica_aliases()
+        if aliases and request.method in permissions.SAFE_METHODS and not is_pinned(request.user.id):
+            _read_alias.set(random.choice(aliases))
@@ -0,0 +1,83 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from .versions import get_version
+
+
+class ResponseCache:
+    """
+    Кеш готовых ответов списков задач во фреймворке кеширования Django.
+    Ключ содержит пользователя, его версию задач (TaskVersion), путь с параметрами (период, поиск, страница)
+    и Accept. Любая запись пользователя увеличивает версию, поэтому старые ответы просто перестают читаться
+    и вытесняются по TIMEOUT.
+    """
+    key_prefix = 'todo:response'
+
+    def __init__(self, backend='default', timeout=300):
+        self.backend_alias = backend
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.backend_alias]
+
+    def make_key(self, request):
+        version = get_version(request)
+        path = f'{request.get_full_path()}:{request.META.get("HTTP_ACCEPT", "")}'
+        return f'{self.key_prefix}:{request.user.id}:{version.version if version else 0}:' \
+               f'{hashlib.md5(path.encode()).hexdigest()}'
+
+    def get(self, request):
+        cached = self.cache.get(self.make_key(request))
+        self.count('hits' if cached is not None else 'misses')
+        if cached is None:
+            return None
+        content, content_type = cached
+        return HttpResponse(content, content_type=content_type)
+
+    def set(self, request, response):
+        key = self.make_key(request)
+
+        def store(rendered):
+            if rendered.status_code == 200:
+                self.cache.set(key, (rendered.content, rendered['Content-Type']), self.timeout)
+
+        response.add_post_render_callback(store)
+
+    def count(self, name):
+        key = f'{self.key_prefix}:{name}'
+        self.cache.add(key, 0, None)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 1, None)
+
+    def stats(self):
+        counters = self.cache.get_many([f'{self.key_prefix}:hits', f'{self.key_prefix}:misses'])
+        hits = counters.get(f'{self.key_prefix}:hits', 0)
+        misses = counters.get(f'{self.key_prefix}:misses', 0)
+        return {'hits': hits, 'misses': misses, 'hit_ratio': hits / (hits + misses) if hits + misses else None}
+
+
+def _cache_from_settings():
+    options = getattr(settings, 'TODO_RESPONSE_CACHE', {})
+    return ResponseCache(backend=options.get('BACKEND', 'default'), timeout=options.get('TIMEOUT', 300))
+
+
+response_cache = _cache_from_settings()
+
+
+class CachedListMixin:
+    """
+    готовые ответы списка берутся из response_cache, при промахе ответ кешируется после рендеринга
+    """
+    def list(self, request, *args, **kwargs):
+        cached = response_cache.get(request)
+        if cached is not None:
+            return cached
+        result = super().list(request, *args, **kwargs)
+        response_cache.set(request, result)
+        return result
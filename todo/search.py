@@ -0,0 +1,104 @@
+from django.db import connections
+from rest_framework import filters
+
+FTS_TABLE = 'todo_task_fts'
+
+# Индекс заполняется триггерами, поэтому в синхронизации участвуют все пути записи, включая bulk_create
+# и массовые UPDATE. Триггеры пересоздаются после каждой миграции, т.к. SQLite удаляет их при пересборке таблицы.
+INSTALL_SQL = [
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON todo_task BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, content, category)
+        VALUES (new.id, new.title, new.content, (SELECT name FROM todo_category WHERE id = new.category_id));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON todo_task BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, content, category_id ON todo_task BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE}(rowid, title, content, category)
+        VALUES (new.id, new.title, new.content, (SELECT name FROM todo_category WHERE id = new.category_id));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_category_au AFTER UPDATE OF name ON todo_category BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT id FROM todo_task WHERE category_id = new.id);
+        INSERT INTO {FTS_TABLE}(rowid, title, content, category)
+        SELECT id, title, content, new.name FROM todo_task WHERE category_id = new.id;
+    END""",
+]
+
+
+def is_supported(using='default'):
+    return connections[using].vendor == 'sqlite'
+
+
+def install_index(using='default'):
+    """
+    Создает FTS5 таблицу и триггеры синхронизации, если их еще нет. Новая таблица сразу заполняется.
+    """
+    if not is_supported(using):
+        return
+    connection = connections[using]
+    tables = connection.introspection.table_names()
+    if 'todo_task' not in tables:
+        return
+    with connection.cursor() as cursor:
+        if FTS_TABLE not in tables:
+            cursor.execute(f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(title, content, category, tokenize='trigram')")
+            rebuild_index(using)
+        for sql in INSTALL_SQL:
+            cursor.execute(sql)
+
+
+def rebuild_index(using='default'):
+    """
+    Полностью перестраивает индекс по таблице задач, возвращает число проиндексированных задач
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(f"""INSERT INTO {FTS_TABLE}(rowid, title, content, category)
+                           SELECT t.id, t.title, t.content, c.name
+                           FROM todo_task t LEFT JOIN todo_category c ON c.id = t.category_id""")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT count(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def build_match(terms):
+    """
+    Каждый термин ищется как подстрока (trigram), все термины должны найтись - как и в SearchFilter
+    """
+    return ' AND '.join('"%s"' % term.replace('"', '""') for term in terms)
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    Поиск по FTS5 индексу с ранжированием по bm25.
+    Для других СУБД и терминов короче трех символов (меньше одной триграммы) используется обычный SearchFilter.
+    """
+    min_term_length = 3
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        if not is_supported(queryset.db) or any(len(term) < self.min_term_length for term in terms):
+            return super().filter_queryset(request, queryset, view)
+        # Унарный плюс скрывает условие на rowid от FTS5: иначе SQLite может выбрать задачи внешней таблицей
+        # соединения и выполнять MATCH заново для каждой задачи пользователя.
+        return queryset.extra(
+            select={'search_rank': f'bm25({FTS_TABLE})'},
+            tables=[FTS_TABLE],
+            where=[f'+{FTS_TABLE}.rowid = todo_task.id', f'{FTS_TABLE} MATCH %s'],
+            params=[build_match(terms)],
+            order_by=['search_rank', 'deadline', 'id'],
+        )
+
+
+def optimize_index(using='default'):
+    """
+    Сливает сегменты индекса. После массового удаления задач (перенос в архив) поиск по несжатому индексу
+    проходит и записи удаленных строк
+    """
+    if not is_supported(using) or FTS_TABLE not in connections[using].introspection.table_names():
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
@@ -1,15 +1,88 @@
-from rest_framework import serializers
+from rest_framework import ISO_8601, exceptions, serializers
+from rest_framework.settings import api_settings
+from django.conf import settings
+from django.urls import reverse
 from django.utils import timezone
-from .models import Task, Category
+from .models import Task, Category, TaskImport, Job, ArchivedTask
+from .categories import intern_category, prepare_categories, resolve_categories, resolve_category
+from .versions import touch
+from .counters import CounterDelta, task_state
+from .instrumentation import timed
+from .jobs import enqueue
+from .shards import atomic, lock
 
 
-class TaskSerializer(serializers.ModelSerializer):
+def bulk_create_tasks(user, validated_data, batch_size=None):
+    """
+    Массовое создание задач пользователя из данных, провалидированных TaskSerializer: категории разрешаются
+    несколькими запросами на весь список, задачи пишутся через bulk_create пачками в одной транзакции.
+    """
+    batch_size = batch_size or getattr(settings, 'TODO_BULK_BATCH_SIZE', 500)
+    names = {item['category']['name'] for item in validated_data}
+    prepare_categories(user, names)
+    with atomic():
+        categories = resolve_categories(user, names)
+        tasks = [Task(**{**item, 'owner': user, 'category': categories[item['category']['name']]})
+                 for item in validated_data]
+        tasks = Task.objects.bulk_create(tasks, batch_size=batch_size)
+        delta = CounterDelta()
+        for task in tasks:
+            delta.add(user.id, task_state(task))
+        delta.apply()
+        touch(user.id)
+        return tasks
+
+
+def locked_state(alias, task):
+    """
+    Перечитывает задачу под блокировкой записи транзакции БД alias и возвращает ее состояние для счетчиков.
+    Задача запроса загружена до транзакции: параллельная запись могла изменить ее, и изменение счетчиков
+    от старого состояния учло бы переход дважды
+    """
+    lock(alias)
+    try:
+        task.refresh_from_db(using=alias)
+    except Task.DoesNotExist:
+        raise exceptions.NotFound()
+    return task_state(task)
+
+
+class TimedSerializerMixin:
+    """
+    время to_representation попадает в метрику serializer запроса (см. instrumentation)
+    """
+    def to_representation(self, instance):
+        with timed('serializer'):
+            return super().to_representation(instance)
+
+
+class NativeDateTimeMixin:
+    """
+    даты отдаются объектами datetime, если рендерер запроса кодирует их сам (native_datetime, см. todo.renderers)
+    """
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if getattr(getattr(request, 'accepted_renderer', None), 'native_datetime', False):
+            for field in fields.values():
+                if isinstance(field, serializers.DateTimeField):
+                    field.format = None
+        return fields
+
+
+class TaskBulkSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        return bulk_create_tasks(self.context['request'].user, validated_data)
+
+
+class TaskSerializer(NativeDateTimeMixin, TimedSerializerMixin, serializers.ModelSerializer):
     category = serializers.CharField(max_length=20, label='Категория', source='category.name')
 
     class Meta:
         model = Task
         fields = ['id', 'title', 'content', 'deadline', 'category', 'status', 'priority']
         read_only_fields = ['id', 'status']
+        list_serializer_class = TaskBulkSerializer
 
     def validate(self, data):
         if data['deadline'] < timezone.now():
@@ -18,15 +91,73 @@ class TaskSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         user = self.context['request'].user
-        category, created = Category.objects.get_or_create(name=validated_data.pop('category')['name'])
-        if not user.category_set.filter(name=category.name).exists():
-            category.user.add(user)
-            category.save()
-        task = Task.objects.create(**validated_data, category=category)
+        name = validated_data.pop('category')['name']
+        prepare_categories(user, [name])
+        with atomic():
+            category = resolve_category(user, name)
+            task = Task.objects.create(**validated_data, category=category)
+            CounterDelta().add(user.id, task_state(task)).apply()
+            touch(user.id)
         return task
 
 
-class TaskDeteilSerializer(serializers.ModelSerializer):
+class TaskListFastSerializer:
+    """
+    Быстрое представление списка задач из словарей .values() без полей и моделей DRF.
+    Соответствие полей собирается один раз по полям TaskSerializer, поэтому вывод совпадает с ним байт в байт:
+    поля, не меняющие значение (строки, числа, bool, choices), копируются, даты в ISO 8601 форматируются
+    с часовым поясом, определенным один раз на весь список, остальные - to_representation поля TaskSerializer.
+    native_datetime - даты без форматирования, как у TaskSerializer с рендерером MessagePack.
+    """
+    identity_fields = (serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+                       serializers.ChoiceField)
+    _mapping = None
+
+    def __init__(self, rows, native_datetime=False):
+        self.rows = rows
+        self.native_datetime = native_datetime
+
+    @classmethod
+    def get_mapping(cls):
+        if cls._mapping is None:
+            cls._mapping = [(name, field.source.replace('.', '__'), field)
+                            for name, field in TaskSerializer().fields.items()]
+        return cls._mapping
+
+    @classmethod
+    def values_fields(cls):
+        return [source for name, source, field in cls.get_mapping()]
+
+    def get_converter(self, field):
+        if type(field) in self.identity_fields:
+            return None
+        if type(field) is serializers.DateTimeField and self.native_datetime:
+            return None
+        if type(field) is serializers.DateTimeField:
+            output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+            tz = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+            if output_format and output_format.lower() == ISO_8601 and tz is not None:
+                def convert(value):
+                    value = value.astimezone(tz).isoformat()
+                    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+                return convert
+        return field.to_representation
+
+    @property
+    def data(self):
+        with timed('serializer'):
+            mapping = [(name, source, self.get_converter(field)) for name, source, field in self.get_mapping()]
+            data = []
+            for row in self.rows:
+                item = {}
+                for name, source, convert in mapping:
+                    value = row[source]
+                    item[name] = value if convert is None or value is None else convert(value)
+                data.append(item)
+            return data
+
+
+class TaskDeteilSerializer(NativeDateTimeMixin, TimedSerializerMixin, serializers.ModelSerializer):
     category = serializers.CharField(max_length=20, label='Категория', source='category.name')
 
     class Meta:
@@ -40,33 +171,120 @@ class TaskDeteilSerializer(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         user = self.context['request'].user
-        category, created = Category.objects.get_or_create(name=validated_data.get('category')['name'])
-        if not user.category_set.filter(name=category.name).exists():
-            category.user.add(user)
-            category.save()
-        instance.title = validated_data.get('title', instance.title)
-        instance.content = validated_data.get('content', instance.content)
-        instance.deadline = validated_data.get('deadline', instance.deadline)
-        instance.category = category
-        instance.status = validated_data.get('status', instance.status)
-        instance.priority = validated_data.get('priority', instance.priority)
-        instance.save()
+        name = validated_data.get('category')['name']
+        prepare_categories(user, [name])
+        with atomic() as alias:
+            before = locked_state(alias, instance)
+            category = resolve_category(user, name)
+            instance.title = validated_data.get('title', instance.title)
+            instance.content = validated_data.get('content', instance.content)
+            instance.deadline = validated_data.get('deadline', instance.deadline)
+            instance.category = category
+            instance.status = validated_data.get('status', instance.status)
+            instance.priority = validated_data.get('priority', instance.priority)
+            instance.save()
+            CounterDelta().change(instance.owner_id, before, task_state(instance)).apply()
+            touch(user.id)
         return instance
 
 
-class TaskFieldUpdateSerializer(serializers.ModelSerializer):
+class TaskFieldUpdateSerializer(NativeDateTimeMixin, TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Task
         fields = ['status', 'priority', 'done_time']
 
+    def update(self, instance, validated_data):
+        with atomic() as alias:
+            before = locked_state(alias, instance)
+            instance = super().update(instance, validated_data)
+            CounterDelta().change(instance.owner_id, before, task_state(instance)).apply()
+        return instance
+
+
+class TaskBulkFilterSerializer(serializers.Serializer):
+    category = serializers.CharField(max_length=20, required=False)
+    status = serializers.BooleanField(required=False)
+    priority = serializers.ChoiceField(choices=Task.PRIORITY_CHOICES, required=False)
+    deadline_after = serializers.DateTimeField(required=False)
+    deadline_before = serializers.DateTimeField(required=False)
+
+
+class TaskBulkUpdateSerializer(serializers.Serializer):
+    """
+    Массовое изменение статуса и/или приоритета задач по списку id или по фильтру.
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    filter = TaskBulkFilterSerializer(required=False)
+    status = serializers.BooleanField(required=False)
+    priority = serializers.ChoiceField(choices=Task.PRIORITY_CHOICES, required=False)
 
-class TaskCopySerializer(serializers.ModelSerializer):
+    def validate(self, data):
+        if ('ids' in data) == ('filter' in data):
+            raise serializers.ValidationError('Нужно указать либо ids, либо filter')
+        if 'status' not in data and 'priority' not in data:
+            raise serializers.ValidationError('Нужно указать status и/или priority')
+        return data
+
+    def get_queryset(self, user):
+        queryset = Task.objects.filter(owner=user)
+        if 'ids' in self.validated_data:
+            return queryset.filter(pk__in=self.validated_data['ids'])
+        lookups = {'category': 'category__name', 'status': 'status', 'priority': 'priority',
+                   'deadline_after': 'deadline__gte', 'deadline_before': 'deadline__lte'}
+        return queryset.filter(**{lookups[key]: value for key, value in self.validated_data['filter'].items()})
+
+    def get_changes(self):
+        changes = {}
+        if 'status' in self.validated_data:
+            changes['status'] = self.validated_data['status']
+            changes['done_time'] = timezone.now() if changes['status'] else None
+        if 'priority' in self.validated_data:
+            changes['priority'] = self.validated_data['priority']
+        changes['modified'] = timezone.now()
+        return changes
+
+
+class TaskCopySerializer(NativeDateTimeMixin, TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Task
         fields = '__all__'
 
+    def create(self, validated_data):
+        with atomic():
+            task = super().create(validated_data)
+            CounterDelta().add(task.owner_id, task_state(task)).apply()
+        return task
+
+
+class ArchivedTaskSerializer(NativeDateTimeMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    category = serializers.CharField(label='Категория', source='category.name', default=None, read_only=True)
+
+    class Meta:
+        model = ArchivedTask
+        fields = ['id', 'title', 'content', 'deadline', 'category', 'status', 'priority', 'done_time', 'archived']
+        read_only_fields = fields
+
+
+class TaskImportSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = TaskImport
+        fields = ['id', 'format', 'status', 'processed', 'created', 'rejected', 'errors', 'started', 'finished']
+
+
+class JobSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ['id', 'url', 'kind', 'status', 'total', 'processed', 'error', 'created', 'started', 'finished']
+
+    def get_url(self, obj):
+        request = self.context.get('request')
+        path = reverse('job-detail', kwargs={'pk': obj.pk})
+        return request.build_absolute_uri(path) if request is not None else path
+
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Удаление категорий не выполняется, т.к. категории общие для многих пользователей при совпадении имен категорий.
     Удаляется только свзять категории и пользователя.
@@ -77,20 +295,28 @@ class CategorySerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         user = self.context['request'].user
-        category, created = Category.objects.get_or_create(name=validated_data.get('name'))
+        category = intern_category(validated_data.get('name'))
         category.user.add(user)
         category.save()
         return category
 
     def update(self, instance, validated_data):
+        """
+        Пользователь сразу переходит в новую категорию, а задачи переносятся фоновой операцией self.job.
+        Имя, отличающееся только регистром и пробелами, - та же категория, операция не нужна.
+        Категория создается до транзакции шарда пользователя (см. prepare_categories)
+        """
         user = self.context['request'].user
-        new_category, created = Category.objects.get_or_create(name=validated_data.get('name'))
-        Task.objects.select_related('owner', 'category').filter(category=instance, owner=user)\
-            .update(category=new_category)
-        new_category.user.add(user)
-        new_category.save()
-        instance.user.remove(user)
-        instance.save()
+        self.job = None
+        new_category = intern_category(validated_data.get('name'))
+        if new_category.id == instance.id:
+            return instance
+        with atomic():
+            self.job = enqueue(user, 'category_rename', instance, new_category=new_category.id)
+            new_category.user.add(user)
+            new_category.save()
+            instance.user.remove(user)
+            instance.save()
         return new_category
 
 
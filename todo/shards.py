@@ -0,0 +1,398 @@
+import hashlib
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.utils import timezone
+from rest_framework import exceptions, permissions
+
+from .models import ArchivedTask, Category, ChangeLog, Job, ShardAssignment, Task, TaskCounter, TaskReminder, \
+    TaskVersion
+
+# шард, с которым работает текущий запрос или фоновая операция, None - основная БД
+_current = ContextVar('todo_shard', default=None)
+# в шард идут запросы ко всем моделям, а не только к данным пользователей (миграции шарда)
+_all_models = ContextVar('todo_shard_all_models', default=False)
+# пользователь запроса (ShardMixin): его транзакции записи проверяют, что он не переносится (atomic)
+_owner = ContextVar('todo_shard_owner', default=None)
+# БД, в транзакции которой каталог уже проверен: вложенные atomic() не проверяют его повторно
+_verified = ContextVar('todo_shard_verified', default=None)
+
+# данные пользователя: лежат только в его шарде
+SHARDED_MODELS = {'todo.task', 'todo.category_user', 'todo.taskversion', 'todo.taskcounter', 'todo.changelog',
+                  'todo.taskreminder', 'todo.archivedtask'}
+# справочные таблицы: пишутся в основную БД и копируются в шарды (mirror), читаются из шарда запроса,
+# чтобы JOIN задач с категориями и пользователями выполнялся в одной БД
+REFERENCE_MODELS = {'auth.user', 'todo.category'}
+
+# у каждого шарда свой диапазон id задач, id остаются уникальными во всех БД
+ID_RANGE = 1 << 40
+
+
+def _options():
+    return getattr(settings, 'TODO_SHARDS', {})
+
+
+def shard_aliases():
+    return _options().get('DATABASES', [])
+
+
+def is_enabled():
+    return bool(shard_aliases())
+
+
+def all_aliases():
+    """
+    Все БД с данными пользователей: основная (пользователи, еще не перенесенные rebalance_shards) и шарды
+    """
+    return [DEFAULT_DB_ALIAS, *shard_aliases()]
+
+
+@contextmanager
+def use_shard(alias, all_models=False):
+    token, all_token = _current.set(alias), _all_models.set(all_models)
+    try:
+        yield alias
+    finally:
+        _current.reset(token)
+        _all_models.reset(all_token)
+
+
+def current_alias():
+    return _current.get() or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def atomic():
+    """
+    transaction.atomic() в БД задач текущего шарда, отдает ее алиас. В запросе (ShardMixin) транзакция сразу
+    берет блокировку записи БД и заново читает каталог: запись, пользователя которой move_user начал переносить
+    после начала запроса, отклоняется с 503, а не теряется при очистке источника
+    """
+    alias = router.db_for_write(Task)
+    with transaction.atomic(using=alias):
+        user_id = _owner.get()
+        if user_id is None or _verified.get() == alias:
+            yield alias
+            return
+        lock(alias)
+        current, moving = locate(user_id)
+        if moving or current != alias:
+            raise UserMoving()
+        token = _verified.set(alias)
+        try:
+            yield alias
+        finally:
+            _verified.reset(token)
+
+
+def lock(alias):
+    """
+    Берет блокировку записи SQLite в текущей транзакции БД alias: пустой UPDATE держит ее до конца транзакции
+    """
+    with connections[alias].cursor() as cursor:
+        cursor.execute(f'UPDATE {Task._meta.db_table} SET id = id WHERE 1 = 0')
+
+
+def placement(user_id):
+    """
+    Шард нового пользователя по хешу id
+    """
+    aliases = shard_aliases()
+    digest = hashlib.blake2b(str(user_id).encode(), digest_size=8).digest()
+    return aliases[int.from_bytes(digest, 'big') % len(aliases)]
+
+
+def locate(user_id):
+    """
+    (алиас БД пользователя, идет ли перенос). Каталог читается из основной БД при каждом запросе,
+    поэтому переключение после rebalance_shards видно всем процессам сразу
+    """
+    if not is_enabled():
+        return DEFAULT_DB_ALIAS, False
+    row = ShardAssignment.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).values_list('alias', 'moving').first()
+    return row or (DEFAULT_DB_ALIAS, False)
+
+
+def shard_for(user_id):
+    return locate(user_id)[0]
+
+
+def group_by_shard(user_ids):
+    if not is_enabled():
+        return {DEFAULT_DB_ALIAS: list(user_ids)}
+    assigned = dict(ShardAssignment.objects.using(DEFAULT_DB_ALIAS).filter(user_id__in=user_ids)
+                    .values_list('user_id', 'alias'))
+    groups = defaultdict(list)
+    for user_id in user_ids:
+        groups[assigned.get(user_id, DEFAULT_DB_ALIAS)].append(user_id)
+    return dict(groups)
+
+
+class ShardRouter:
+    """
+    Данные пользователей читаются и пишутся в шард, выбранный для запроса (ShardMixin) или фоновой операции
+    (use_shard). Справочные таблицы пишутся в основную БД, читаются из шарда. Без выбранного шарда и при
+    выключенном шардировании решают следующие маршрутизаторы
+    """
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower in SHARDED_MODELS or model._meta.label_lower in REFERENCE_MODELS \
+                or _all_models.get():
+            return _current.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        if _all_models.get():
+            return _current.get()
+        if model._meta.label_lower in REFERENCE_MODELS and is_enabled():
+            return DEFAULT_DB_ALIAS
+        if model._meta.label_lower in SHARDED_MODELS:
+            return _current.get()
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class UserMoving(exceptions.APIException):
+    status_code = 503
+    default_detail = 'Данные пользователя переносятся в другой шард, повторите запрос позже'
+    default_code = 'user_moving'
+
+
+class ShardMixin:
+    """
+    Запрос работает с шардом пользователя. Пока идет перенос пользователя, изменения отклоняются с 503
+    """
+    def dispatch(self, request, *args, **kwargs):
+        token, owner_token = _current.set(None), _owner.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _current.reset(token)
+            _owner.reset(owner_token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not is_enabled() or not request.user.is_authenticated:
+            return
+        alias, moving = locate(request.user.id)
+        if moving and request.method not in permissions.SAFE_METHODS:
+            raise UserMoving()
+        _current.set(alias)
+        _owner.set(request.user.id)
+
+
+def mirror(objects, aliases=None):
+    """
+    Копирует строки справочной таблицы из основной БД в шарды aliases (по умолчанию во все):
+    недостающие вставляются, имеющиеся обновляются. Строку могла вставить параллельная копия, конфликт
+    вставки игнорируется. Каждый шард пишется в своей транзакции: вызов в транзакции шарда (atomic) ждал бы
+    блокировок других шардов, держа блокировку своего
+    """
+    objects = list(objects)
+    if not objects or not is_enabled():
+        return
+    model = type(objects[0])
+    fields = [field.attname for field in model._meta.concrete_fields if not field.primary_key]
+    for alias in shard_aliases() if aliases is None else aliases:
+        if alias == DEFAULT_DB_ALIAS:
+            continue
+        manager = model._base_manager.db_manager(alias)
+        with transaction.atomic(using=alias):
+            existing = set(manager.filter(pk__in=[obj.pk for obj in objects]).values_list('pk', flat=True))
+            manager.bulk_create([obj for obj in objects if obj.pk not in existing], ignore_conflicts=True)
+            for obj in objects:
+                if obj.pk in existing:
+                    manager.filter(pk=obj.pk).update(**{field: getattr(obj, field) for field in fields})
+
+
+def sync_references(alias, batch_size=1000):
+    """
+    Копирует в шард все категории и пользователей, размещенных в нем: после migrate_shards справочные таблицы
+    нового шарда заполнены, а расхождения в существующих исправлены
+    """
+    users = User.objects.using(DEFAULT_DB_ALIAS).filter(shardassignment__alias=alias).order_by('id')
+    categories = Category.objects.using(DEFAULT_DB_ALIAS).order_by('id')
+    copied = 0
+    for queryset in (users, categories):
+        last_id = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            mirror(batch, [alias])
+            copied += len(batch)
+            last_id = batch[-1].id
+    return copied
+
+
+def assign_users(user_ids):
+    """
+    Размещает новых пользователей по шардам и копирует их строки auth_user в свои шарды
+    """
+    if not is_enabled():
+        return
+    assignments = [ShardAssignment(user_id=user_id, alias=placement(user_id)) for user_id in user_ids]
+    ShardAssignment.objects.using(DEFAULT_DB_ALIAS).bulk_create(assignments, ignore_conflicts=True)
+    for alias, ids in group_by_shard(user_ids).items():
+        mirror(User.objects.using(DEFAULT_DB_ALIAS).filter(id__in=ids), [alias])
+
+
+def id_range(alias):
+    """
+    [начало, конец) id задач, которые выдает БД: шард N - [(N + 1) * ID_RANGE, (N + 2) * ID_RANGE),
+    основная БД - [0, ID_RANGE)
+    """
+    if alias not in shard_aliases():
+        return 0, ID_RANGE
+    start = (shard_aliases().index(alias) + 1) * ID_RANGE
+    return start, start + ID_RANGE
+
+
+def install_id_range(using):
+    """
+    Начальное значение AUTOINCREMENT задач шарда - начало его диапазона id_range
+    """
+    if using not in shard_aliases() or connections[using].vendor != 'sqlite':
+        return
+    start = id_range(using)[0]
+    table = Task._meta.db_table
+    with connections[using].cursor() as cursor:
+        cursor.execute('INSERT INTO sqlite_sequence(name, seq) SELECT %s, 0 '
+                       'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)', [table, table])
+        cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s', [start, table, start])
+
+
+@contextmanager
+def keep_id_range(alias):
+    """
+    Задачи с явными id (перенос пользователя, возврат из архива) вставляются с id из диапазона другого шарда,
+    и SQLite поднимает AUTOINCREMENT до наибольшего из них: allocate_ids выдавал бы id чужого диапазона.
+    После блока AUTOINCREMENT возвращается в свой диапазон. Вызывается в транзакции записи БД alias
+    """
+    if connections[alias].vendor != 'sqlite':
+        yield
+        return
+    table = Task._meta.db_table
+    start, end = id_range(alias)
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+        row = cursor.fetchone()
+    last = row[0] if row and start <= row[0] < end else start
+    yield
+    with connections[alias].cursor() as cursor:
+        cursor.execute(f'UPDATE sqlite_sequence SET seq = MAX(%s, COALESCE((SELECT MAX(id) FROM {table} '
+                       f'WHERE id >= %s AND id < %s), 0)) WHERE name = %s', [last, start, end, table])
+
+
+def _reserve(alias, table, count=0, at_least=0):
+    """
+    Резервирует count значений AUTOINCREMENT таблицы, не меньше at_least, возвращает последнее выданное до них.
+    UPDATE первым берет блокировку записи: параллельные резервы не получают одни и те же значения
+    """
+    with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+        cursor.execute('UPDATE sqlite_sequence SET seq = MAX(seq, %s) + %s WHERE name = %s', [at_least, count, table])
+        if not cursor.rowcount:
+            cursor.execute('INSERT INTO sqlite_sequence(name, seq) VALUES (%s, %s)', [table, at_least + count])
+        cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+        return cursor.fetchone()[0] - count
+
+
+def allocate_ids(alias, tasks):
+    """
+    id новых задач при шардировании: резервируются в AUTOINCREMENT БД alias и задаются явно. Сам SQLite выдал бы id
+    больше наибольшего в таблице, а после переноса пользователя из шарда со старшим диапазоном это id чужого диапазона
+    """
+    tasks = [task for task in tasks if task.pk is None]
+    if not tasks or not is_enabled() or connections[alias].vendor != 'sqlite':
+        return
+    last = _reserve(alias, Task._meta.db_table, len(tasks), at_least=id_range(alias)[0])
+    for number, task in enumerate(tasks, 1):
+        task.pk = last + number
+
+
+def _copy(model, rows, alias, fields):
+    """
+    INSERT строк .values() в БД alias как есть, без auto_now и сигналов моделей
+    """
+    if not rows:
+        return
+    connection = connections[alias]
+    columns = [model._meta.get_field(name) for name in fields]
+    sql = f'INSERT INTO {model._meta.db_table} ({", ".join(connection.ops.quote_name(f.column) for f in columns)}) ' \
+          f'VALUES ({", ".join(["%s"] * len(columns))})'
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [[field.get_db_prep_value(row[field.attname], connection) for field in columns]
+                                 for row in rows])
+
+
+def purge(user_id, alias):
+    """
+    Удаляет данные пользователя из БД alias, в шарде - и его строку auth_user
+    """
+    with use_shard(alias), transaction.atomic(using=alias):
+        TaskReminder.objects.filter(task__owner_id=user_id).delete()
+        Task.objects.filter(owner_id=user_id)._raw_delete(alias)
+        Category.user.through.objects.filter(user_id=user_id)._raw_delete(alias)
+        # журнал последним: триггеры пишут в него удаление задач и связей
+        for model in (ArchivedTask, TaskCounter, TaskVersion, ChangeLog):
+            model.objects.filter(owner_id=user_id)._raw_delete(alias)
+        if alias != DEFAULT_DB_ALIAS:
+            User.objects.using(alias).filter(id=user_id)._raw_delete(alias)
+
+
+def move_user(user_id, target):
+    """
+    Переносит данные пользователя в шард target. На время переноса запись пользователю закрыта (ShardAssignment.moving):
+    moving ставится и данные читаются под блокировкой записи источника, поэтому записи, начатые раньше, попадают
+    в снимок, а более поздние проверяют каталог в своей транзакции (atomic) и получают 503.
+    id задач сохраняются, ссылки клиентов остаются действительными. Токены синхронизации - id журнала своей БД,
+    поэтому они сбрасываются.
+    Прерванный перенос повторяется: данные в target сначала удаляются, источник чистится после переключения каталога.
+    Возвращает число перенесенных задач
+    """
+    source, moving = locate(user_id)
+    if source == target and not moving:
+        return 0
+
+    task_fields = [field.attname for field in Task._meta.concrete_fields]
+    with use_shard(source), transaction.atomic(using=source):
+        lock(source)
+        if Job.objects.using(DEFAULT_DB_ALIAS).filter(owner_id=user_id, status__in=['queued', 'running']).exists():
+            raise ValueError(f'У пользователя {user_id} есть незаконченные фоновые операции')
+        # при source == основная БД moving коммитится вместе со снятием блокировки, иначе сразу
+        ShardAssignment.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+            user_id=user_id, defaults={'alias': source, 'moving': True})
+        tasks = list(Task.objects.filter(owner_id=user_id).order_by('id').values(*task_fields))
+        archived = list(ArchivedTask.objects.filter(owner_id=user_id).values())
+        reminders = list(TaskReminder.objects.filter(task__owner_id=user_id).values('task_id', 'deadline', 'sent'))
+        counters = list(TaskCounter.objects.filter(owner_id=user_id).values('owner_id', 'key', 'value'))
+        version = TaskVersion.objects.filter(owner_id=user_id).values('version').first()
+        memberships = list(Category.user.through.objects.filter(user_id=user_id).values('category_id', 'user_id'))
+        with connections[source].cursor() as cursor:
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [ChangeLog._meta.db_table])
+            row = cursor.fetchone()
+            source_token = row[0] if row else 0
+
+    purge(user_id, target)
+    if target != DEFAULT_DB_ALIAS:
+        mirror(User.objects.using(DEFAULT_DB_ALIAS).filter(id=user_id), [target])
+    with use_shard(target), transaction.atomic(using=target):
+        with keep_id_range(target):
+            _copy(Task, tasks, target, task_fields)
+        _copy(ArchivedTask, archived, target, [field.attname for field in ArchivedTask._meta.concrete_fields])
+        _copy(TaskReminder, reminders, target, ['task_id', 'deadline', 'sent'])
+        _copy(TaskCounter, counters, target, ['owner_id', 'key', 'value'])
+        _copy(Category.user.through, memberships, target, ['category_id', 'user_id'])
+        # токены журнала источника и target несравнимы: горизонт выше обоих, клиенты получат reset
+        horizon = _reserve(target, ChangeLog._meta.db_table, 1, at_least=source_token) + 1
+        TaskVersion.objects.create(owner_id=user_id, version=(version or {'version': 0})['version'] + 1,
+                                   modified=timezone.now(), sync_horizon=horizon)
+
+    ShardAssignment.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).update(alias=target, moving=False)
+    purge(user_id, source)
+    return len(tasks)
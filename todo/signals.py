@@ -0,0 +1,110 @@
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, router, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+
+from .categories import category_cache
+from .instrumentation import install_query_wrapper
+from .models import Category, Task
+from .shards import assign_users, is_enabled, mirror, purge, shard_aliases, shard_for
+from .versions import touch
+
+
+@receiver(m2m_changed, sender=Category.user.through)
+def invalidate_category_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Удаление связи категории с пользователем (CategorySerializer.update, UserCategoryDetail.delete и др.)
+    сбрасывает кеш имен категорий этого пользователя
+    """
+    if action not in ('pre_remove', 'pre_clear'):
+        return
+    if not reverse:
+        user_ids = pk_set if pk_set is not None else instance.user.values_list('id', flat=True)
+        for user_id in user_ids:
+            category_cache.delete(user_id, [instance.normalized])
+    else:
+        categories = Category.objects.filter(user=instance)
+        if pk_set is not None:
+            categories = categories.filter(id__in=pk_set)
+        category_cache.delete(instance.id, list(categories.values_list('normalized', flat=True)))
+
+
+@receiver(m2m_changed, sender=Category.user.through)
+def touch_category_users(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Изменение связей категорий с пользователями меняет версию их задач и категорий
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        touch(instance.id)
+    elif action == 'pre_clear':
+        for user_id in instance.user.values_list('id', flat=True):
+            touch(user_id)
+    else:
+        for user_id in pk_set:
+            touch(user_id)
+
+
+@receiver(pre_delete, sender=Category)
+def invalidate_deleted_category(sender, instance, **kwargs):
+    for user_id in instance.user.values_list('id', flat=True):
+        category_cache.delete(user_id, [instance.normalized])
+
+
+@receiver(post_save, sender=User)
+def mirror_user(sender, instance, created, using, **kwargs):
+    """
+    Новый пользователь размещается в шарде, изменения пользователя копируются в его шард
+    """
+    if not is_enabled() or using != DEFAULT_DB_ALIAS:
+        return
+    if created:
+        assign_users([instance.id])
+        return
+    alias = shard_for(instance.id)
+    if alias != DEFAULT_DB_ALIAS:
+        mirror([instance], [alias])
+
+
+@receiver(pre_delete, sender=User)
+def purge_user_shard(sender, instance, using, **kwargs):
+    """
+    Задачи и связи удаляемого пользователя в шарде удаляются отдельно: каскад Django видит только основную БД
+    """
+    if not is_enabled() or using != DEFAULT_DB_ALIAS:
+        return
+    alias = shard_for(instance.id)
+    if alias != DEFAULT_DB_ALIAS:
+        purge(instance.id, alias)
+
+
+@receiver(post_save, sender=Category)
+def mirror_category(sender, instance, created, using, **kwargs):
+    """
+    Новая категория копируется в шарды сразу: задачи могут ссылаться на нее в той же транзакции.
+    Изменение существующей копируется после коммита транзакции шарда задач, если она открыта (см. mirror)
+    """
+    if not is_enabled() or using != DEFAULT_DB_ALIAS:
+        return
+    if created:
+        mirror([instance])
+        return
+    transaction.on_commit(lambda: mirror([instance]), using=router.db_for_write(Task))
+
+
+@receiver(pre_delete, sender=Category)
+def delete_category_shards(sender, instance, using, **kwargs):
+    """
+    Категория удаляется из шардов до основной БД: задачи шардов в ней (PROTECT) отменяют удаление
+    """
+    if not is_enabled() or using != DEFAULT_DB_ALIAS:
+        return
+    for alias in shard_aliases():
+        Category.objects.using(alias).filter(pk=instance.pk).delete()
+
+
+@receiver(connection_created)
+def install_query_metrics(sender, connection, **kwargs):
+    install_query_wrapper(connection)
@@ -0,0 +1,20 @@
+from contextlib import contextmanager
+
+from .instrumentation import Metrics
+
+
+@contextmanager
+def query_budget(max_queries):
+    """
+    Проверяет, что блок выполнил не больше max_queries SQL запросов, в ошибке перечисляются запросы.
+    В отличие от django_assert_max_num_queries учитывает все запросы тестового клиента (сигнал request_started
+    очищает журнал соединения) и запросы из потоков todo.async_views.
+
+        with query_budget(3):
+            api_client.get('/task/')
+    """
+    with Metrics(keep_sql=True).collect() as metrics:
+        yield metrics
+    if metrics.queries > max_queries:
+        queries = '\n'.join(f'{number}. {sql}' for number, sql in enumerate(metrics.sql, 1))
+        raise AssertionError(f'Выполнено {metrics.queries} SQL запросов при бюджете {max_queries}:\n{queries}')
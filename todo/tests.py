@@ -1,11 +1,19 @@
+import csv
+import datetime
+import io
 import pytest
 import json
+import tracemalloc
 import factory
 from django.contrib.auth.models import User
+from django.core.cache import cache
 
 from .factories import TaskFactory, CategoryFactory
-from .models import Task, Category
+from .models import Task, Category, Job, TaskCounter
 from .serializers import TaskSerializer, TaskDeteilSerializer, CategorySerializer
+from .categories import CategoryCache, category_cache
+from .instrumentation import route_stats
+from .response_cache import response_cache
 
 
 @pytest.fixture
@@ -22,6 +30,17 @@ def create_user(db, django_user_model):
     return make_user
 
 
+@pytest.fixture(autouse=True)
+def clear_category_cache():
+    # id и версии откатываются вместе с транзакцией теста, поэтому кеши не должны переживать тест.
+    # Статистика маршрутов копится в памяти процесса до сброса раз в несколько секунд, запросы прошлых тестов
+    # не должны в нее попадать
+    yield
+    category_cache.clear()
+    route_stats.clear()
+    cache.clear()
+
+
 @pytest.fixture
 def api_client_with_credentials(db, create_user, api_client):
     user = create_user(username='testuser')
@@ -52,60 +71,1099 @@ class TestTaskList:
         response = api_client_with_credentials.get(self.endpoint)
 
         assert response.status_code == 200
-        assert len(json.loads(response.content)) == 3
+        assert len(json.loads(response.content)['results']) == 3
 
     def test_tasks_search(self, api_client_with_credentials):
         """
-        тест запроса списка задач c поиском
+        тест запроса списка задач c поиском
+        """
+        tasks = TaskFactory.create_batch(3)
+        for task in tasks:
+            task.owner = User.objects.get(username='testuser')
+            task.save()
+        search = tasks[0].title[5:]
+        response = api_client_with_credentials.get(f'{self.endpoint}?search={search}')
+
+        assert response.status_code == 200
+        assert len(json.loads(response.content)['results']) == 1
+        assert json.loads(response.content)['results'][0]['id'] == tasks[0].id
+
+    def test_tasks_search_category(self, api_client_with_credentials):
+        """
+        тест поиска по имени категории, в т.ч. после переименования категории
+        """
+        user = User.objects.get(username='testuser')
+        tasks = TaskFactory.create_batch(3, owner=user)
+        category = tasks[1].category
+        response = api_client_with_credentials.get(f'{self.endpoint}?search={category.name}')
+
+        assert [item['id'] for item in json.loads(response.content)['results']] == [tasks[1].id]
+
+        category.name = 'переименована'
+        category.save()
+        response = api_client_with_credentials.get(f'{self.endpoint}?search=именов')
+
+        assert [item['id'] for item in json.loads(response.content)['results']] == [tasks[1].id]
+
+    def test_tasks_search_ranking(self, api_client_with_credentials):
+        """
+        тест ранжирования результатов поиска: больше совпадений - выше в выдаче
+        """
+        user = User.objects.get(username='testuser')
+        weak = TaskFactory(owner=user, title='отчет', content='')
+        strong = TaskFactory(owner=user, title='отчет отчет', content='отчет за квартал')
+        response = api_client_with_credentials.get(f'{self.endpoint}?search=отчет')
+
+        assert [item['id'] for item in json.loads(response.content)['results']] == [strong.id, weak.id]
+
+    def test_rebuild_search_index(self, api_client_with_credentials):
+        """
+        тест перестроения индекса командой rebuild_search_index
+        """
+        from django.core.management import call_command
+        from django.db import connection
+        user = User.objects.get(username='testuser')
+        task = TaskFactory(owner=user)
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM todo_task_fts')
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        response = api_client_with_credentials.get(f'{self.endpoint}?search={task.title}')
+
+        assert [item['id'] for item in json.loads(response.content)['results']] == [task.id]
+
+    def test_cursor_pagination(self, api_client_with_credentials):
+        """
+        тест курсорной пагинации: обход вперед и назад по (deadline, id), в т.ч. при равных дедлайнах
+        """
+        user = User.objects.get(username='testuser')
+        deadline = TaskFactory.build().deadline
+        tasks = TaskFactory.create_batch(12, owner=user) + TaskFactory.create_batch(12, owner=user, deadline=deadline)
+        expected = [task.id for task in sorted(tasks, key=lambda task: (task.deadline, task.id))]
+        ids, url = [], self.endpoint
+        while url:
+            content = json.loads(api_client_with_credentials.get(url).content)
+            ids += [item['id'] for item in content['results']]
+            url = content['next']
+
+        assert ids == expected
+
+        content = json.loads(api_client_with_credentials.get(content['previous']).content)
+
+        assert [item['id'] for item in content['results']] == expected[10:20]
+
+    def test_page_number_pagination(self, api_client_with_credentials):
+        """
+        тест постраничного режима, оставленного для обратной совместимости
+        """
+        user = User.objects.get(username='testuser')
+        TaskFactory.create_batch(12, owner=user)
+        content = json.loads(api_client_with_credentials.get(f'{self.endpoint}?page=2').content)
+
+        assert content['count'] == 12
+        assert len(content['results']) == 2
+
+    def test_invalid_cursor(self, api_client_with_credentials):
+        """
+        тест запроса с поврежденным курсором
+        """
+        response = api_client_with_credentials.get(f'{self.endpoint}?cursor=abc')
+
+        assert response.status_code == 404
+
+    def test_create(self, api_client_with_credentials):
+        """
+        тест post запроса от авторизированног опользователя
+        """
+        task = TaskFactory.build()
+        data = {'title': task.title, 'content': task.content, 'deadline': task.deadline, 'created': task.created,
+                'category': task.category.name, 'owner': task.owner.id, 'status': task.status,
+                'priority': task.priority}
+        response = api_client_with_credentials.post(self.endpoint, data=data, format='json')
+
+        assert response.status_code == 201
+        assert Task.objects.get(title=task.title)
+
+
+class TestCategoryCache:
+    endpoint = '/task/'
+
+    def test_warm_create_single_query(self, api_client_with_credentials, django_capture_on_commit_callbacks,
+                                      django_assert_num_queries):
+        """
+        Тест создания задачи с категорией из кеша: только INSERT задачи, upsert счетчиков и UPDATE версии задач
+        пользователя. Транзакция записи внутри транзакции теста добавляет SAVEPOINT и RELEASE
+        """
+        task = TaskFactory.build()
+        data = {'title': task.title, 'content': task.content, 'deadline': task.deadline, 'category': 'кеш'}
+        with django_capture_on_commit_callbacks(execute=True):
+            api_client_with_credentials.post(self.endpoint, data=data, format='json')
+        with django_assert_num_queries(5):
+            response = api_client_with_credentials.post(self.endpoint, data=data, format='json')
+
+        assert response.status_code == 201
+        assert json.loads(response.content)['category'] == 'кеш'
+        assert Task.objects.filter(category__name='кеш').count() == 2
+
+    def test_invalidate_on_category_delete(self, api_client_with_credentials, django_capture_on_commit_callbacks):
+        """
+        Тест сброса кеша при "удалении" категории пользователем: следующая запись снова связывает категорию
+        """
+        user = User.objects.get(username='testuser')
+        task = TaskFactory.build()
+        data = {'title': task.title, 'content': task.content, 'deadline': task.deadline, 'category': 'кеш'}
+        with django_capture_on_commit_callbacks(execute=True):
+            api_client_with_credentials.post(self.endpoint, data=data, format='json')
+        category = Category.objects.get(name='кеш')
+        api_client_with_credentials.delete(f'{self.endpoint}category/{category.id}/')
+
+        assert category_cache.get(user.id, 'кеш') is None
+
+        api_client_with_credentials.post(self.endpoint, data=data, format='json')
+
+        assert user.category_set.filter(name='кеш').exists()
+
+    def test_lru_bound(self):
+        """
+        Тест вытеснения самых старых записей при переполнении
+        """
+        cache = CategoryCache(size=2)
+        cache.set(1, 'a', 1)
+        cache.set(1, 'b', 2)
+        cache.get(1, 'a')
+        cache.set(1, 'c', 3)
+
+        assert cache.get(1, 'a') == 1
+        assert cache.get(1, 'b') is None
+        assert cache.get(1, 'c') == 3
+
+
+class TestFastTaskList:
+
+    @pytest.mark.parametrize('url', ['/task/', '/task/?cursor={cursor}', '/task/?page=2', '/task/?search=Задача',
+                                     '/task/01-09-2022/31-12-2022/'])
+    def test_same_bytes(self, api_client_with_credentials, settings, url):
+        """
+        Тест быстрого списка: ответ совпадает с TaskSerializer байт в байт
+        """
+        user = User.objects.get(username='testuser')
+        TaskFactory.create_batch(15, owner=user)
+        TaskFactory(owner=user, content='')
+        cursor = json.loads(api_client_with_credentials.get('/task/').content)['next'].split('cursor=')[1]
+        url = url.format(cursor=cursor)
+        settings.TODO_FAST_TASK_LIST = False
+        expected = api_client_with_credentials.get(url).content
+        settings.TODO_FAST_TASK_LIST = True
+        response = api_client_with_credentials.get(url)
+
+        assert response.status_code == 200
+        assert response.content == expected
+
+
+class TestConditionalGet:
+
+    def test_list_etag(self, api_client_with_credentials, django_assert_num_queries):
+        """
+        Тест ETag списка задач: без изменений 304 с одним запросом версии, после записи - новый ответ
+        """
+        user = User.objects.get(username='testuser')
+        TaskFactory.create_batch(3, owner=user)
+        task = TaskFactory.build()
+        api_client_with_credentials.post('/task/', data={'title': task.title, 'deadline': task.deadline,
+                                                         'category': 'etag'}, format='json')
+        etag = api_client_with_credentials.get('/task/')['ETag']
+        with django_assert_num_queries(1):
+            response = api_client_with_credentials.get('/task/', HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == 304
+
+        api_client_with_credentials.patch(f'/task/{Task.objects.filter(owner=user).first().id}/done/')
+        response = api_client_with_credentials.get('/task/', HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+        assert api_client_with_credentials.get('/task/?page=1', HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    def test_list_last_modified(self, api_client_with_credentials):
+        """
+        Тест Last-Modified / If-Modified-Since для списка категорий
+        """
+        api_client_with_credentials.post('/task/category/', data={'name': 'lm'}, format='json')
+        last_modified = api_client_with_credentials.get('/task/category/')['Last-Modified']
+        response = api_client_with_credentials.get('/task/category/', HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        assert response.status_code == 304
+
+    def test_detail_etag(self, api_client_with_credentials):
+        """
+        Тест ETag задачи: 304 без изменений, 200 после обновления, чужая задача - 404
+        """
+        user = User.objects.get(username='testuser')
+        task = TaskFactory(owner=user)
+        endpoint = f'/task/{task.id}/'
+        etag = api_client_with_credentials.get(endpoint)['ETag']
+
+        assert api_client_with_credentials.get(endpoint, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+        api_client_with_credentials.patch(f'{endpoint}prior/low/')
+
+        assert api_client_with_credentials.get(endpoint, HTTP_IF_NONE_MATCH=etag).status_code == 200
+        assert api_client_with_credentials.get(f'/task/{TaskFactory().id}/', HTTP_IF_NONE_MATCH=etag)\
+            .status_code == 404
+
+    def test_detail_etag_after_put(self, api_client_with_credentials):
+        """
+        Тест ETag задачи после PUT: задача загружается с отложенными полями, modified все равно обновляется
+        """
+        user = User.objects.get(username='testuser')
+        task = TaskFactory(owner=user)
+        endpoint = f'/task/{task.id}/'
+        etag = api_client_with_credentials.get(endpoint)['ETag']
+        data = {'title': 'новое название', 'content': task.content, 'deadline': task.deadline, 'category': 'дом',
+                'status': task.status, 'priority': task.priority}
+
+        assert api_client_with_credentials.put(endpoint, data=data, format='json').status_code == 200
+        assert api_client_with_credentials.get(endpoint, HTTP_IF_NONE_MATCH=etag).status_code == 200
+        assert Task.objects.get(pk=task.id).modified > task.modified
+
+
+class TestTaskBulkCreate:
+    endpoint = '/task/bulk/'
+
+    def test_bulk_create(self, api_client_with_credentials):
+        """
+        Тест массового создания задач с общими и новыми категориями
+        """
+        user = User.objects.get(username='testuser')
+        existing = CategoryFactory()
+        tasks = TaskFactory.build_batch(5)
+        data = [{'title': task.title, 'content': task.content, 'deadline': task.deadline,
+                 'category': existing.name if i % 2 else 'bulk'} for i, task in enumerate(tasks)]
+        response = api_client_with_credentials.post(self.endpoint, data=data, format='json')
+
+        assert response.status_code == 201
+        assert json.loads(response.content)['created'] == 5
+        assert Task.objects.filter(owner=user).count() == 5
+        assert set(user.category_set.values_list('name', flat=True)) == {existing.name, 'bulk'}
+        assert Category.objects.filter(name='bulk').count() == 1
+
+    def test_bulk_create_errors(self, api_client_with_credentials):
+        """
+        Тест массового создания с ошибкой в одном элементе, ничего не создается
+        """
+        task = TaskFactory.build()
+        data = [{'title': task.title, 'deadline': task.deadline, 'category': 'bulk'},
+                {'title': task.title, 'category': 'bulk'}]
+        response = api_client_with_credentials.post(self.endpoint, data=data, format='json')
+        errors = json.loads(response.content)['errors']
+
+        assert response.status_code == 400
+        assert errors[0] == {}
+        assert 'deadline' in errors[1]
+        assert not Task.objects.exists()
+
+
+class TestTaskBulkUpdate:
+    endpoint = '/task/bulk/'
+
+    def test_bulk_done(self, api_client_with_credentials):
+        """
+        Тест массового закрытия задач по списку id, чужие задачи отклоняются
+        """
+        user = User.objects.get(username='testuser')
+        own = TaskFactory.create_batch(3, owner=user)
+        foreign = TaskFactory()
+        data = {'ids': [task.id for task in own] + [foreign.id], 'status': True}
+        response = api_client_with_credentials.patch(self.endpoint, data=data, format='json')
+        content = json.loads(response.content)
+
+        assert response.status_code == 200
+        assert content['updated'] == sorted(task.id for task in own)
+        assert content['rejected'] == [foreign.id]
+        assert Task.objects.filter(owner=user, status=True, done_time__isnull=False).count() == 3
+        assert not Task.objects.get(pk=foreign.id).status
+
+    def test_bulk_priority_by_filter(self, api_client_with_credentials):
+        """
+        Тест массового изменения приоритета по фильтру категории
+        """
+        user = User.objects.get(username='testuser')
+        tasks = TaskFactory.create_batch(3, owner=user)
+        data = {'filter': {'category': tasks[0].category.name}, 'priority': 'high'}
+        response = api_client_with_credentials.patch(self.endpoint, data=data, format='json')
+
+        assert response.status_code == 200
+        assert json.loads(response.content)['updated'] == [tasks[0].id]
+        assert Task.objects.get(pk=tasks[0].id).priority == 'high'
+        assert Task.objects.get(pk=tasks[1].id).priority == 'normal'
+
+    def test_bulk_update_matches_response(self, api_client_with_credentials):
+        """
+        Тест задачи, которая подошла под фильтр после выбора id: она не меняется и не попадает в счетчики,
+        изменены ровно задачи из ответа
+        """
+        from unittest import mock
+        from .counters import CounterDelta, rebuild, task_state
+        from .serializers import TaskBulkUpdateSerializer
+        user = User.objects.get(username='testuser')
+        task = TaskFactory(owner=user)
+        rebuild([user.id])
+        get_changes = TaskBulkUpdateSerializer.get_changes
+        late = []
+
+        def write_then_get_changes(serializer):
+            late.append(TaskFactory(owner=user, category=task.category))
+            CounterDelta().add(user.id, task_state(late[0])).apply()
+            return get_changes(serializer)
+
+        with mock.patch.object(TaskBulkUpdateSerializer, 'get_changes', write_then_get_changes):
+            response = api_client_with_credentials.patch(
+                self.endpoint, data={'filter': {'category': task.category.name}, 'status': True}, format='json')
+
+        assert json.loads(response.content)['updated'] == [task.id]
+        assert Task.objects.get(pk=task.id).status
+        assert not Task.objects.get(pk=late[0].id).status
+        assert rebuild([user.id]) == []
+
+    def test_bulk_update_invalid(self, api_client_with_credentials):
+        """
+        Тест запроса без ids и filter
+        """
+        response = api_client_with_credentials.patch(self.endpoint, data={'status': True}, format='json')
+
+        assert response.status_code == 400
+
+
+class TestDatePeriodList:
+    endpoint = '/task/01-09-2022/12-12-2022/'
+
+    def test_unauthorized_request(self, api_client):
+        """
+        тест запроса списка задач за период от неавторизированного пользователя
+        """
+        response = api_client.get(self.endpoint)
+
+        assert response.status_code == 403
+
+    def test_list_date(self, api_client_with_credentials):
+        """
+        тест запроса списка задач за период
+        """
+        tasks = TaskFactory.create_batch(3)
+        for task in tasks:
+            task.owner = User.objects.get(username='testuser')
+            task.save()
+        response = api_client_with_credentials.get(self.endpoint)
+
+        assert response.status_code == 200
+
+
+class TestTaskExport:
+    endpoint = '/task/export/'
+
+    def test_export_ndjson(self, api_client_with_credentials):
+        """
+        Тест выгрузки NDJSON: строки совпадают с представлением TaskSerializer, чужие задачи не попадают
+        """
+        user = User.objects.get(username='testuser')
+        tasks = sorted(TaskFactory.create_batch(3, owner=user), key=lambda task: (task.deadline, task.id))
+        TaskFactory()
+        response = api_client_with_credentials.get(f'{self.endpoint}ndjson/')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'application/x-ndjson'
+        assert rows == [json.loads(json.dumps(TaskSerializer(task).data)) for task in tasks]
+
+    def test_export_csv_period_search(self, api_client_with_credentials):
+        """
+        Тест выгрузки CSV с фильтром по периоду и поиском
+        """
+        user = User.objects.get(username='testuser')
+        task = TaskFactory(owner=user, title='выгрузка')
+        TaskFactory(owner=user)
+        period = f'{task.deadline:%d-%m-%Y}/{task.deadline + datetime.timedelta(days=1):%d-%m-%Y}'
+        response = api_client_with_credentials.get(f'{self.endpoint}csv/{period}/?search=выгруз')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+        assert rows[0] == ['id', 'title', 'content', 'deadline', 'category', 'status', 'priority']
+        assert [row[0] for row in rows[1:]] == [str(task.id)]
+
+    def test_export_memory_bounded(self, api_client_with_credentials, settings):
+        """
+        Тест потребления памяти: пик при выгрузке в 10 раз большего числа задач почти не растет
+        и намного меньше размера самой выгрузки. Первый вызов прогревает импорты и кеши
+        """
+        settings.TODO_EXPORT_CHUNK_SIZE = 100
+        user = User.objects.get(username='testuser')
+        category = CategoryFactory()
+
+        def peak(count):
+            Task.objects.bulk_create(TaskFactory.build_batch(count - Task.objects.count(), owner=user,
+                                                             category=category))
+            tracemalloc.start()
+            response = api_client_with_credentials.get(f'{self.endpoint}ndjson/')
+            size = sum(len(chunk) for chunk in response.streaming_content)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return size, peak
+
+        peak(500)
+        small_size, small_peak = peak(500)
+        large_size, large_peak = peak(5000)
+
+        assert large_size > 9 * small_size
+        assert large_peak < 2 * small_peak
+        assert large_peak < large_size / 4
+
+
+class TestTaskImport:
+    endpoint = '/task/import/'
+
+    def test_import_ndjson(self, api_client_with_credentials, settings):
+        """
+        Тест импорта NDJSON пачками: невалидные строки отклоняются с номером строки, остальные создаются
+        """
+        settings.TODO_BULK_BATCH_SIZE = 2
+        user = User.objects.get(username='testuser')
+        tasks = TaskFactory.build_batch(3)
+        lines = [json.dumps({'title': task.title, 'deadline': task.deadline.isoformat(), 'category': 'импорт'})
+                 for task in tasks]
+        lines.insert(1, '{"title": "без дедлайна", "category": "импорт"}')
+        lines.insert(3, 'не json')
+        upload = io.BytesIO('\n'.join(lines).encode())
+        upload.name = 'tasks.ndjson'
+        response = api_client_with_credentials.post(f'{self.endpoint}ndjson/', {'file': upload}, format='multipart')
+        content = json.loads(response.content)
+
+        assert response.status_code == 201
+        assert (content['status'], content['processed'], content['created'], content['rejected']) == \
+               ('done', 5, 3, 2)
+        assert [error['line'] for error in content['errors']] == [2, 4]
+        assert 'deadline' in content['errors'][0]['errors']
+        assert Task.objects.filter(owner=user, category__name='импорт').count() == 3
+
+        response = api_client_with_credentials.get(f'{self.endpoint}{content["id"]}/')
+
+        assert json.loads(response.content)['created'] == 3
+
+    def test_import_csv_from_export(self, api_client_with_credentials):
+        """
+        Тест импорта CSV в формате выгрузки
+        """
+        user = User.objects.get(username='testuser')
+        TaskFactory.create_batch(3, owner=user)
+        exported = b''.join(api_client_with_credentials.get('/task/export/csv/').streaming_content)
+        upload = io.BytesIO(exported)
+        upload.name = 'tasks.csv'
+        response = api_client_with_credentials.post(f'{self.endpoint}csv/', {'file': upload}, format='multipart')
+
+        assert response.status_code == 201
+        assert json.loads(response.content)['created'] == 3
+        assert Task.objects.filter(owner=user).count() == 6
+
+    def test_import_command(self, create_user, tmp_path):
+        """
+        Тест команды import_tasks с файлом отклоненных строк
+        """
+        from django.core.management import call_command
+        user = create_user(username='importer')
+        task = TaskFactory.build()
+        path = tmp_path / 'tasks.ndjson'
+        path.write_text(json.dumps({'title': task.title, 'deadline': task.deadline.isoformat(), 'category': 'cmd'})
+                        + '\n' + json.dumps({'title': task.title}) + '\n')
+        call_command('import_tasks', str(path), user='importer', rejected=str(tmp_path / 'rejected.ndjson'),
+                     stdout=io.StringIO(), stderr=io.StringIO())
+        rejected = [json.loads(line) for line in (tmp_path / 'rejected.ndjson').read_text().splitlines()]
+
+        assert Task.objects.filter(owner=user).count() == 1
+        assert [row['line'] for row in rejected] == [2]
+
+
+class TestPeriodResponseCache:
+    endpoint = '/task/01-09-2022/31-12-2022/'
+    deadline = datetime.datetime(2022, 10, 1, tzinfo=datetime.timezone.utc)
+
+    def test_cache_hit_and_invalidation(self, api_client_with_credentials, django_assert_num_queries):
+        """
+        Тест кеша ответов за период: повтор берется из кеша одним запросом версии, запись пользователя сбрасывает кеш
+        """
+        user = User.objects.get(username='testuser')
+        task = TaskFactory(owner=user, deadline=self.deadline)
+        api_client_with_credentials.patch(f'/task/{task.id}/prior/high/')
+        first = api_client_with_credentials.get(self.endpoint)
+        with django_assert_num_queries(1):
+            second = api_client_with_credentials.get(self.endpoint)
+
+        assert second.content == first.content
+        assert response_cache.stats()['hits'] == 1
+
+        api_client_with_credentials.patch(f'/task/{task.id}/prior/low/')
+        third = api_client_with_credentials.get(self.endpoint)
+
+        assert json.loads(third.content)['results'][0]['priority'] == 'low'
+        assert response_cache.stats() == {'hits': 1, 'misses': 2, 'hit_ratio': 1 / 3}
+
+    def test_cache_key_params(self, api_client_with_credentials):
+        """
+        Тест ключа кеша: разные поиск и пользователи не получают чужой ответ
+        """
+        user = User.objects.get(username='testuser')
+        TaskFactory(owner=user, title='первая', deadline=self.deadline)
+        TaskFactory(owner=user, title='вторая', deadline=self.deadline)
+        first = json.loads(api_client_with_credentials.get(f'{self.endpoint}?search=первая').content)
+        second = json.loads(api_client_with_credentials.get(f'{self.endpoint}?search=вторая').content)
+
+        assert [item['title'] for item in first['results']] == ['первая']
+        assert [item['title'] for item in second['results']] == ['вторая']
+
+    def test_stats_admin_only(self, api_client_with_credentials):
+        """
+        Тест доступа к счетчикам кеша только администраторам
+        """
+        assert api_client_with_credentials.get('/task/cache/stats/').status_code == 403
+
+
+class TestRequestMetrics:
+    def test_server_timing_and_stats(self, api_client_with_credentials):
+        """
+        Тест заголовка Server-Timing и статистики по маршрутам для администраторов
+        """
+        user = User.objects.get(username='testuser')
+        TaskFactory.create_batch(3, owner=user)
+        response = api_client_with_credentials.get('/task/')
+
+        assert 'db;dur=' in response['Server-Timing']
+        assert 'desc="2 queries"' in response['Server-Timing']
+        assert 'serializer;dur=' in response['Server-Timing']
+
+        user.is_staff = True
+        user.save()
+        api_client_with_credentials.force_authenticate(user=user)
+        api_client_with_credentials.get('/task/')
+        stats = {row['route']: row for row in json.loads(api_client_with_credentials.get('/task/metrics/').content)}
+
+        assert stats['task/']['count'] == 2
+        assert stats['task/']['queries'] == 2
+        assert sum(stats['task/']['histogram'].values()) == 2
+
+    def test_request_log(self, api_client_with_credentials, caplog):
+        """
+        Тест структурированной строки лога запроса
+        """
+        import logging
+        with caplog.at_level(logging.INFO, logger='todo.requests'):
+            api_client_with_credentials.get('/task/category/')
+        record = json.loads(caplog.records[-1].getMessage())
+
+        assert (record['route'], record['status'], record['queries']) == ('task/category/', 200, 2)
+        assert record['user'] == User.objects.get(username='testuser').id
+
+    def test_async_view_queries(self, transactional_db, create_user, settings):
+        """
+        Тест учета запросов асинхронных представлений, выполняемых в потоках пула
+        """
+        from asgiref.sync import async_to_sync
+        from django.test import AsyncClient
+        from .testing import query_budget
+        settings.ROOT_URLCONF = 'todo.async_urls'
+        client = AsyncClient()
+        client.force_login(create_user(username='async'))
+
+        async def fetch():
+            return await client.get('/task/')
+
+        with query_budget(10) as metrics:
+            response = async_to_sync(fetch)()
+
+        assert metrics.queries > 0
+        assert f'desc="{metrics.queries} queries"' in response['Server-Timing']
+
+
+class TestProfiling:
+    @pytest.fixture
+    def profiling(self, settings, tmp_path):
+        settings.TODO_PROFILING = {'ENABLED': True, 'DIRECTORY': tmp_path, 'SAMPLE_RATE': 0,
+                                   'HEADER': 'HTTP_X_TODO_PROFILE', 'TOKEN_MAX_AGE': 60}
+        return tmp_path
+
+    def test_signed_header(self, api_client_with_credentials, profiling):
+        """
+        Тест профилирования по подписанному заголовку только для пользователя из токена
+        """
+        from .profiling import make_token
+        api_client_with_credentials.get('/task/', HTTP_X_TODO_PROFILE=make_token('testuser'))
+        api_client_with_credentials.get('/task/', HTTP_X_TODO_PROFILE=make_token('other'))
+        api_client_with_credentials.get('/task/', HTTP_X_TODO_PROFILE=make_token('testuser') + 'x')
+        api_client_with_credentials.get('/task/')
+
+        assert len(list(profiling.glob('*.prof'))) == 1
+        meta = json.loads(next(profiling.glob('*.json')).read_text())
+        assert (meta['route'], meta['status'], meta['user']) == \
+               ('task/', 200, User.objects.get(username='testuser').id)
+
+    def test_disabled(self, api_client_with_credentials, profiling, settings):
+        """
+        Тест отключенного профилирования: заголовок игнорируется
+        """
+        from .profiling import make_token
+        settings.TODO_PROFILING = {**settings.TODO_PROFILING, 'ENABLED': False}
+        api_client_with_credentials.get('/task/', HTTP_X_TODO_PROFILE=make_token())
+
+        assert not list(profiling.glob('*.prof'))
+
+    def test_async_view(self, transactional_db, create_user, profiling, settings):
+        """
+        Тест профилирования асинхронного представления в потоке пула
+        """
+        from asgiref.sync import async_to_sync
+        from django.test import AsyncClient
+        from .profiling import make_token
+        settings.ROOT_URLCONF = 'todo.async_urls'
+        client = AsyncClient()
+        client.force_login(create_user(username='async'))
+
+        async def fetch():
+            # AsyncClient Django 3.2 передает extra как есть в заголовки ASGI, без префикса HTTP_
+            return await client.get('/task/', **{'x-todo-profile': make_token('async')})
+
+        assert async_to_sync(fetch)().status_code == 200
+        assert json.loads(next(profiling.glob('*.json')).read_text())['route'] == 'task/'
+
+    def test_sampling_and_summary(self, api_client_with_credentials, profiling, settings):
+        """
+        Тест выборочного профилирования и сводки команды profile_summary
+        """
+        from django.core.management import call_command
+        settings.TODO_PROFILING = {**settings.TODO_PROFILING, 'SAMPLE_RATE': 1}
+        api_client_with_credentials.get('/task/')
+        api_client_with_credentials.get('/task/category/')
+        out = io.StringIO()
+        call_command('profile_summary', route='task/', stdout=out)
+
+        assert len(list(profiling.glob('*.prof'))) == 2
+        assert 'Профилей: 1' in out.getvalue()
+        assert 'function calls' in out.getvalue()
+
+
+class TestQueryBudget:
+    """
+    Бюджеты SQL запросов эндпоинтов не зависят от числа задач: N+1 в сериализаторах ломает тест.
+    Бюджеты записи включают SAVEPOINT и RELEASE: запись выполняется внутри транзакции теста,
+    а также блокировку записи и повторное чтение задачи, от которого считаются счетчики
+    """
+    budgets = [
+        ('get', '/task/', 2),
+        ('get', '/task/?page=1', 3),
+        ('get', '/task/?search=Задача', 3),
+        ('get', '/task/01-09-2022/31-12-2023/', 2),
+        ('get', '/task/category/', 3),
+        ('get', '/task/import/', 2),
+        ('get', '/task/{pk}/', 2),
+        ('get', '/task/stats/', 4),
+        ('patch', '/task/{pk}/done/', 9),
+        ('patch', '/task/{pk}/prior/low/', 9),
+    ]
+
+    @pytest.mark.parametrize('method,path,budget', budgets)
+    @pytest.mark.parametrize('tasks', [1, 15])
+    def test_budget(self, api_client_with_credentials, method, path, budget, tasks):
+        from .testing import query_budget
+        user = User.objects.get(username='testuser')
+        created = TaskFactory.create_batch(tasks, owner=user)
+        for task in created:
+            task.category.user.add(user)
+
+        with query_budget(budget):
+            response = getattr(api_client_with_credentials, method)(path.format(pk=created[0].id))
+
+        assert response.status_code == 200
+
+    def test_budget_error(self, api_client_with_credentials):
+        """
+        Тест сообщения о превышении бюджета со списком запросов
+        """
+        from .testing import query_budget
+        with pytest.raises(AssertionError, match='Выполнено 2 SQL запросов при бюджете 1'):
+            with query_budget(1):
+                api_client_with_credentials.get('/task/')
+
+
+class TestSeedCommand:
+    def seed(self, prefix, **options):
+        from django.core.management import call_command
+        call_command('seed', users=3, tasks_per_user=4, shared_categories=2, start=datetime.datetime(2022, 9, 1),
+                     prefix=prefix, stdout=io.StringIO(), **options)
+        return [(task.owner.username[len(prefix):], task.title, task.deadline, task.priority, task.status,
+                 task.category.name[len(prefix):])
+                for task in Task.objects.filter(owner__username__startswith=prefix)
+                .select_related('owner', 'category').order_by('id')]
+
+    def test_counts(self, db):
+        """
+        Тест заполнения: задачи, общие и личные категории пользователей
+        """
+        self.seed('a', sharing=0.5, categories_per_user=2)
+
+        assert User.objects.filter(username__startswith='a').count() == 3
+        assert Task.objects.filter(owner__username__startswith='a').count() == 12
+        for user in User.objects.filter(username__startswith='a'):
+            categories = set(user.category_set.values_list('id', flat=True))
+            assert categories and set(Task.objects.filter(owner=user).values_list('category', flat=True)) <= categories
+        assert User.objects.get(username='a0').check_password('seed')
+
+    def test_deterministic(self, db):
+        """
+        Тест повторяемости: одинаковый seed дает одинаковые данные, другой seed другие
+        """
+        first = self.seed('a', seed=1)
+
+        assert self.seed('b', seed=1) == first
+        assert self.seed('c', seed=2) != first
+
+    def test_existing_prefix(self, db):
+        """
+        Тест повторного заполнения с тем же префиксом
+        """
+        from django.core.management.base import CommandError
+        self.seed('a')
+
+        with pytest.raises(CommandError):
+            self.seed('a')
+
+    def test_prefix_of_other_users(self, db):
+        """
+        Тест префикса, с которого начинаются имена чужих пользователей: их задачи не заполняются
+        """
+        other = User.objects.create_user(username='a1admin', password='admin')
+        self.seed('a1')
+
+        assert User.objects.filter(username__startswith='a1').count() == 4
+        assert not Task.objects.filter(owner=other).exists()
+
+
+@pytest.mark.urls('todo.async_urls')
+class TestAsyncViews:
+    endpoint = '/task/'
+
+    @pytest.fixture
+    def async_user_client(self, transactional_db, create_user):
+        # представления выполняются в потоках пула со своими соединениями, им нужны закоммиченные данные
+        from django.test import AsyncClient
+        client = AsyncClient()
+        user = create_user(username='testuser')
+        client.force_login(user)
+        return client, user
+
+    def test_views_are_async(self):
+        """
+        тест асинхронных маршрутов: задачи и категории асинхронные, импорт и выгрузка остаются синхронными
+        """
+        import asyncio
+        from django.urls import resolve
+
+        assert asyncio.iscoroutinefunction(resolve('/task/').func)
+        assert asyncio.iscoroutinefunction(resolve('/task/1/done/').func)
+        assert asyncio.iscoroutinefunction(resolve('/task/category/').func)
+        assert not asyncio.iscoroutinefunction(resolve('/task/import/').func)
+
+    def test_list_and_done(self, async_user_client):
+        """
+        тест списка и выполнения задачи через асинхронные представления
+        """
+        from asgiref.sync import async_to_sync
+        client, user = async_user_client
+        task = TaskFactory(owner=user)
+
+        async def scenario():
+            return await client.get(self.endpoint), await client.patch(f'{self.endpoint}{task.id}/done/')
+
+        listed, done = async_to_sync(scenario)()
+        assert listed.status_code == 200
+        assert [row['id'] for row in json.loads(listed.content)['results']] == [task.id]
+        assert done.status_code == 200
+        assert Task.objects.get(id=task.id).status
+
+    def test_concurrent_requests(self, async_user_client):
+        """
+        тест одновременных запросов: все выполняются в ограниченном пуле потоков
+        """
+        import asyncio
+        import threading
+        from asgiref.sync import async_to_sync
+        from .async_views import executor
+        from .views import TaskDetail
+        client, user = async_user_client
+        tasks = TaskFactory.create_batch(4, owner=user)
+        threads = set()
+        retrieve = TaskDetail.retrieve
+
+        def record_thread(view, request, *args, **kwargs):
+            threads.add(threading.current_thread().name)
+            return retrieve(view, request, *args, **kwargs)
+
+        async def fetch_all():
+            return await asyncio.gather(*[client.get(f'{self.endpoint}{task.id}/') for task in tasks])
+
+        TaskDetail.retrieve = record_thread
+        try:
+            responses = async_to_sync(fetch_all)()
+        finally:
+            TaskDetail.retrieve = retrieve
+
+        assert [response.status_code for response in responses] == [200] * 4
+        assert threads and all(name.startswith('todo-async') for name in threads)
+        assert len(threads) <= executor._max_workers
+
+
+class TestTaskStats:
+    endpoint = '/task/stats/'
+
+    @pytest.fixture
+    def user(self, api_client_with_credentials):
+        from .counters import rebuild
+        user = User.objects.get(username='testuser')
+        TaskFactory.create_batch(4, owner=user)
+        # задачи фабрики пишутся мимо счетчиков, rebuild заполняет их как после миграции
+        rebuild([user.id])
+        return user
+
+    def test_stats(self, api_client_with_credentials, user):
+        """
+        Тест статистики по счетчикам: итоги совпадают с подсчетом по задачам
+        """
+        response = api_client_with_credentials.get(self.endpoint)
+        content = json.loads(response.content)
+        tasks = Task.objects.filter(owner=user)
+
+        assert response.status_code == 200
+        assert content['total'] == 4
+        assert content['open'] == tasks.filter(status=False).count()
+        assert content['done'] == tasks.filter(status=True).count()
+        assert content['priority'] == {priority: tasks.filter(priority=priority).count()
+                                       for priority, _ in Task.PRIORITY_CHOICES}
+        assert sum(category['count'] for category in content['categories']) == 4
+
+    def test_overdue(self, api_client_with_credentials, user):
+        """
+        Тест просроченных задач: прошедшие дни по счетчикам и прошедший дедлайн сегодня
+        """
+        from django.utils import timezone
+        from .counters import rebuild
+        now = timezone.now()
+        Task.objects.filter(owner=user).update(status=False, deadline=now + datetime.timedelta(days=3))
+        first, second, third = Task.objects.filter(owner=user).order_by('id')[:3]
+        Task.objects.filter(pk=first.id).update(deadline=now - datetime.timedelta(days=2))
+        Task.objects.filter(pk=second.id).update(deadline=now - datetime.timedelta(seconds=1))
+        Task.objects.filter(pk=third.id).update(deadline=now - datetime.timedelta(days=1), status=True)
+        rebuild([user.id])
+        response = api_client_with_credentials.get(self.endpoint)
+
+        expected = Task.objects.filter(owner=user, status=False, deadline__lt=now).count()
+        assert json.loads(response.content)['overdue'] == expected == 2
+
+    def test_writes_keep_counters(self, api_client_with_credentials, user):
+        """
+        Тест записи через API: создание, выполнение, приоритет, копирование, массовое изменение, удаление,
+        переименование и "удаление" категории не расходятся с пересчетом по задачам
+        """
+        from django.core.management import call_command
+        from .counters import rebuild
+        task = TaskFactory.build()
+        data = {'title': task.title, 'content': task.content, 'deadline': task.deadline, 'category': 'счетчики'}
+        created = json.loads(api_client_with_credentials.post('/task/', data=data, format='json').content)
+        first, second, third = Task.objects.filter(owner=user).order_by('id')[:3]
+        api_client_with_credentials.patch(f'/task/{first.id}/done/')
+        api_client_with_credentials.patch(f'/task/{second.id}/prior/low/')
+        api_client_with_credentials.post(f'/task/{second.id}/copy/')
+        api_client_with_credentials.patch('/task/bulk/', data={'ids': [third.id], 'priority': 'high'}, format='json')
+        api_client_with_credentials.delete(f'/task/{first.id}/')
+        category = Category.objects.get(name='счетчики')
+        api_client_with_credentials.put(f'/task/category/{category.id}/', data={'name': 'счетчики 2'}, format='json')
+        call_command('run_jobs', once=True, stdout=io.StringIO())
+
+        assert rebuild([user.id]) == []
+
+        category = Category.objects.get(name='счетчики 2')
+        api_client_with_credentials.delete(f'/task/category/{category.id}/')
+        call_command('run_jobs', once=True, stdout=io.StringIO())
+
+        assert not Task.objects.filter(pk=created['id']).exists()
+        assert rebuild([user.id]) == []
+        assert json.loads(api_client_with_credentials.get(self.endpoint).content)['total'] == 4
+
+    def test_concurrent_done(self, api_client_with_credentials, user):
+        """
+        Тест гонки двух закрытий одной задачи: второй запрос выполняется между загрузкой задачи первым
+        и его записью, переход open -> done учитывается в счетчиках один раз
+        """
+        from unittest import mock
+        from .counters import rebuild
+        from .serializers import TaskFieldUpdateSerializer
+        task = TaskFactory(owner=user, status=False)
+        rebuild([user.id])
+        update = TaskFieldUpdateSerializer.update
+        second = []
+
+        def second_request_first(serializer, instance, validated_data):
+            with mock.patch.object(TaskFieldUpdateSerializer, 'update', update):
+                second.append(api_client_with_credentials.patch(f'/task/{task.id}/done/').status_code)
+            return update(serializer, instance, validated_data)
+
+        with mock.patch.object(TaskFieldUpdateSerializer, 'update', second_request_first):
+            response = api_client_with_credentials.patch(f'/task/{task.id}/done/')
+
+        assert response.status_code == 200
+        assert second == [200]
+        assert rebuild([user.id]) == []
+
+    def test_reconcile(self, user):
+        """
+        Тест сверки: расхождение исправляется, повторный запуск ничего не находит
+        """
+        from django.core.management import call_command
+        from .models import TaskCounter
+        TaskCounter.objects.filter(owner=user, key='open').update(value=100)
+        out = io.StringIO()
+        call_command('reconcile_task_stats', stdout=out)
+
+        assert 'исправлены счетчики: 1' in out.getvalue()
+        assert TaskCounter.objects.get(owner=user, key='open').value == \
+            Task.objects.filter(owner=user, status=False).count()
+
+        out = io.StringIO()
+        call_command('reconcile_task_stats', user='testuser', stdout=out)
+
+        assert 'исправлены счетчики: 0' in out.getvalue()
+
+
+class TestTaskDue:
+    endpoint = '/task/due/'
+
+    def test_due(self, api_client_with_credentials):
+        """
+        Тест списка задач с близким дедлайном: открытые задачи пользователя в пределах hours и просроченные
+        """
+        from django.utils import timezone
+        user = User.objects.get(username='testuser')
+        now = timezone.now()
+        soon = TaskFactory(owner=user, deadline=now + datetime.timedelta(hours=2))
+        overdue = TaskFactory(owner=user, deadline=now - datetime.timedelta(days=1))
+        TaskFactory(owner=user, deadline=now + datetime.timedelta(hours=1), status=True)
+        TaskFactory(owner=user, deadline=now + datetime.timedelta(days=3))
+        TaskFactory(deadline=now + datetime.timedelta(hours=1))
+        response = api_client_with_credentials.get(self.endpoint, {'hours': 12})
+
+        assert response.status_code == 200
+        assert [task['id'] for task in json.loads(response.content)['results']] == [overdue.id, soon.id]
+
+        response = api_client_with_credentials.get(self.endpoint, {'hours': 12, 'overdue': 0})
+
+        assert [task['id'] for task in json.loads(response.content)['results']] == [soon.id]
+
+    def test_invalid_hours(self, api_client_with_credentials):
+        """
+        Тест неверного горизонта
+        """
+        assert api_client_with_credentials.get(self.endpoint, {'hours': 'день'}).status_code == 400
+        assert api_client_with_credentials.get(self.endpoint, {'hours': -1}).status_code == 400
+
+
+class TestDeadlineScanner:
+    @pytest.fixture
+    def now(self):
+        from django.utils import timezone
+        return timezone.now()
+
+    def scanner(self, **kwargs):
+        from .deadlines import DeadlineScanner, MemorySink
+        return DeadlineScanner(MemorySink(), **{'lead': 3600, 'window': 600, 'batch_size': 2, **kwargs})
+
+    def test_scan(self, db, now):
+        """
+        Тест прохода: напоминания об открытых задачах в горизонте по окнам и пачкам, без закрытых и дальних
         """
-        tasks = TaskFactory.create_batch(3)
-        for task in tasks:
-            task.owner = User.objects.get(username='testuser')
-            task.save()
-        search = tasks[0].title[5:]
-        response = api_client_with_credentials.get(f'{self.endpoint}?search={search}')
-
-        assert response.status_code == 200
-        assert len(json.loads(response.content)) == 1
-        assert json.loads(response.content)[0]['id'] == tasks[0].id
+        due = [TaskFactory(deadline=now + datetime.timedelta(minutes=minutes)) for minutes in (5, 5, 20, 50)]
+        TaskFactory(deadline=now + datetime.timedelta(minutes=10), status=True)
+        TaskFactory(deadline=now + datetime.timedelta(hours=3))
+        scanner = self.scanner()
 
+        assert scanner.scan(now=now) == 4
+        assert [reminder['task'] for reminder in scanner.sink.sent] == [task.id for task in due]
+        assert scanner.sink.sent[0]['owner'] == due[0].owner_id and not scanner.sink.sent[0]['overdue']
 
-    def test_create(self, api_client_with_credentials):
+    def test_no_rescan(self, db, now, django_assert_max_num_queries):
         """
-        тест post запроса от авторизированног опользователя
+        Тест повторного прохода: отправленное не повторяется, просмотренный диапазон не читается заново
         """
-        task = TaskFactory.build()
-        data = {'title': task.title, 'content': task.content, 'deadline': task.deadline, 'created': task.created,
-                'category': task.category.name, 'owner': task.owner.id, 'status': task.status,
-                'priority': task.priority}
-        response = api_client_with_credentials.post(self.endpoint, data=data, format='json')
+        TaskFactory.create_batch(5, deadline=now + datetime.timedelta(minutes=30))
+        later = TaskFactory(deadline=now + datetime.timedelta(minutes=65))
+        Task.objects.update(modified=now - datetime.timedelta(hours=1))
+        scanner = self.scanner()
+        scanner.scan(now=now)
 
-        assert response.status_code == 201
-        assert Task.objects.get(title=task.title)
+        with django_assert_max_num_queries(6):
+            assert scanner.scan(now=now + datetime.timedelta(minutes=10)) == 1
+        assert scanner.sink.sent[-1]['task'] == later.id
 
+    def test_modified(self, db, now):
+        """
+        Тест задач, созданных и перенесенных в уже просмотренный диапазон: напоминание о новом дедлайне
+        """
+        from .models import TaskReminder
+        task = TaskFactory(deadline=now + datetime.timedelta(minutes=30))
+        scanner = self.scanner()
+        scanner.scan(now=now)
+        created = TaskFactory(deadline=now + datetime.timedelta(minutes=40))
+        Task.objects.filter(pk=task.id).update(deadline=now + datetime.timedelta(minutes=45),
+                                               modified=now + datetime.timedelta(minutes=1))
+
+        assert scanner.scan(now=now + datetime.timedelta(minutes=1)) == 2
+        assert {reminder['task'] for reminder in scanner.sink.sent[1:]} == {task.id, created.id}
+        assert TaskReminder.objects.filter(task=task).count() == 2
+
+    def test_restore(self, db, now):
+        """
+        Тест перезапуска: позиция восстанавливается по последнему напоминанию
+        """
+        TaskFactory(deadline=now + datetime.timedelta(minutes=30))
+        self.scanner().scan(now=now)
+        scanner = self.scanner()
 
-class TestDatePeriodList:
-    endpoint = '/task/01-09-2022/12-12-2022/'
+        assert scanner.scan(now=now + datetime.timedelta(minutes=1)) == 0
+        assert scanner.sink.sent == []
 
-    def test_unauthorized_request(self, api_client):
+    def test_sink_error(self, db, now):
         """
-        тест запроса списка задач за период от неавторизированного пользователя
+        Тест ошибки sink: напоминания пачки не записываются и отправляются при следующем проходе
         """
-        response = api_client.get(self.endpoint)
+        from .deadlines import DeadlineScanner, MemorySink
+        from .models import TaskReminder
 
-        assert response.status_code == 403
+        class BrokenSink(MemorySink):
+            def send(self, reminders):
+                raise ConnectionError
 
-    def test_list_date(self, api_client_with_credentials):
+        TaskFactory(deadline=now + datetime.timedelta(minutes=30))
+        with pytest.raises(ConnectionError):
+            DeadlineScanner(BrokenSink(), lead=3600).scan(now=now)
+
+        assert not TaskReminder.objects.exists()
+
+        scanner = self.scanner()
+        assert scanner.scan(now=now, since=now) == 1
+
+    def test_command(self, db, now, tmp_path, settings):
         """
-        тест запроса списка задач за период
+        Тест команды deadline_scanner --once с файловым sink из настроек
         """
-        tasks = TaskFactory.create_batch(3)
-        for task in tasks:
-            task.owner = User.objects.get(username='testuser')
-            task.save()
-        response = api_client_with_credentials.get(self.endpoint)
+        from django.core.management import call_command
+        path = tmp_path / 'reminders.ndjson'
+        settings.TODO_DEADLINES = {**settings.TODO_DEADLINES, 'SINK': 'todo.deadlines.FileSink',
+                                   'SINK_OPTIONS': {'path': str(path)}}
+        task = TaskFactory(deadline=now + datetime.timedelta(minutes=30))
+        call_command('deadline_scanner', once=True, stdout=io.StringIO())
 
-        assert response.status_code == 200
+        assert [json.loads(line)['task'] for line in path.read_text().splitlines()] == [task.id]
 
 
 class TestTaskDetail:
@@ -315,15 +1373,18 @@ class TestUserCategoryDetail:
 
     def test_update(self, api_client_with_credentials):
         """
-        Тест изменений имени категории
+        Тест изменений имени категории: категория меняется сразу, перенос задач ставится в очередь
         """
         category_old = CategoryFactory()
         category_new = CategoryFactory.build()
         data = {'name': category_new.name}
         response = api_client_with_credentials.put(f'{self.endpoint}{category_old.id}/', data=data, format='json')
+        content = json.loads(response.content)
 
-        assert response.status_code == 200
-        assert json.loads(response.content)['name'] == category_new.name
+        assert response.status_code == 202
+        assert content['name'] == category_new.name
+        assert content['job']['kind'] == 'category_rename' and content['job']['status'] == 'queued'
+        assert response['Location'] == content['job']['url']
 
     def test_delete(self, api_client_with_credentials):
         """
@@ -336,11 +1397,1149 @@ class TestUserCategoryDetail:
         category.save()
         response = api_client_with_credentials.delete(f'{self.endpoint}{category.id}/')
 
-        assert response.status_code == 204
+        assert response.status_code == 202
+        assert json.loads(response.content)['job']['kind'] == 'category_delete'
         assert category
         assert not user.category_set.filter(name=category.name).exists()
 
 
+class TestJobs:
+    endpoint = '/task/category/'
+
+    @pytest.fixture
+    def user(self, api_client_with_credentials):
+        user = User.objects.get(username='testuser')
+        self.category = CategoryFactory(name='старая')
+        self.category.user.add(user)
+        self.tasks = TaskFactory.create_batch(5, owner=user, category=self.category)
+        self.foreign = TaskFactory(category=self.category)
+        return user
+
+    def test_rename(self, api_client_with_credentials, user):
+        """
+        Тест переименования: задачи переносятся пачками, прогресс виден по ссылке из ответа
+        """
+        from .jobs import claim, run
+        response = api_client_with_credentials.put(f'{self.endpoint}{self.category.id}/', data={'name': 'новая'},
+                                                   format='json')
+        url = json.loads(response.content)['job']['url']
+
+        assert list(user.category_set.values_list('name', flat=True)) == ['новая']
+        assert Task.objects.filter(owner=user, category__name='старая').count() == 5
+
+        job = run(claim(), chunk_size=2)
+        content = json.loads(api_client_with_credentials.get(url).content)
+
+        assert job.status == content['status'] == 'done'
+        assert content['total'] == content['processed'] == 5
+        assert Task.objects.filter(owner=user, category__name='новая').count() == 5
+        assert Task.objects.get(pk=self.foreign.id).category_id == self.category.id
+
+    def test_delete(self, api_client_with_credentials, user):
+        """
+        Тест удаления: задачи, созданные после постановки операции, не удаляются
+        """
+        from .jobs import claim, run
+        api_client_with_credentials.delete(f'{self.endpoint}{self.category.id}/')
+        later = TaskFactory(owner=user, category=self.category)
+        run(claim(), chunk_size=2)
+
+        assert list(Task.objects.filter(owner=user).values_list('id', flat=True)) == [later.id]
+        assert Task.objects.filter(pk=self.foreign.id).exists()
+
+    def test_delete_keeps_task_moved_in(self, api_client_with_credentials, user):
+        """
+        Тест удаления: старая задача, которую пользователь перенес в категорию после постановки операции,
+        не удаляется
+        """
+        from .jobs import claim, run
+        older = TaskFactory(owner=user)
+        api_client_with_credentials.delete(f'{self.endpoint}{self.category.id}/')
+        data = {'title': older.title, 'content': older.content, 'deadline': older.deadline, 'category': 'старая',
+                'status': older.status, 'priority': older.priority}
+        response = api_client_with_credentials.put(f'/task/{older.id}/', data=data, format='json')
+        run(claim(), chunk_size=2)
+
+        assert response.status_code == 200
+        assert list(Task.objects.filter(owner=user).values_list('id', flat=True)) == [older.id]
+        assert Task.objects.get(pk=older.id).category_id == self.category.id
+
+    def test_delete_after_partial_rename(self, user):
+        """
+        Тест цепочки операций: удаление новой категории поставлено, когда переименование перенесло часть задач.
+        Перенесенные раньше удаляет удаление, остальные переименование удаляет сразу вместо переноса
+        """
+        import threading
+        from .jobs import claim, enqueue, run
+        new_category = CategoryFactory()
+        stop = threading.Event()
+        stop.set()
+        rename = run(enqueue(user, 'category_rename', self.category, new_category=new_category.id), chunk_size=2,
+                     stop=stop)
+
+        assert rename.status == 'queued'
+        assert Task.objects.filter(owner=user, category=new_category).count() == 2
+
+        enqueue(user, 'category_delete', new_category)
+        run(claim(), chunk_size=2)
+        run(claim(), chunk_size=2)
+
+        assert not Task.objects.filter(owner=user).exists()
+        assert list(Job.objects.filter(owner=user).values_list('status', flat=True)) == ['done', 'done']
+
+    def test_owner_order(self, api_client_with_credentials, user):
+        """
+        Тест порядка: следующая операция пользователя не берется, пока не закончена предыдущая
+        """
+        from .jobs import claim, enqueue, run
+        first = enqueue(user, 'category_rename', self.category, new_category=CategoryFactory().id)
+        enqueue(user, 'category_delete', self.category)
+        other = enqueue(self.foreign.owner, 'category_delete', self.category)
+
+        assert claim().id == first.id
+        assert claim().id == other.id
+        assert claim() is None
+
+        run(Job.objects.get(pk=first.id))
+
+        assert claim().kind == 'category_delete'
+
+    def test_expired_lease(self, user):
+        """
+        Тест операции упавшего процесса: после истечения аренды ее забирает другой процесс
+        """
+        from django.utils import timezone
+        from .jobs import claim, enqueue
+        job = enqueue(user, 'category_delete', self.category)
+        claim()
+
+        assert claim() is None
+        assert claim(now=timezone.now() + datetime.timedelta(hours=1)).id == job.id
+        assert Job.objects.get(pk=job.id).attempts == 2
+
+    def test_failure(self, user, settings, monkeypatch):
+        """
+        Тест ошибки: операция повторяется MAX_ATTEMPTS раз и помечается failed, пачки откатываются
+        """
+        from .jobs import CategoryDelete, claim, enqueue, run
+
+        def broken(handler, tasks):
+            tasks.delete()
+            raise ValueError('сбой')
+
+        monkeypatch.setattr(CategoryDelete, 'apply', broken)
+        settings.TODO_JOBS = {**settings.TODO_JOBS, 'MAX_ATTEMPTS': 2}
+        job = enqueue(user, 'category_delete', self.category)
+        for status in ('queued', 'failed'):
+            with pytest.raises(ValueError):
+                run(claim())
+            assert Job.objects.get(pk=job.id).status == status
+
+        assert Task.objects.filter(owner=user).count() == 5
+        assert 'сбой' in Job.objects.get(pk=job.id).error
+
+    def test_command(self, api_client_with_credentials, user):
+        """
+        Тест рабочего процесса run_jobs --once: очередь выполняется до конца
+        """
+        from django.core.management import call_command
+        api_client_with_credentials.put(f'{self.endpoint}{self.category.id}/', data={'name': 'новая'}, format='json')
+        category = Category.objects.get(name='новая')
+        api_client_with_credentials.delete(f'{self.endpoint}{category.id}/')
+        out = io.StringIO()
+        call_command('run_jobs', once=True, chunk_size=2, stdout=out)
+
+        assert not Task.objects.filter(owner=user).exists()
+        assert list(Job.objects.filter(owner=user).values_list('status', flat=True)) == ['done', 'done']
+        assert json.loads(api_client_with_credentials.get('/task/job/').content)['count'] == 2
+
+
+class TestCategoryInterning:
+    def test_normalized(self, db):
+        """
+        Тест нормализации: имена, отличающиеся регистром и пробелами, - одна категория
+        """
+        from .categories import intern_categories
+        categories = intern_categories(['Работа', ' работа ', 'РАБОТА  дом', 'работа дом'])
+
+        assert categories['Работа'].id == categories[' работа '].id
+        assert categories['РАБОТА  дом'].id == categories['работа дом'].id
+        assert Category.objects.count() == 2
+
+    def test_unique(self, db):
+        """
+        Тест уникального индекса по нормализованному имени
+        """
+        from django.db import IntegrityError, transaction
+        CategoryFactory(name='Дом')
+
+        with pytest.raises(IntegrityError), transaction.atomic():
+            CategoryFactory(name='дом')
+
+    def test_migration(self, transactional_db):
+        """
+        Тест миграции: дубли сливаются в самую старую категорию вместе с задачами, связями и счетчиками
+        """
+        from django.db import connection
+        from django.db.migrations.executor import MigrationExecutor
+        from .changelog import install_triggers
+        from .search import install_index
+        executor = MigrationExecutor(connection)
+        executor.migrate([('todo', '0010_job')])
+        apps = executor.loader.project_state([('todo', '0010_job')]).apps
+        OldCategory, OldTask = apps.get_model('todo', 'Category'), apps.get_model('todo', 'Task')
+        OldUser, OldCounter = apps.get_model('auth', 'User'), apps.get_model('todo', 'TaskCounter')
+        first, second = OldUser.objects.create(username='first'), OldUser.objects.create(username='second')
+        keep, duplicate, other = (OldCategory.objects.create(name=name) for name in ('Дом', ' дом', 'работа'))
+        keep.user.add(first)
+        duplicate.user.add(first, second)
+        task = OldTask.objects.create(title='t', deadline='2030-01-01T00:00:00Z', owner=second, category=duplicate)
+        OldCounter.objects.create(owner=second, key=f'category:{duplicate.id}', value=1)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        # триггеры поиска и журнала изменений ставит сигнал post_migrate команды migrate, а не MigrationExecutor
+        install_index()
+        install_triggers()
+
+        assert sorted(Category.objects.values_list('id', 'normalized')) == [(keep.id, 'дом'), (other.id, 'работа')]
+        assert Task.objects.get(pk=task.id).category_id == keep.id
+        assert sorted(Category.objects.get(pk=keep.id).user.values_list('username', flat=True)) == ['first', 'second']
+        assert dict(TaskCounter.objects.values_list('key', 'value')) == {f'category:{keep.id}': 1}
+
+    def test_rename_same_category(self, api_client_with_credentials):
+        """
+        Тест переименования в то же нормализованное имя: категория пользователя не меняется, операции нет
+        """
+        user = User.objects.get(username='testuser')
+        category = CategoryFactory(name='Дом')
+        category.user.add(user)
+        response = api_client_with_credentials.put(f'/task/category/{category.id}/', data={'name': 'дом'},
+                                                   format='json')
+
+        assert response.status_code == 200
+        assert list(user.category_set.values_list('id', flat=True)) == [category.id]
+        assert not Job.objects.exists()
+
+    def test_concurrent(self, transactional_db, create_user):
+        """
+        Тест гонки: потоки одновременно создают одну категорию для разных пользователей и получают одну запись
+        """
+        import threading
+        import time
+        from django.db import OperationalError, connection
+        from .categories import resolve_category
+        users = [create_user(username=f'user{i}') for i in range(8)]
+        barrier = threading.Barrier(len(users))
+        results, errors = {}, []
+
+        def worker(user, name):
+            try:
+                barrier.wait()
+                # общая БД в памяти тестов не ждет снятия блокировки, как busy timeout файловой БД,
+                # поэтому ожидание блокировки - повтор. Остальные ошибки (IntegrityError и т.п.) не повторяются
+                for attempt in range(100):
+                    try:
+                        results[user.id] = resolve_category(user, name).id
+                        break
+                    except OperationalError as error:
+                        if 'locked' not in str(error):
+                            raise
+                        time.sleep(0.01)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(user, f' Общая{" " * (i % 3)}'))
+                   for i, user in enumerate(users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert Category.objects.count() == 1
+        assert set(results.values()) == {Category.objects.get().id}
+        assert Category.user.through.objects.count() == len(users)
+
+
+class TestSync:
+    endpoint = '/task/sync/'
+
+    @pytest.fixture
+    def user(self, api_client_with_credentials):
+        return User.objects.get(username='testuser')
+
+    def sync(self, client, token):
+        response = client.get(self.endpoint, {} if token is None else {'since': token})
+        assert response.status_code == 200
+        return json.loads(response.content)
+
+    def test_reset_without_token(self, api_client_with_credentials, user):
+        """
+        Тест первой синхронизации: без токена клиент получает reset и текущий токен
+        """
+        TaskFactory(owner=user)
+        content = json.loads(api_client_with_credentials.get(self.endpoint).content)
+
+        assert content['reset'] is True
+        assert content['tasks'] == {'changed': [], 'deleted': []}
+        assert self.sync(api_client_with_credentials, content['token'])['tasks'] == {'changed': [], 'deleted': []}
+
+    def test_changes(self, api_client_with_credentials, user, create_user):
+        """
+        Тест изменений после токена: созданные, измененные и удаленные задачи и категории, чужие не попадают
+        """
+        updated, deleted = TaskFactory.create_batch(2, owner=user)
+        category = CategoryFactory()
+        category.user.add(user)
+        removed = CategoryFactory()
+        removed.user.add(user)
+        token = self.sync(api_client_with_credentials, None)['token']
+
+        created = TaskFactory(owner=user, category=category)
+        Task.objects.filter(pk=updated.id).update(title='изменена')
+        deleted_id = deleted.id
+        deleted.delete()
+        TaskFactory(owner=create_user(username='other'))
+        category.user.add(create_user(username='another'))
+        removed.user.remove(user)
+        content = self.sync(api_client_with_credentials, token)
+
+        assert content['reset'] is False
+        assert content['more'] is False
+        assert content['tasks'] == {'changed': sorted([created.id, updated.id]), 'deleted': [deleted_id]}
+        assert content['categories'] == {'changed': [], 'deleted': [removed.id]}
+        assert int(content['token']) > int(token)
+        assert self.sync(api_client_with_credentials, content['token'])['tasks'] == {'changed': [], 'deleted': []}
+
+    def test_last_state(self, api_client_with_credentials, user):
+        """
+        Тест нескольких изменений одного объекта: задача, созданная и удаленная после токена, только в deleted
+        """
+        token = self.sync(api_client_with_credentials, None)['token']
+        task = TaskFactory(owner=user)
+        task.title = 'изменена'
+        task.save()
+        task_id = task.id
+        task.delete()
+
+        assert self.sync(api_client_with_credentials, token)['tasks'] == {'changed': [], 'deleted': [task_id]}
+
+    def test_more(self, api_client_with_credentials, user, settings):
+        """
+        Тест порций: при PAGE_SIZE меньше числа изменений клиент дочитывает их с новыми токенами
+        """
+        settings.TODO_SYNC = {**settings.TODO_SYNC, 'PAGE_SIZE': 2}
+        token = self.sync(api_client_with_credentials, None)['token']
+        tasks = TaskFactory.create_batch(5, owner=user)
+        ids, more = [], True
+        while more:
+            content = self.sync(api_client_with_credentials, token)
+            ids += content['tasks']['changed']
+            token, more = content['token'], content['more']
+
+        assert sorted(ids) == sorted(task.id for task in tasks)
+
+    def test_invalid_token(self, api_client_with_credentials):
+        """
+        Тест неверного токена
+        """
+        for token in ('abc', '-1'):
+            assert api_client_with_credentials.get(self.endpoint, {'since': token}).status_code == 400
+
+    def test_compact(self, api_client_with_credentials, user):
+        """
+        Тест сжатия журнала: повторы удаляются без потери изменений, старые удаления поднимают горизонт,
+        и токен старше горизонта получает reset
+        """
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .models import ChangeLog
+        token = self.sync(api_client_with_credentials, None)['token']
+        kept, deleted = TaskFactory.create_batch(2, owner=user)
+        for title in ('раз', 'два'):
+            kept.title = title
+            kept.save()
+        deleted_id = deleted.id
+        deleted.delete()
+
+        call_command('compact_changelog', stdout=io.StringIO())
+
+        assert ChangeLog.objects.filter(owner=user, kind='task', object_id=kept.id).count() == 1
+        assert self.sync(api_client_with_credentials, token)['tasks'] == {'changed': [kept.id],
+                                                                          'deleted': [deleted_id]}
+
+        # SQLite пишет время записей по своим часам, поэтому запись об удалении старится явно
+        ChangeLog.objects.filter(deleted=True).update(created=timezone.now() - datetime.timedelta(days=31))
+        out = io.StringIO()
+        call_command('compact_changelog', stdout=out)
+
+        assert 'записей об удалении: 1' in out.getvalue()
+        assert not ChangeLog.objects.filter(deleted=True).exists()
+        assert self.sync(api_client_with_credentials, token)['reset'] is True
+        token = json.loads(api_client_with_credentials.get(self.endpoint).content)['token']
+        assert self.sync(api_client_with_credentials, token)['reset'] is False
+
+
+class TestArchive:
+    endpoint = '/task/archive/'
+
+    @pytest.fixture
+    def user(self, api_client_with_credentials):
+        from django.utils import timezone
+        from .counters import rebuild
+        user = User.objects.get(username='testuser')
+        self.category = CategoryFactory(name='архивная')
+        self.category.user.add(user)
+        self.old = TaskFactory.create_batch(3, owner=user, category=self.category, status=True)
+        self.recent = TaskFactory(owner=user, status=True, done_time=timezone.now())
+        self.open = TaskFactory(owner=user)
+        Task.objects.filter(pk__in=[task.id for task in self.old])\
+            .update(done_time=timezone.now() - datetime.timedelta(days=100))
+        rebuild([user.id])
+        return user
+
+    def test_archive(self, api_client_with_credentials, user):
+        """
+        Тест переноса: в архив уходят только выполненные задачи старше срока, с прежними id и датами,
+        счетчики статистики считают только оставшиеся задачи
+        """
+        from django.core.management import call_command
+        from .models import ArchivedTask
+        out = io.StringIO()
+        call_command('archive_tasks', chunk_size=2, stdout=out)
+
+        assert 'Перенесено в архив задач: 3' in out.getvalue()
+        assert sorted(Task.objects.values_list('id', flat=True)) == [self.recent.id, self.open.id]
+        archived = ArchivedTask.objects.get(pk=self.old[0].id)
+        assert (archived.title, archived.created, archived.category_id) == \
+            (self.old[0].title, self.old[0].created, self.category.id)
+        content = json.loads(api_client_with_credentials.get('/task/stats/').content)
+        assert (content['total'], content['done']) == (2, 1)
+
+    def test_owner(self, api_client_with_credentials, user, create_user):
+        """
+        Тест переноса задач одного пользователя
+        """
+        from django.utils import timezone
+        from .archive import archive_tasks
+        other = TaskFactory(owner=create_user(username='other'), status=True,
+                            done_time=timezone.now() - datetime.timedelta(days=100))
+
+        assert archive_tasks(owner_ids=[user.id]) == 3
+        assert Task.objects.filter(pk=other.id).exists()
+
+    def test_endpoints(self, api_client_with_credentials, user, create_user):
+        """
+        Тест чтения архива: список, поиск и задача, чужие задачи недоступны
+        """
+        from .archive import archive_tasks
+        archive_tasks()
+        content = json.loads(api_client_with_credentials.get(self.endpoint).content)
+
+        assert sorted(item['id'] for item in content['results']) == sorted(task.id for task in self.old)
+        assert content['results'][0]['category'] == 'архивная'
+
+        content = json.loads(api_client_with_credentials.get(self.endpoint, {'search': self.old[1].title}).content)
+
+        assert [item['id'] for item in content['results']] == [self.old[1].id]
+        assert api_client_with_credentials.get(f'{self.endpoint}{self.old[2].id}/').status_code == 200
+
+        api_client_with_credentials.force_authenticate(create_user(username='other'))
+
+        assert api_client_with_credentials.get(f'{self.endpoint}{self.old[2].id}/').status_code == 404
+        assert api_client_with_credentials.post(f'/task/{self.old[2].id}/copy/').status_code == 403
+
+    def test_restore(self, api_client_with_credentials, user):
+        """
+        Тест восстановления из архива через копирование: задача возвращается с прежним id и попадает в счетчики
+        """
+        from .archive import archive_tasks
+        from .models import ArchivedTask
+        archive_tasks()
+        task = self.old[0]
+        response = api_client_with_credentials.post(f'/task/{task.id}/copy/')
+
+        assert response.status_code == 200
+        assert json.loads(response.content)['id'] == task.id
+        assert Task.objects.get(pk=task.id).created == task.created
+        assert not ArchivedTask.objects.filter(pk=task.id).exists()
+        assert json.loads(api_client_with_credentials.get('/task/stats/').content)['done'] == 2
+
+    def test_restore_not_archived_again(self, api_client_with_credentials, user):
+        """
+        Тест повторного переноса после восстановления: возвращенная задача остается в списке задач
+        """
+        from .archive import archive_tasks
+        archive_tasks()
+        task = self.old[0]
+        api_client_with_credentials.post(f'/task/{task.id}/copy/')
+
+        assert archive_tasks() == 0
+        assert Task.objects.filter(pk=task.id, status=True).exists()
+
+    def test_category_jobs(self, api_client_with_credentials, user):
+        """
+        Тест фоновых операций над категорией: переименование и удаление затрагивают и архив
+        """
+        from django.core.management import call_command
+        from .archive import archive_tasks
+        from .models import ArchivedTask
+        archive_tasks()
+        api_client_with_credentials.put(f'/task/category/{self.category.id}/', data={'name': 'новая'}, format='json')
+        call_command('run_jobs', once=True, stdout=io.StringIO())
+        category = user.category_set.get()
+
+        assert set(ArchivedTask.objects.values_list('category_id', flat=True)) == {category.id}
+
+        api_client_with_credentials.delete(f'/task/category/{category.id}/')
+        call_command('run_jobs', once=True, stdout=io.StringIO())
+
+        assert not ArchivedTask.objects.exists()
+
+
+class TestReplicas:
+    endpoint = '/task/'
+
+    @pytest.fixture
+    def replica(self, transactional_db, tmp_path, settings):
+        from django.db import connections
+        # вторая БД SQLite в файле, обновляется командой replicate, как реплика с отставанием
+        connections.databases['replica'] = {**connections.databases['default'], 'OPTIONS': {'uri': True},
+                                            'NAME': f'file:{tmp_path / "replica.sqlite3"}?mode=ro'}
+        settings.CACHES = {**settings.CACHES, 'replica_pins': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': str(tmp_path / 'pins')}}
+        settings.TODO_REPLICAS = {'DATABASES': ['replica'], 'STICKY_SECONDS': 5, 'CACHE': 'replica_pins'}
+        yield
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+
+    def ids(self, client, path=endpoint):
+        return sorted(item['id'] for item in json.loads(client.get(path).content)['results'])
+
+    def test_reads_from_replica(self, api_client_with_credentials, replica):
+        """
+        Тест чтения с реплики: изменения основной БД не видны до обновления реплики
+        """
+        from django.core.management import call_command
+        user = User.objects.get(username='testuser')
+        # задачи фабрики пишутся мимо touch и не переключают пользователя на основную БД
+        first = TaskFactory(owner=user)
+        call_command('replicate', stdout=io.StringIO())
+        second = TaskFactory(owner=user)
+
+        assert self.ids(api_client_with_credentials) == [first.id]
+        assert api_client_with_credentials.get(f'{self.endpoint}{second.id}/').status_code == 404
+
+        call_command('replicate', stdout=io.StringIO())
+
+        assert self.ids(api_client_with_credentials) == [first.id, second.id]
+        assert api_client_with_credentials.get(f'{self.endpoint}{second.id}/').status_code == 200
+
+    def test_sticky_after_write(self, api_client_with_credentials, replica):
+        """
+        Тест записи: пользователь читает из основной БД STICKY_SECONDS после своей записи, другие - с реплики
+        """
+        from django.core.management import call_command
+        from rest_framework.test import APIClient
+        from .replicas import pin_cache
+        user = User.objects.get(username='testuser')
+        first = TaskFactory(owner=user)
+        call_command('replicate', stdout=io.StringIO())
+        response = api_client_with_credentials.post(self.endpoint, data={
+            'title': 'новая', 'content': '', 'category': 'дом', 'priority': 'high',
+            'deadline': (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)).isoformat()},
+            format='json')
+        created = json.loads(response.content)['id']
+
+        assert self.ids(api_client_with_credentials) == [first.id, created]
+
+        other = APIClient()
+        other.force_authenticate(User.objects.create(username='other'))
+        TaskFactory(owner=User.objects.get(username='other'))
+
+        assert self.ids(other) == []
+
+        # отметка в кеше истекла
+        pin_cache().clear()
+
+        assert self.ids(api_client_with_credentials) == [first.id]
+
+    def test_pin_cache_shared(self, replica, settings):
+        """
+        Тест кеша отметок: локальный для процесса кеш с репликами - ошибка настройки
+        """
+        from django.core.exceptions import ImproperlyConfigured
+        from .replicas import pin_cache
+        settings.TODO_REPLICAS = {**settings.TODO_REPLICAS, 'CACHE': 'default'}
+
+        with pytest.raises(ImproperlyConfigured):
+            pin_cache()
+
+    def test_router(self, replica):
+        """
+        Тест маршрутизатора: записи в основную БД, реплики не мигрируются
+        """
+        from .replicas import ReplicaRouter
+        router = ReplicaRouter()
+
+        assert router.db_for_read(Task) is None
+        assert router.db_for_write(Task) == 'default'
+        assert router.allow_migrate('replica', 'todo') is False
+        assert router.allow_migrate('default', 'todo') is None
+
+
+class TestMessagePack:
+    endpoint = '/task/'
+    media_type = 'application/msgpack'
+
+    def unpack(self, response):
+        import msgpack
+        assert response['Content-Type'].startswith(self.media_type)
+        return msgpack.unpackb(response.content, timestamp=3)
+
+    def test_list(self, api_client_with_credentials, settings):
+        """
+        Тест списка в MessagePack: те же поля, что и в JSON, deadline - нативная дата, быстрый список совпадает
+        с TaskSerializer
+        """
+        user = User.objects.get(username='testuser')
+        tasks = TaskFactory.create_batch(3, owner=user)
+        as_json = json.loads(api_client_with_credentials.get(self.endpoint).content)
+        data = self.unpack(api_client_with_credentials.get(self.endpoint, HTTP_ACCEPT=self.media_type))
+
+        assert [row['id'] for row in data['results']] == [row['id'] for row in as_json['results']]
+        by_id = {task.id: task for task in tasks}
+        for row, json_row in zip(data['results'], as_json['results']):
+            assert row['deadline'] == by_id[row['id']].deadline
+            assert {**row, 'deadline': None} == {**json_row, 'deadline': None}
+
+        settings.TODO_FAST_TASK_LIST = True
+        assert self.unpack(api_client_with_credentials.get(f'{self.endpoint}?format=msgpack')) == data
+
+    def test_columnar(self, api_client_with_credentials):
+        """
+        Тест колоночного режима: имена полей один раз на страницу, задачи - списками значений
+        """
+        user = User.objects.get(username='testuser')
+        TaskFactory.create_batch(2, owner=user)
+        rows = self.unpack(api_client_with_credentials.get(self.endpoint, HTTP_ACCEPT=self.media_type))['results']
+        data = self.unpack(api_client_with_credentials.get(self.endpoint,
+                                                           HTTP_ACCEPT=f'{self.media_type}; columnar=1'))
+
+        assert data['results']['columns'] == ['id', 'title', 'content', 'deadline', 'category', 'status', 'priority']
+        assert [dict(zip(data['results']['columns'], row)) for row in data['results']['rows']] == rows
+
+    def test_create(self, api_client_with_credentials):
+        """
+        Тест тела запроса в MessagePack: дата-Timestamp принимается сериализатором, неверное тело - 400
+        """
+        import msgpack
+        deadline = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0) + datetime.timedelta(days=1)
+        body = msgpack.packb({'title': 'задача', 'content': '', 'category': 'дом', 'priority': 'high',
+                              'deadline': deadline}, datetime=True)
+        response = api_client_with_credentials.post(self.endpoint, data=body, content_type=self.media_type,
+                                                    HTTP_ACCEPT=self.media_type)
+
+        assert response.status_code == 201
+        assert self.unpack(response)['deadline'] == deadline
+        assert Task.objects.get(title='задача').deadline == deadline
+        assert api_client_with_credentials.post(self.endpoint, data=b'\xc1', content_type=self.media_type)\
+            .status_code == 400
+
+
+class TestGroupCommit:
+    endpoint = '/task/'
+
+    @pytest.fixture
+    def write_queue(self, transactional_db, settings, monkeypatch):
+        # запросы и поток записи работают со своими соединениями, им нужны закоммиченные данные
+        from . import group_commit
+        settings.TODO_GROUP_COMMIT = {'ENABLED': True}
+        write_queue = group_commit.WriteQueue(window=0.2, max_batch=100)
+        monkeypatch.setattr(group_commit, 'write_queue', write_queue)
+        yield write_queue
+        write_queue.close()
+
+    def post_task(self, user, title):
+        from django.db import connections
+        from rest_framework.test import APIClient
+        client = APIClient()
+        client.force_authenticate(user)
+        try:
+            return client.post(self.endpoint, data={
+                'title': title, 'content': '', 'category': 'дом', 'priority': 'high',
+                'deadline': (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)).isoformat()},
+                format='json')
+        finally:
+            connections.close_all()
+
+    def test_concurrent_writes_share_commit(self, write_queue, create_user):
+        """
+        Тест группового коммита: одновременные создания задач записываются одной пачкой, каждый запрос
+        получает свою задачу
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        user = create_user(username='testuser')
+        with ThreadPoolExecutor(8) as pool:
+            responses = list(pool.map(lambda number: self.post_task(user, f'задача {number}'), range(8)))
+
+        assert [response.status_code for response in responses] == [201] * 8
+        assert sorted(json.loads(response.content)['title'] for response in responses) \
+            == sorted(f'задача {number}' for number in range(8))
+        assert Task.objects.filter(owner=user).count() == 8
+        assert write_queue.stats()['writes'] == 8
+        assert write_queue.stats()['batches'] < 8
+        assert TaskCounter.objects.get(owner=user, key='open').value == 8
+
+    def test_failed_write_rolls_back_alone(self, write_queue, create_user):
+        """
+        Тест ошибки: запись с исключением откатывается до своей точки сохранения, остальные записи пачки
+        коммитятся, исключение получает только ее отправитель
+        """
+        import threading
+        user = create_user(username='testuser')
+        release = threading.Event()
+
+        def create(title, fail=False):
+            task = TaskFactory(owner=user, title=title)
+            if fail:
+                raise ValueError(title)
+            return task.id
+
+        # поток записи занят, следующие записи копятся в очереди и попадают в одну пачку
+        blocker = write_queue.submit(release.wait, 5)
+        good = write_queue.submit(create, 'первая')
+        bad = write_queue.submit(create, 'вторая', fail=True)
+        release.set()
+
+        assert blocker.result(5) is True
+        assert Task.objects.get(id=good.result(5)).title == 'первая'
+        with pytest.raises(ValueError):
+            bad.result(5)
+        assert not Task.objects.filter(title='вторая').exists()
+        assert write_queue.stats()['writes'] == 3
+        assert write_queue.stats()['batches'] <= 2
+
+    def test_timeout_cancels_write(self, write_queue, create_user):
+        """
+        Тест таймаута: запрос, запись которого не началась за TIMEOUT, получает 503, запись снимается с очереди
+        и не выполняется, поток записи продолжает работу
+        """
+        import threading
+        user = create_user(username='testuser')
+        release = threading.Event()
+        write_queue.timeout = 0.2
+        blocker = write_queue.submit(release.wait, 5)
+
+        response = self.post_task(user, 'не дождалась')
+        release.set()
+        write_queue.timeout = 30
+
+        assert response.status_code == 503
+        assert blocker.result(5) is True
+        assert self.post_task(user, 'следующая').status_code == 201
+        assert list(Task.objects.filter(owner=user).values_list('title', flat=True)) == ['следующая']
+        assert write_queue.stats()['writes'] == 2
+
+    def test_concurrent_done(self, write_queue, create_user):
+        """
+        Тест гонки закрытий одной задачи через очередь записи: оба запроса загрузили открытую задачу до записи,
+        переход open -> done учитывается в счетчиках один раз
+        """
+        import threading
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from django.db import connections
+        from rest_framework.test import APIClient
+        from .counters import rebuild
+        user = create_user(username='testuser')
+        task = TaskFactory(owner=user, status=False)
+        rebuild([user.id])
+        release = threading.Event()
+        blocker = write_queue.submit(release.wait, 5)
+
+        def done(_):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                return client.patch(f'/task/{task.id}/done/').status_code
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(2) as pool:
+            statuses = pool.map(done, range(2))
+            # обе записи ждут в очереди, пока поток записи занят
+            deadline = time.monotonic() + 5
+            while write_queue._queue.qsize() < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            release.set()
+            statuses = list(statuses)
+
+        assert blocker.result(5) is True
+        assert statuses == [200, 200]
+        assert rebuild([user.id]) == []
+
+    def test_disabled_writes_inline(self, api_client_with_credentials, settings):
+        """
+        Тест выключенного группового коммита: запись выполняется в потоке запроса
+        """
+        import threading
+        from .group_commit import commit
+        settings.TODO_GROUP_COMMIT = {'ENABLED': False}
+
+        assert commit(threading.current_thread) is threading.current_thread()
+
+
+@pytest.fixture(scope='session')
+def shard_template(tmp_path_factory, django_db_setup, django_db_blocker):
+    """
+    Файл SQLite со схемой шарда: миграции применяются один раз, шарды тестов - его копии
+    """
+    from django.core.management import call_command
+    from django.db import connections
+    from .shards import use_shard
+    path = tmp_path_factory.mktemp('shards') / 'template.sqlite3'
+    connections.databases['shard_template'] = {**connections.databases['default'], 'NAME': str(path)}
+    with django_db_blocker.unblock(), use_shard('shard_template', all_models=True):
+        call_command('migrate', database='shard_template', verbosity=0)
+    connections['shard_template'].close()
+    del connections['shard_template']
+    del connections.databases['shard_template']
+    return path
+
+
+class TestShards:
+    endpoint = '/task/'
+    aliases = ['shard0', 'shard1']
+
+    @pytest.fixture
+    def shards(self, transactional_db, shard_template, tmp_path, settings):
+        import shutil
+        from django.db import connections
+        from .shards import install_id_range
+        settings.TODO_SHARDS = {'DATABASES': self.aliases}
+        for alias in self.aliases:
+            shutil.copy(shard_template, tmp_path / f'{alias}.sqlite3')
+            connections.databases[alias] = {**connections.databases['default'],
+                                            'NAME': str(tmp_path / f'{alias}.sqlite3')}
+            install_id_range(alias)
+        yield
+        for alias in self.aliases:
+            connections[alias].close()
+            del connections[alias]
+            del connections.databases[alias]
+
+    def client_for(self, user):
+        from rest_framework.test import APIClient
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def users_in_shards(self):
+        """
+        По пользователю в каждом шарде
+        """
+        from .shards import shard_for
+        users = {}
+        for number in range(50):
+            user = User.objects.create(username=f'user{number}')
+            users.setdefault(shard_for(user.id), user)
+            if len(users) == len(self.aliases):
+                return users
+        raise AssertionError('пользователи не попали во все шарды')
+
+    def create_task(self, client, title='задача', category='дом'):
+        response = client.post(self.endpoint, data={
+            'title': title, 'content': '', 'category': category, 'priority': 'high',
+            'deadline': (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)).isoformat()},
+            format='json')
+        assert response.status_code == 201
+        return json.loads(response.content)['id']
+
+    def test_tasks_written_to_owner_shard(self, shards):
+        """
+        Тест размещения: задачи, связи с категориями и счетчики пользователя пишутся в его шард,
+        пользователь и категория - в основную БД и копируются в шард
+        """
+        from .models import ShardAssignment
+        from .shards import ID_RANGE, placement
+        for alias, user in self.users_in_shards().items():
+            assert ShardAssignment.objects.get(user=user).alias == alias == placement(user.id)
+            task_id = self.create_task(self.client_for(user))
+            index = self.aliases.index(alias) + 1
+
+            assert index * ID_RANGE < task_id < (index + 1) * ID_RANGE
+            assert list(Task.objects.using(alias).values_list('id', flat=True)) == [task_id]
+            assert not Task.objects.using('default').filter(owner=user).exists()
+            assert Category.objects.using(alias).get(user=user).name == 'дом'
+            assert Category.objects.using('default').filter(name='дом').exists()
+            assert TaskCounter.objects.using(alias).filter(owner_id=user.id, key='open').get().value == 1
+            assert User.objects.using(alias).filter(id=user.id).exists()
+
+    def test_users_see_only_own_shard(self, shards):
+        """
+        Тест маршрутизации запросов: список, детали и изменение задачи идут в шард пользователя запроса
+        """
+        first, second = self.users_in_shards().values()
+        first_client, second_client = self.client_for(first), self.client_for(second)
+        first_task = self.create_task(first_client, 'первая')
+        second_task = self.create_task(second_client, 'вторая')
+
+        assert [item['id'] for item in json.loads(first_client.get(self.endpoint).content)['results']] == [first_task]
+        assert [item['id'] for item in json.loads(second_client.get(self.endpoint).content)['results']] \
+            == [second_task]
+        assert first_client.get(f'{self.endpoint}{second_task}/').status_code == 404
+        assert first_client.patch(f'{self.endpoint}{first_task}/done/').status_code == 200
+        assert json.loads(first_client.get('/task/stats/').content)['done'] == 1
+
+    def test_rebalance_moves_legacy_user(self, shards):
+        """
+        Тест rebalance_shards: задачи, архив, напоминания, счетчики и категории пользователя из основной БД
+        переносятся в шард по хешу с прежними id, старый токен синхронизации дает reset. Задачи с id основной БД
+        (перенос, возврат из архива) не сдвигают диапазон id шарда
+        """
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .archive import archive_tasks
+        from .models import ArchivedTask, ShardAssignment, TaskReminder
+        from .shards import id_range, placement
+        user = User.objects.create(username='legacy')
+        # пользователь, созданный до шардирования: записи в каталоге нет, данные в основной БД
+        ShardAssignment.objects.filter(user=user).delete()
+        client = self.client_for(user)
+        task_ids = [self.create_task(client, f'задача {number}') for number in range(3)]
+        client.patch(f'{self.endpoint}{task_ids[0]}/done/')
+        archive_tasks(timezone.now() + datetime.timedelta(seconds=1), owner_ids=[user.id])
+        TaskReminder.objects.create(task_id=task_ids[1], deadline=timezone.now(), sent=timezone.now())
+        token = json.loads(client.get('/task/sync/').content)['token']
+        stats = json.loads(client.get('/task/stats/').content)
+
+        call_command('rebalance_shards', stdout=io.StringIO())
+
+        alias = placement(user.id)
+        assert ShardAssignment.objects.get(user=user).alias == alias
+        assert not Task.objects.using('default').filter(owner=user).exists()
+        assert not ArchivedTask.objects.using('default').filter(owner=user).exists()
+        moved = list(Task.objects.using(alias).filter(owner=user).order_by('id').values_list('id', 'title'))
+        assert moved == [(task_ids[1], 'задача 1'), (task_ids[2], 'задача 2')]
+        assert ArchivedTask.objects.using(alias).get(owner=user).id == task_ids[0]
+        assert TaskReminder.objects.using(alias).get().task_id == task_ids[1]
+        assert json.loads(client.get('/task/stats/').content) == stats
+        assert json.loads(client.get('/task/sync/', {'since': token}).content)['reset'] is True
+        assert len(json.loads(client.get(self.endpoint).content)['results']) == 2
+        assert client.get(f'{self.endpoint}{task_ids[1]}/').status_code == 200
+        assert client.post(f'{self.endpoint}{task_ids[0]}/copy/').status_code == 200
+
+        start, end = id_range(alias)
+        assert start <= self.create_task(client, 'новая') < end
+
+    def test_move_keeps_ids_in_ranges(self, shards):
+        """
+        Тест переноса в шард с младшим диапазоном: задачи и архив сохраняют id, новые задачи обоих шардов
+        получают id своих диапазонов
+        """
+        from django.utils import timezone
+        from .archive import archive_tasks
+        from .shards import id_range, move_user, use_shard
+        user = self.users_in_shards()['shard1']
+        client = self.client_for(user)
+        task_ids = [self.create_task(client, f'задача {number}') for number in range(2)]
+        client.patch(f'{self.endpoint}{task_ids[0]}/done/')
+        with use_shard('shard1'):
+            archive_tasks(timezone.now() + datetime.timedelta(seconds=1), owner_ids=[user.id])
+
+        move_user(user.id, 'shard0')
+        restored = json.loads(client.post(f'{self.endpoint}{task_ids[0]}/copy/').content)['id']
+
+        assert restored == task_ids[0]
+        assert sorted(Task.objects.using('shard0').filter(owner=user).values_list('id', flat=True)) == task_ids
+        assert client.get(f'{self.endpoint}{task_ids[1]}/').status_code == 200
+        start, end = id_range('shard0')
+        assert start <= self.create_task(client, 'новая') < end
+        other = User.objects.create(username='other')
+        move_user(other.id, 'shard1')
+        start, end = id_range('shard1')
+        assert start <= self.create_task(self.client_for(other), 'новая') < end
+
+    def test_moving_user_is_read_only(self, shards):
+        """
+        Тест переноса: пока у пользователя moving, изменения отклоняются с 503, чтения работают
+        """
+        from .models import ShardAssignment
+        user = User.objects.create(username='moving')
+        client = self.client_for(user)
+        self.create_task(client)
+        ShardAssignment.objects.filter(user=user).update(moving=True)
+
+        assert client.get(self.endpoint).status_code == 200
+        assert client.post(self.endpoint, data={}, format='json').status_code == 503
+
+    def test_write_in_flight_during_move(self, shards):
+        """
+        Тест переноса во время записи: move_user ждет коммита начатой транзакции, задача попадает в снимок
+        и не теряется при очистке источника
+        """
+        import threading
+        import time
+        from unittest import mock
+        from django.db import connections
+        from .serializers import touch
+        from .shards import move_user
+        source, user = next(iter(self.users_in_shards().items()))
+        target = next(alias for alias in self.aliases if alias != source)
+        client = self.client_for(user)
+        self.create_task(client, 'первая')
+        written, responses = threading.Event(), []
+
+        def slow_touch(user_id):
+            touch(user_id)
+            written.set()
+            # транзакция записи еще открыта, перенос начинается и должен ее дождаться
+            time.sleep(0.3)
+
+        def request():
+            try:
+                with mock.patch('todo.serializers.touch', slow_touch):
+                    responses.append(self.create_task(client, 'вторая'))
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=request)
+        thread.start()
+        assert written.wait(5)
+        move_user(user.id, target)
+        thread.join()
+
+        assert len(responses) == 1
+        assert sorted(Task.objects.using(target).filter(owner=user).values_list('title', flat=True)) \
+            == ['вторая', 'первая']
+        assert not Task.objects.using(source).filter(owner=user).exists()
+
+    def test_write_after_move_started(self, shards):
+        """
+        Тест записи, которая определила шард до начала переноса: транзакция перечитывает каталог и получает 503
+        """
+        from unittest import mock
+        from .shards import ShardMixin, move_user
+        source, user = next(iter(self.users_in_shards().items()))
+        target = next(alias for alias in self.aliases if alias != source)
+        client = self.client_for(user)
+        self.create_task(client, 'первая')
+        initial = ShardMixin.initial
+
+        def initial_then_move(view, request, *args, **kwargs):
+            initial(view, request, *args, **kwargs)
+            move_user(user.id, target)
+
+        with mock.patch.object(ShardMixin, 'initial', initial_then_move):
+            response = client.post(self.endpoint, data={
+                'title': 'вторая', 'content': '', 'category': 'дом', 'priority': 'high',
+                'deadline': (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)).isoformat()},
+                format='json')
+
+        assert response.status_code == 503
+        assert list(Task.objects.using(target).filter(owner=user).values_list('title', flat=True)) == ['первая']
+        assert not Task.objects.using(source).filter(owner=user).exists()
+
+    def test_seed_and_jobs(self, shards):
+        """
+        Тест seed и фоновых операций: задачи пользователей засеваются в их шарды, удаление категории
+        выполняется в шарде владельца
+        """
+        from django.core.management import call_command
+        from .jobs import claim, run
+        from .shards import shard_for
+        call_command('seed', users=6, tasks_per_user=4, categories_per_user=1, shared_categories=2,
+                     stdout=io.StringIO())
+        users = User.objects.filter(username__startswith='seed')
+
+        assert sum(Task.objects.using(alias).count() for alias in self.aliases) == 24
+        for user in users:
+            assert Task.objects.using(shard_for(user.id)).filter(owner=user).count() == 4
+
+        user = users.first()
+        client = self.client_for(user)
+        category = json.loads(client.get('/task/category/').content)['results'][0]['id']
+        assert client.delete(f'/task/category/{category}/').status_code == 202
+        run(claim())
+
+        assert not Task.objects.using(shard_for(user.id)).filter(owner=user).exists()
+
+    def test_mirror_outside_shard_transaction(self, shards):
+        """
+        Тест порядка блокировок: новые категории копируются в шарды, пока транзакция шарда запроса не открыта,
+        и появляются во всех шардах
+        """
+        from unittest import mock
+        from django.db import connections
+        from .shards import mirror
+        user = next(iter(self.users_in_shards().values()))
+        client = self.client_for(user)
+        calls = []
+
+        def checked_mirror(*args, **kwargs):
+            calls.append([alias for alias in self.aliases if connections[alias].in_atomic_block])
+            return mirror(*args, **kwargs)
+
+        with mock.patch('todo.categories.mirror', checked_mirror), mock.patch('todo.signals.mirror', checked_mirror):
+            task_id = self.create_task(client, category='первая')
+            response = client.post(f'{self.endpoint}bulk/', data=[{
+                'title': 'задача', 'content': '', 'category': 'вторая', 'priority': 'high',
+                'deadline': (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)).isoformat()}],
+                format='json')
+            assert response.status_code == 201
+            response = client.put(f'{self.endpoint}{task_id}/', data={
+                'title': 'задача', 'content': '', 'category': 'третья', 'priority': 'high',
+                'deadline': (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)).isoformat()},
+                format='json')
+            assert response.status_code == 200
+            category = Category.objects.get(name='первая')
+            assert client.put(f'/task/category/{category.id}/', data={'name': 'четвертая'},
+                              format='json').status_code == 202
+
+        assert calls and all(busy == [] for busy in calls)
+        for name in ('первая', 'вторая', 'третья', 'четвертая'):
+            assert all(Category.objects.using(alias).filter(name=name).exists() for alias in self.aliases)
+
+    def test_mirror_ignores_concurrent_copy(self, shards):
+        """
+        Тест параллельного копирования: строка, вставленная в шард после проверки наличия, не вызывает ошибку
+        """
+        from unittest import mock
+        from django.db.models import QuerySet
+        from .shards import mirror
+        Category.objects.bulk_create([Category(name='общая', normalized='общая')])
+        category = Category.objects.get(name='общая')
+        values_list = QuerySet.values_list
+
+        def copied_meanwhile(queryset, *args, **kwargs):
+            result = list(values_list(queryset, *args, **kwargs))
+            # параллельный mirror вставляет строку между проверкой наличия и вставкой
+            Category.objects.using(queryset.db).bulk_create([category])
+            return result
+
+        with mock.patch.object(QuerySet, 'values_list', copied_meanwhile):
+            mirror([category])
+
+        assert all(Category.objects.using(alias).filter(pk=category.pk).exists() for alias in self.aliases)
+
+    def test_migrate_shards(self, shards):
+        """
+        Тест migrate_shards: схема шардов актуальна, категории копируются в шарды
+        """
+        from django.core.management import call_command
+        Category.objects.bulk_create([Category(name='без копии', normalized='без копии')])
+        out = io.StringIO()
+
+        call_command('migrate_shards', verbosity=0, stdout=out)
+
+        assert all(Category.objects.using(alias).filter(name='без копии').exists() for alias in self.aliases)
+
+
 class TestTaskSerializer:
 
     def test_serialize_model(self):
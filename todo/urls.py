@@ -2,7 +2,8 @@ from datetime import datetime
 from django.urls import path, register_converter
 
 from .views import TaskList, TaskDatePeriodList, TaskDetail, TaskDone, TaskPriority, UserCategory, UserCategoryDetail, \
-    TaskCopy
+    TaskCopy, TaskBulk, TaskExport, TaskImportList, TaskImportDetail, ResponseCacheStats, RequestMetricsStats, \
+    TaskStats, TaskDue, TaskSync, JobList, JobDetail, ArchivedTaskList, ArchivedTaskDetail
 
 
 class DateConverter:
@@ -20,7 +21,22 @@ register_converter(DateConverter, 'date')
 
 urlpatterns = [
     path('task/', TaskList.as_view()),
+    path('task/bulk/', TaskBulk.as_view()),
     path('task/<date:sdate>/<date:edate>/', TaskDatePeriodList.as_view()),
+    path('task/cache/stats/', ResponseCacheStats.as_view()),
+    path('task/metrics/', RequestMetricsStats.as_view()),
+    path('task/stats/', TaskStats.as_view()),
+    path('task/due/', TaskDue.as_view()),
+    path('task/sync/', TaskSync.as_view()),
+    path('task/archive/', ArchivedTaskList.as_view()),
+    path('task/archive/<int:pk>/', ArchivedTaskDetail.as_view()),
+    path('task/export/<str:export_format>/', TaskExport.as_view()),
+    path('task/export/<str:export_format>/<date:sdate>/<date:edate>/', TaskExport.as_view()),
+    path('task/import/', TaskImportList.as_view()),
+    path('task/import/<int:pk>/', TaskImportDetail.as_view()),
+    path('task/job/', JobList.as_view()),
+    path('task/job/<int:pk>/', JobDetail.as_view(), name='job-detail'),
+    path('task/import/<str:import_format>/', TaskImportList.as_view()),
     path('task/<int:pk>/', TaskDetail.as_view()),
     path('task/<int:pk>/done/', TaskDone.as_view()),
     path('task/<int:pk>/prior/<str:priority>/', TaskPriority.as_view()),
@@ -0,0 +1,66 @@
+import hashlib
+
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Task, TaskVersion
+from .replicas import pin_primary
+from .shards import atomic
+
+
+def touch(user_id):
+    """
+    Увеличивает версию задач и категорий пользователя. Вызывается на всех путях записи,
+    включая bulk_create и массовые UPDATE, которые не отправляют сигналов моделей.
+    """
+    now = timezone.now()
+    pin_primary(user_id)
+    if TaskVersion.objects.filter(owner_id=user_id).update(version=F('version') + 1, modified=now):
+        return
+    try:
+        with atomic():
+            TaskVersion.objects.create(owner_id=user_id, version=1, modified=now)
+    except IntegrityError:
+        TaskVersion.objects.filter(owner_id=user_id).update(version=F('version') + 1, modified=now)
+
+
+def get_version(request):
+    """
+    Версия пользователя запроса, запоминается в запросе: ETag и Last-Modified читают ее один раз
+    """
+    if not hasattr(request, '_task_version'):
+        request._task_version = TaskVersion.objects.filter(owner=request.user).first()
+    return request._task_version
+
+
+def make_etag(request, version):
+    # в ETag входят путь с параметрами и Accept: у разных страниц, фильтров и форматов разные представления
+    key = f'{version}:{request.get_full_path()}:{request.META.get("HTTP_ACCEPT", "")}'
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def collection_etag(request, *args, **kwargs):
+    version = get_version(request)
+    return make_etag(request, version.version if version else 0)
+
+
+def collection_last_modified(request, *args, **kwargs):
+    version = get_version(request)
+    return version.modified if version else None
+
+
+def get_task_modified(request, pk):
+    if not hasattr(request, '_task_modified'):
+        request._task_modified = Task.objects.filter(pk=pk, owner=request.user)\
+            .values_list('modified', flat=True).first()
+    return request._task_modified
+
+
+def task_etag(request, pk, *args, **kwargs):
+    modified = get_task_modified(request, pk)
+    return make_etag(request, modified.isoformat()) if modified else None
+
+
+def task_last_modified(request, pk, *args, **kwargs):
+    return get_task_modified(request, pk)
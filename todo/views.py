@@ -1,39 +1,120 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.db.models import Q
-from rest_framework import generics, permissions, views, response, status, filters
-import django_filters.rest_framework
+from django.utils import timezone
+from rest_framework import generics, permissions, views, response, status, parsers, filters
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import PageNumberPagination
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from .serializers import TaskSerializer, TaskDeteilSerializer, TaskFieldUpdateSerializer, CategorySerializer, \
-    TaskCopySerializer
-from .models import Task, Category
+    TaskCopySerializer, TaskBulkUpdateSerializer, TaskImportSerializer, TaskListFastSerializer, JobSerializer, \
+    ArchivedTaskSerializer, locked_state
+from .models import Task, Category, TaskImport, Job, ArchivedTask
 from .permissions import IsOwner
-
-
-class TaskList(generics.ListCreateAPIView):
+from .search import FullTextSearchFilter
+from .pagination import TaskPagination
+from .export import STREAMS, export_rows
+from .importer import READERS, TaskImporter
+from .response_cache import CachedListMixin, response_cache
+from .instrumentation import route_stats
+from .counters import CounterDelta, user_stats
+from .jobs import enqueue
+from .changelog import changes_since
+from .archive import restore
+from .replicas import ReplicaReadMixin
+from .shards import ShardMixin, atomic, lock
+from .group_commit import commit
+from .versions import touch, collection_etag, collection_last_modified, task_etag, task_last_modified
+
+
+def save_and_touch(serializer, owner_id):
+    serializer.save()
+    touch(owner_id)
+
+
+class FastTaskListMixin:
+    """
+    при TODO_FAST_TASK_LIST список строится из .values() через TaskListFastSerializer в обход полей DRF,
+    ответ совпадает с TaskSerializer
+    """
+    def list(self, request, *args, **kwargs):
+        if not getattr(settings, 'TODO_FAST_TASK_LIST', False):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset()).values(*TaskListFastSerializer.values_fields())
+        native_datetime = getattr(request.accepted_renderer, 'native_datetime', False)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(TaskListFastSerializer(page, native_datetime).data)
+        return response.Response(TaskListFastSerializer(queryset, native_datetime).data)
+
+
+@method_decorator(condition(etag_func=collection_etag, last_modified_func=collection_last_modified), name='get')
+class TaskList(ShardMixin, ReplicaReadMixin, FastTaskListMixin, generics.ListCreateAPIView):
     serializer_class = TaskSerializer
-    pagination_class = PageNumberPagination
-    filter_backends = [filters.SearchFilter]
+    pagination_class = TaskPagination
+    filter_backends = [FullTextSearchFilter]
     search_fields = ['title', 'content', 'category__name']
     permission_classes = [permissions.IsAuthenticated]
 
     def perform_create(self, serializer):
-        serializer.save(owner=self.request.user)
+        commit(serializer.save, owner=self.request.user)
 
     def get_queryset(self):
         return Task.objects.select_related('category').filter(owner=self.request.user)\
             .only('id', 'title', 'content', 'deadline', 'category__name', 'status', 'priority')
 
 
-class TaskDatePeriodList(generics.ListAPIView):
+class TaskBulk(ShardMixin, views.APIView):
+    """
+    массовое создание задач из списка, ошибки валидации возвращаются по каждому элементу.
+    массовое изменение статуса/приоритета UPDATE по задачам пользователя пачками по TODO_BULK_BATCH_SIZE id
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, format=None):
+        if not isinstance(request.data, list):
+            return response.Response({'detail': 'Ожидается список задач'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = TaskSerializer(data=request.data, many=True, context={'request': request})
+        if serializer.is_valid():
+            tasks = serializer.save(owner=request.user)
+            return response.Response({'created': len(tasks)}, status=status.HTTP_201_CREATED)
+        return response.Response({'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+    def patch(self, request, format=None):
+        serializer = TaskBulkUpdateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return response.Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        queryset = serializer.get_queryset(request.user)
+        batch_size = getattr(settings, 'TODO_BULK_BATCH_SIZE', 500)
+        with atomic() as alias:
+            # блокировка записи до выбора id: счетчики и UPDATE считаются по тем задачам, что вернутся в ответе
+            lock(alias)
+            updated = list(queryset.order_by('id').values_list('id', flat=True))
+            changes = serializer.get_changes()
+            delta = CounterDelta()
+            for offset in range(0, len(updated), batch_size):
+                batch = Task.objects.filter(pk__in=updated[offset:offset + batch_size])
+                delta.add_queryset(batch, changes=changes)
+                batch.update(**changes)
+            delta.apply()
+            touch(request.user.id)
+        rejected = sorted(set(serializer.validated_data.get('ids', [])) - set(updated))
+        return response.Response({'updated': updated, 'rejected': rejected})
+
+
+@method_decorator(condition(etag_func=collection_etag, last_modified_func=collection_last_modified), name='get')
+class TaskDatePeriodList(ShardMixin, ReplicaReadMixin, CachedListMixin, FastTaskListMixin, generics.ListAPIView):
     """
     просмотр всех задач пользователя
     """
     serializer_class = TaskSerializer
-    pagination_class = PageNumberPagination
+    pagination_class = TaskPagination
     lookup_field = ['sdate', 'edate']
-    filter_backends = [filters.SearchFilter]
+    filter_backends = [FullTextSearchFilter]
     search_fields = ['title', 'content', 'category__name']
     permission_classes = [permissions.IsAuthenticated]
 
@@ -45,19 +126,184 @@ class TaskDatePeriodList(generics.ListAPIView):
             .only('id', 'title', 'content', 'deadline', 'category__name', 'status', 'priority')
 
 
-class TaskDetail(generics.RetrieveUpdateDestroyAPIView):
+class TaskDue(ShardMixin, FastTaskListMixin, generics.ListAPIView):
+    """
+    открытые задачи пользователя с дедлайном в ближайшие ?hours= часов (TODO_DEADLINES['DUE_HOURS']) и просроченные,
+    ?overdue=0 - без просроченных. Диапазон по индексу (owner, deadline, id) вместо просмотра всего списка
+    """
+    serializer_class = TaskSerializer
+    pagination_class = TaskPagination
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        hours = self.request.query_params.get('hours', getattr(settings, 'TODO_DEADLINES', {}).get('DUE_HOURS', 24))
+        try:
+            hours = float(hours)
+        except ValueError:
+            raise ValidationError({'hours': 'Ожидается число часов'})
+        if not 0 <= hours <= 24 * 366:
+            raise ValidationError({'hours': 'Ожидается число часов от 0 до 8784'})
+        now = timezone.now()
+        queryset = Task.objects.select_related('category')\
+            .filter(owner=self.request.user, status=False, deadline__lt=now + timedelta(hours=hours))
+        if self.request.query_params.get('overdue') == '0':
+            queryset = queryset.filter(deadline__gte=now)
+        return queryset.only('id', 'title', 'content', 'deadline', 'category__name', 'status', 'priority')
+
+
+class ArchivedTaskList(ShardMixin, generics.ListAPIView):
+    """
+    выполненные задачи пользователя из архива (todo.archive), ?search= - поиск по названию, описанию и категории.
+    списки и поиск задач архив не затрагивают
+    """
+    serializer_class = ArchivedTaskSerializer
+    pagination_class = TaskPagination
+    filter_backends = [filters.SearchFilter]
+    search_fields = ['title', 'content', 'category__name']
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return ArchivedTask.objects.select_related('category').filter(owner=self.request.user)
+
+
+class ArchivedTaskDetail(ShardMixin, generics.RetrieveAPIView):
+    """
+    задача из архива, восстанавливается через task/<pk>/copy/
+    """
+    serializer_class = ArchivedTaskSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return ArchivedTask.objects.select_related('category').filter(owner=self.request.user)
+
+
+class TaskSync(ShardMixin, views.APIView):
+    """
+    изменения задач и категорий пользователя с ?since=<token>: id измененных и удаленных и новый token.
+    без since или при токене старше сжатого журнала - reset, клиент загружает списки заново
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, format=None):
+        try:
+            changes = changes_since(request.user, request.query_params.get('since'))
+        except ValueError:
+            raise ValidationError({'since': 'Неверный токен синхронизации'})
+        return response.Response(changes)
+
+
+class ResponseCacheStats(views.APIView):
+    """
+    счетчики попаданий и промахов кеша ответов для подбора его размера
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, format=None):
+        return response.Response(response_cache.stats())
+
+
+class TaskStats(ShardMixin, views.APIView):
+    """
+    число открытых, выполненных и просроченных задач пользователя, по приоритетам и категориям.
+    читается из счетчиков TaskCounter, а не из задач
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, format=None):
+        return response.Response(user_stats(request.user))
+
+
+class RequestMetricsStats(views.APIView):
+    """
+    время ответа, SQL запросы и сериализация по маршрутам, см. todo.instrumentation
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, format=None):
+        return response.Response(route_stats.stats())
+
+
+class TaskExport(ShardMixin, views.APIView):
+    """
+    потоковая выгрузка всех задач пользователя в NDJSON или CSV с теми же фильтрами по периоду и поиску,
+    что и в TaskDatePeriodList. Память не зависит от числа задач.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    search_fields = ['title', 'content', 'category__name']
+
+    def get(self, request, export_format, sdate=None, edate=None):
+        if export_format not in STREAMS:
+            return response.Response(status=status.HTTP_404_NOT_FOUND)
+        queryset = Task.objects.filter(owner=request.user)
+        if sdate and edate:
+            queryset = queryset.filter(deadline__range=[sdate, edate])
+        queryset = FullTextSearchFilter().filter_queryset(request, queryset, self).order_by('deadline', 'id')
+        stream, content_type = STREAMS[export_format]
+        # ответ читается после выхода из представления, когда шард запроса уже сброшен: БД фиксируется сейчас
+        rows = export_rows(queryset.using(queryset.db), getattr(settings, 'TODO_EXPORT_CHUNK_SIZE', 2000))
+        export = StreamingHttpResponse(stream(rows), content_type=content_type)
+        export['Content-Disposition'] = f'attachment; filename="tasks.{export_format}"'
+        return export
+
+
+class TaskImportList(ShardMixin, generics.ListAPIView):
+    """
+    потоковый импорт задач из загруженного файла NDJSON или CSV (поле file) и список импортов пользователя.
+    счетчики импорта обновляются после каждой пачки, поэтому прогресс длинного импорта виден в списке
+    """
+    serializer_class = TaskImportSerializer
+    pagination_class = PageNumberPagination
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [parsers.MultiPartParser]
+
+    def get_queryset(self):
+        return TaskImport.objects.filter(owner=self.request.user)
+
+    def post(self, request, import_format=None):
+        upload = request.FILES.get('file')
+        if import_format not in READERS or upload is None:
+            return response.Response({'detail': 'Ожидается файл ndjson или csv в поле file'},
+                                     status=status.HTTP_400_BAD_REQUEST)
+        task_import = TaskImporter(request.user, import_format).run(upload.file)
+        return response.Response(TaskImportSerializer(task_import).data, status=status.HTTP_201_CREATED)
+
+
+class TaskImportDetail(generics.RetrieveAPIView):
+    """
+    прогресс и отклоненные строки импорта
+    """
+    serializer_class = TaskImportSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return TaskImport.objects.filter(owner=self.request.user)
+
+
+@method_decorator(condition(etag_func=task_etag, last_modified_func=task_last_modified), name='get')
+class TaskDetail(ShardMixin, ReplicaReadMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     просмотр деталей задачи, удаление, обновление.
     """
     serializer_class = TaskDeteilSerializer
     permission_classes = [IsOwner]
 
+    def perform_update(self, serializer):
+        commit(serializer.save)
+
+    def perform_destroy(self, instance):
+        with atomic() as alias:
+            CounterDelta().remove(instance.owner_id, locked_state(alias, instance)).apply()
+            instance.delete()
+            touch(instance.owner_id)
+
     def get_queryset(self):
+        # save() отложенной модели пишет только загруженные поля: без modified PUT не менял бы ETag задачи
         return Task.objects.select_related('owner', 'category').filter(owner=self.request.user)\
-            .only('id', 'title', 'owner__id', 'content', 'deadline', 'category__name', 'status', 'priority')
+            .only('id', 'title', 'owner__id', 'content', 'deadline', 'modified', 'category__name', 'status',
+                  'priority')
 
 
-class TaskDone(views.APIView):
+class TaskDone(ShardMixin, views.APIView):
     """
     закрытие задачи
     """
@@ -67,15 +313,15 @@ class TaskDone(views.APIView):
         task = get_object_or_404(Task, pk=pk)
         self.check_object_permissions(self.request, task)
         data = {'status': True, 'done_time': datetime.now()}
-        serializer = TaskFieldUpdateSerializer(task, data=data, partial=True)
+        serializer = TaskFieldUpdateSerializer(task, data=data, partial=True, context={'request': request})
 
         if serializer.is_valid():
-            serializer.save()
+            commit(save_and_touch, serializer, task.owner_id)
             return response.Response(serializer.data)
         return response.Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TaskPriority(views.APIView):
+class TaskPriority(ShardMixin, views.APIView):
     """
     изменение приоритета задачи
     """
@@ -85,22 +331,26 @@ class TaskPriority(views.APIView):
         task = get_object_or_404(Task, pk=pk)
         self.check_object_permissions(self.request, task)
         data = {'priority': priority}
-        serializer = TaskFieldUpdateSerializer(task, data=data, partial=True)
+        serializer = TaskFieldUpdateSerializer(task, data=data, partial=True, context={'request': request})
 
         if serializer.is_valid():
-            serializer.save()
+            commit(save_and_touch, serializer, task.owner_id)
             return response.Response(serializer.data)
         return response.Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TaskCopy(views.APIView):
+class TaskCopy(ShardMixin, views.APIView):
     """
-    копирование задачи
+    копирование задачи. задача из архива не копируется, а восстанавливается в списке задач с прежним id
     """
     permission_classes = [IsOwner]
 
     def post(self, request, pk, format=None):
-        task = get_object_or_404(Task, pk=pk)
+        task = Task.objects.filter(pk=pk).first()
+        if task is None:
+            archived = get_object_or_404(ArchivedTask, pk=pk)
+            self.check_object_permissions(self.request, archived)
+            return response.Response(TaskCopySerializer(commit(restore, archived), context={'request': request}).data)
         self.check_object_permissions(self.request, task)
         data = task.__dict__
         data.pop('id')
@@ -108,14 +358,15 @@ class TaskCopy(views.APIView):
         category_id = data.pop('category_id')
         data['owner'] = owner_id
         data['category'] = category_id
-        serializer = TaskCopySerializer(data=data)
+        serializer = TaskCopySerializer(data=data, context={'request': request})
         if serializer.is_valid():
-            serializer.save()
+            commit(save_and_touch, serializer, owner_id)
             return response.Response(serializer.data)
         return response.Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserCategory(generics.ListCreateAPIView):
+@method_decorator(condition(etag_func=collection_etag, last_modified_func=collection_last_modified), name='get')
+class UserCategory(ShardMixin, ReplicaReadMixin, generics.ListCreateAPIView):
     """
     Просмотр и создание пользовательских категорий задач
     """
@@ -127,26 +378,66 @@ class UserCategory(generics.ListCreateAPIView):
         return Category.objects.filter(user=self.request.user)
 
     def perform_create(self, serializer):
-        serializer.save()
-        category_name = serializer.data.get('name')
-        category = Category.objects.get(name=category_name)
-        category.user.add(self.request.user)
+        # связь с пользователем пишется в его шард, atomic() отклоняет ее во время переноса пользователя
+        with atomic():
+            serializer.save()
+            category_name = serializer.data.get('name')
+            category = Category.objects.get(name=category_name)
+            category.user.add(self.request.user)
 
 
-class UserCategoryDetail(generics.RetrieveUpdateDestroyAPIView):
+class UserCategoryDetail(ShardMixin, generics.RetrieveUpdateDestroyAPIView):
     """
-    удаление и изменение имени категории пользователя
+    удаление и изменение имени категории пользователя. Категория пользователя меняется сразу,
+    а задачи категории переносятся или удаляются фоновой операцией: ответ 202 со ссылкой на ее статус
     """
     serializer_class = CategorySerializer
     queryset = Category.objects.all()
     permission_classes = [permissions.IsAuthenticated]
 
+    def update(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.get_object(), data=request.data, partial=kwargs.pop('partial', False))
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        if serializer.job is None:
+            return response.Response(serializer.data)
+        return self.accepted(serializer.job, {**serializer.data, 'job': None})
+
     def delete(self, request, *args, **kwargs):
         # так же удалит все задачи в этой категории
         category = self.get_object()
-        Task.objects.filter(category=category, owner=self.request.user).delete()
-        category.user.remove(request.user)
-        return response.Response(status=status.HTTP_204_NO_CONTENT)
+        with atomic():
+            job = enqueue(request.user, 'category_delete', category)
+            category.user.remove(request.user)
+            touch(request.user.id)
+        return self.accepted(job, {'job': None})
+
+    def accepted(self, job, data):
+        data['job'] = JobSerializer(job, context=self.get_serializer_context()).data
+        return response.Response(data, status=status.HTTP_202_ACCEPTED, headers={'Location': data['job']['url']})
+
+
+class JobList(generics.ListAPIView):
+    """
+    фоновые операции пользователя, последние сверху
+    """
+    serializer_class = JobSerializer
+    pagination_class = PageNumberPagination
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Job.objects.filter(owner=self.request.user)
+
+
+class JobDetail(generics.RetrieveAPIView):
+    """
+    статус и прогресс фоновой операции
+    """
+    serializer_class = JobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Job.objects.filter(owner=self.request.user)
 
 
 
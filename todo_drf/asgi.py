@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'todo_drf.settings')
+# эндпоинты задач и категорий под ASGI выполняются асинхронно, см. todo.async_views
+os.environ.setdefault('TODO_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
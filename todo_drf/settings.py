@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'todo.instrumentation.RequestMetricsMiddleware',
+    'todo.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,6 +89,42 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения: файлы SQLite из TODO_REPLICA_DATABASES через os.pathsep. Локально их обновляет
+# manage.py replicate, в тестах они заменяются основной БД (MIRROR)
+for index, path in enumerate(filter(None, os.environ.get('TODO_REPLICA_DATABASES', '').split(os.pathsep))):
+    DATABASES[f'replica{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{path}?mode=ro',
+        'OPTIONS': {'uri': True},
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Шарды с задачами пользователей: файлы SQLite из TODO_SHARD_DATABASES через os.pathsep, схема
+# создается manage.py migrate_shards, пользователи переносятся между шардами manage.py rebalance_shards
+for index, path in enumerate(filter(None, os.environ.get('TODO_SHARD_DATABASES', '').split(os.pathsep))):
+    DATABASES[f'shard{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+    }
+
+DATABASE_ROUTERS = ['todo.shards.ShardRouter', 'todo.replicas.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # метки чтения из основной БД после записи (todo.replicas) должны быть видны всем процессам сервера.
+    # Реплики SQLite лежат на той же машине, поэтому достаточно файлового кеша
+    'replica_pins': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('TODO_REPLICA_PIN_CACHE', os.path.join(tempfile.gettempdir(), 'todo_replica_pins')),
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -131,13 +171,155 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 10
-}
-
-REST_FRAMEWORK = {
-    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
+    'PAGE_SIZE': 10,
+    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    # MessagePack для внутренних клиентов (todo.renderers, todo.parsers), выбирается по Accept и Content-Type
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'todo.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'todo.parsers.MessagePackParser',
+    ],
 }
 
 INTERNAL_IPS = [
     "127.0.0.1",
-]
\ No newline at end of file
+]
+
+
+# Размер пачки bulk_create при массовом создании задач
+TODO_BULK_BATCH_SIZE = 500
+
+# Кеш имен категорий пользователя для записи задач, см. todo.categories.CategoryCache
+TODO_CATEGORY_CACHE = {
+    'SIZE': 10000,
+    'TIMEOUT': 300,
+    'BACKEND': None,
+}
+
+# Размер пачки чтения из БД при потоковой выгрузке задач
+TODO_EXPORT_CHUNK_SIZE = 2000
+
+# Сколько ошибок отклоненных строк хранить в записи импорта задач
+TODO_IMPORT_MAX_ERRORS = 100
+
+# Быстрое построение списков задач из .values() в обход полей DRF (вывод совпадает с TaskSerializer)
+TODO_FAST_TASK_LIST = False
+
+# Кеш ответов списка задач за период, инвалидируется версией задач пользователя
+TODO_RESPONSE_CACHE = {
+    'BACKEND': 'default',
+    'TIMEOUT': 300,
+}
+
+# Метрики запросов todo.instrumentation: заголовок Server-Timing, строки JSON в логе todo.requests
+# и гистограммы времени ответа по маршрутам, которые раз в FLUSH_INTERVAL секунд пишутся в кеш BACKEND
+TODO_REQUEST_METRICS = {
+    'SERVER_TIMING': True,
+    'LOG': True,
+    'BACKEND': 'default',
+    'FLUSH_INTERVAL': 5,
+    'BUCKETS': [5, 10, 25, 50, 100, 250, 500, 1000, 2500],
+}
+
+# Профилирование отдельных запросов cProfile (todo.profiling): по заголовку X-Todo-Profile с токеном
+# из manage.py profile_token или случайной выборкой SAMPLE_RATE. Профили и метаданные пишутся в DIRECTORY
+TODO_PROFILING = {
+    'ENABLED': False,
+    'DIRECTORY': BASE_DIR / 'profiles',
+    'SAMPLE_RATE': 0,
+    'HEADER': 'HTTP_X_TODO_PROFILE',
+    'TOKEN_MAX_AGE': 3600,
+}
+
+# Эндпоинт task/due/ и рабочий процесс напоминаний manage.py deadline_scanner (todo.deadlines):
+# напоминание уходит в SINK за LEAD секунд до дедлайна, задачи читаются окнами по WINDOW секунд
+# и пачками по BATCH_SIZE, проходы раз в INTERVAL секунд
+TODO_DEADLINES = {
+    'DUE_HOURS': 24,
+    'LEAD': 3600,
+    'WINDOW': 3600,
+    'BATCH_SIZE': 500,
+    'INTERVAL': 60,
+    'SINK': 'todo.deadlines.LogSink',
+    'SINK_OPTIONS': {},
+}
+
+# Очередь фоновых операций в БД (todo.jobs), выполняется manage.py run_jobs: CHUNK_SIZE задач в транзакции,
+# операция занята процессом LEASE секунд после последней пачки, после MAX_ATTEMPTS ошибок помечается failed
+TODO_JOBS = {
+    'CHUNK_SIZE': 1000,
+    'LEASE': 300,
+    'MAX_ATTEMPTS': 3,
+    'INTERVAL': 1,
+}
+
+# Журнал изменений для task/sync/ (todo.changelog): PAGE_SIZE записей журнала на ответ, записи об удалении
+# хранятся RETENTION_DAYS дней и удаляются manage.py compact_changelog, старые токены после этого получают reset
+TODO_SYNC = {
+    'PAGE_SIZE': 1000,
+    'RETENTION_DAYS': 30,
+}
+
+# Архив выполненных задач (todo.archive): manage.py archive_tasks переносит задачи, завершенные больше AGE_DAYS
+# дней назад, пачками по CHUNK_SIZE в транзакции. Архив читается только через task/archive/
+TODO_ARCHIVE = {
+    'AGE_DAYS': 90,
+    'CHUNK_SIZE': 1000,
+}
+
+# Чтение с реплик (todo.replicas): безопасные запросы списков, задачи и категорий идут в DATABASES,
+# после записи пользователя его чтения STICKY_SECONDS секунд идут в основную БД (отметка в общем кеше CACHE)
+TODO_REPLICAS = {
+    'DATABASES': [alias for alias in DATABASES if alias.startswith('replica')],
+    'STICKY_SECONDS': 5,
+    # общий для процессов кеш: LocMemCache и DummyCache с репликами не допускаются (ImproperlyConfigured)
+    'CACHE': 'replica_pins',
+}
+
+# Шардирование задач по владельцу (todo.shards): новый пользователь размещается в одной из DATABASES по хешу id,
+# его задачи, связи с категориями, счетчики и журнал хранятся там. Пользователи и категории пишутся в основную БД
+# и копируются в шарды. Пустой список - все в основной БД
+TODO_SHARDS = {
+    'DATABASES': [alias for alias in DATABASES if alias.startswith('shard')],
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'requests': {'class': 'logging.StreamHandler', 'formatter': 'message'},
+        'deadlines': {'class': 'logging.StreamHandler', 'formatter': 'message'},
+    },
+    'loggers': {
+        'todo.requests': {'handlers': ['requests'], 'level': 'INFO', 'propagate': False},
+        'todo.deadlines': {'handlers': ['deadlines'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Асинхронные представления задач и категорий (todo.async_urls), включаются в todo_drf/asgi.py.
+# DebugToolbarMiddleware только синхронный: под ASGI он перевел бы все запросы в один общий поток
+TODO_ASYNC_VIEWS = os.environ.get('TODO_ASYNC_VIEWS') == '1'
+if TODO_ASYNC_VIEWS:
+    MIDDLEWARE.remove('debug_toolbar.middleware.DebugToolbarMiddleware')
+
+# Размер пула потоков асинхронных представлений, ограничивает и число соединений с БД
+TODO_ASYNC_THREADS = 8
+
+# Групповой коммит записей задач (todo.group_commit): создание, изменение, выполнение, приоритет и копирование
+# задач процесса выполняет один поток, собирая их WINDOW_MS мс (не больше MAX_BATCH) в одну транзакцию.
+# Запрос ждет свою запись не дольше TIMEOUT секунд
+TODO_GROUP_COMMIT = {
+    'ENABLED': os.environ.get('TODO_GROUP_COMMIT') == '1',
+    'WINDOW_MS': 2,
+    'MAX_BATCH': 100,
+    'TIMEOUT': 30,
+}
@@ -20,7 +20,7 @@ from django.urls import path, include
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', include('todo.urls')),
+    path('', include('todo.async_urls' if settings.TODO_ASYNC_VIEWS else 'todo.urls')),
     path('api-auth/', include('rest_framework.urls')),
 ]
 